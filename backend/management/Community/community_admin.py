@@ -0,0 +1,45 @@
+import functools
+import logging
+import os
+
+from firebase_admin import auth
+from flask import request
+
+from scripts.modules.mysql.Communities.community_cache import TTLCache
+
+# Firebase custom claim that marks an operator, set with auth.set_custom_user_claims(uid, {'admin': True})
+ADMIN_CLAIM = os.getenv('ADMIN_CLAIM', 'admin')
+# How long a user's admin flag is trusted before it is looked up again, so a revoked claim stops working soon
+ADMIN_CACHE_TTL_SECONDS = int(os.getenv('ADMIN_CACHE_TTL_SECONDS', 60))
+ADMIN_CACHE_MAX_ENTRIES = 1024
+
+admin_cache = TTLCache(ADMIN_CACHE_MAX_ENTRIES, ADMIN_CACHE_TTL_SECONDS)
+
+
+def _load_is_admin(user_id):
+    try:
+        claims = auth.get_user(user_id).custom_claims or {}
+    except Exception as e:
+        logging.warning(f"Could not look up the claims of user {user_id}: {e}")
+        return None
+    return claims.get(ADMIN_CLAIM) is True
+
+
+def is_admin(user_id):
+    """
+    :return: True if the user carries the ADMIN_CLAIM custom claim. A failed lookup counts as not an admin.
+    """
+    return admin_cache.get_or_load(user_id, lambda: _load_is_admin(user_id)) is True
+
+
+def require_admin(func):
+    """
+    Limits a resource method to operators holding the ADMIN_CLAIM custom claim; everyone else gets a 403.
+    Has to be applied below authenticate_firebase_id_token.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not is_admin(request.current_user):
+            return {"message": "This operation is limited to administrators"}, 403
+        return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,220 @@
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from scripts.management.Community.community_image_variants import image_variant_keys
+from scripts.management.Community.community_storage_backends import storage_backends
+from scripts.management.Community.community_storage_replication import cancel_replications
+from scripts.modules.mysql.Communities.community_cleanup_queries import query_create_cleanup_job, \
+    query_get_cleanup_job, query_get_cleanup_jobs_for_community, query_get_claimable_cleanup_job_ids, \
+    query_claim_cleanup_job, query_renew_cleanup_job_lease, query_update_cleanup_progress, \
+    query_get_community_post_ids, CLEANUP_RUNNING, CLEANUP_DONE
+
+# Upper bound on storage deletes running at the same time across all cleanup jobs
+CLEANUP_MAX_WORKERS = int(os.getenv('CLEANUP_MAX_WORKERS', 16))
+# Keys deleted between two progress updates
+CLEANUP_BATCH_SIZE = int(os.getenv('CLEANUP_BATCH_SIZE', 50))
+# A running job is renewed a few times per lease; once its lease runs out, another process may take it over
+CLEANUP_LEASE_SECONDS = int(os.getenv('CLEANUP_LEASE_SECONDS', 300))
+# How often each process looks for jobs left behind by a stopped process
+CLEANUP_SWEEP_SECONDS = int(os.getenv('CLEANUP_SWEEP_SECONDS', 60))
+# Identifies this process as the owner of the cleanup jobs it runs
+CLEANUP_WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+cleanup_executor = ThreadPoolExecutor(max_workers=CLEANUP_MAX_WORKERS, thread_name_prefix='asset-cleanup')
+
+# Every object is removed from every configured storage backend
+CLEANUP_TARGETS = tuple((backend.name, backend.delete) for backend in storage_backends())
+
+
+def community_asset_keys(community_id, post_ids):
+    """
+    Every storage key under communities/{id}/ the community may have written: the logo, the banner and each post
+    image, in their original upload paths and all size variants.
+    Content addressed images are shared between communities and are released by reference instead.
+    """
+    keys = image_variant_keys(f"communities/{community_id}/logo/{community_id}_logo.jpg")
+    keys += image_variant_keys(f"communities/{community_id}/banner/{community_id}_banner.jpg")
+    for post_id in post_ids:
+        keys += post_asset_keys(community_id, post_id)
+    return keys
+
+
+def post_asset_keys(community_id, post_id):
+    """
+    Every storage key the image of a post may occupy under its community's directory.
+    """
+    return image_variant_keys(f"communities/{community_id}/posts/communityPost{post_id}.jpg")
+
+
+def is_missing_object(error):
+    """
+    Deleting an object that was never written, e.g. a variant of an image uploaded before variants existed,
+    is not a failure.
+    """
+    return getattr(error, 'code', None) == 404 or type(error).__name__ == 'NotFound'
+
+
+class AssetCleanupQueue:
+    """
+    Background runner that deletes the stored files of deleted communities.
+    Jobs run one after another; the keys of a job are deleted in parallel batches on cleanup_executor and
+    progress is written after every batch, so an interrupted job resumes where it stopped.
+    A job is claimed in the database before it runs and held under a lease the runner keeps renewing, as asset
+    jobs are, so a job queued in several processes is run by one; jobs left behind by a stopped process are
+    picked up by the periodic sweep once their lease has run out.
+    """
+
+    def __init__(self, batch_size=CLEANUP_BATCH_SIZE, lease_seconds=CLEANUP_LEASE_SECONDS,
+                 sweep_seconds=CLEANUP_SWEEP_SECONDS):
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.sweep_seconds = sweep_seconds
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._held = None
+        self._started = False
+
+    def start(self):
+        """
+        Starts the runner on first use and queues the jobs that are waiting to be claimed.
+        """
+        with self._lock:
+            if self._started:
+                return
+            threading.Thread(target=self._run, name='asset-cleanup-runner', daemon=True).start()
+            threading.Thread(target=self._heartbeat_loop, name='asset-cleanup-heartbeat', daemon=True).start()
+            threading.Thread(target=self._sweep_loop, name='asset-cleanup-sweep', daemon=True).start()
+            for job_id in query_get_claimable_cleanup_job_ids(0):
+                self._queue.put(job_id)
+            self._started = True
+
+    def enqueue(self, job_id):
+        self.start()
+        self._queue.put(job_id)
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._process(job_id)
+            except Exception:
+                logging.exception(f"Cleanup job {job_id} crashed")
+            finally:
+                self._queue.task_done()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(max(self.lease_seconds / 3, 1))
+            job_id = self._held
+            if job_id is None:
+                continue
+            try:
+                if not query_renew_cleanup_job_lease(job_id, CLEANUP_WORKER_ID, self.lease_seconds):
+                    logging.warning(f"Lost the lease on cleanup job {job_id}")
+            except Exception:
+                logging.exception(f"Could not renew the lease on cleanup job {job_id}")
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_seconds)
+            try:
+                # Jobs pending for a whole lease were queued by a process that is gone
+                for job_id in query_get_claimable_cleanup_job_ids(self.lease_seconds):
+                    self._queue.put(job_id)
+            except Exception:
+                logging.exception("Cleanup job sweep failed")
+
+    def _process(self, job_id):
+        job = query_get_cleanup_job(job_id)
+        if job is None or job['status'] == CLEANUP_DONE:
+            return
+        if not query_claim_cleanup_job(job_id, CLEANUP_WORKER_ID, self.lease_seconds):
+            # Already running in another process, or finished since it was queued
+            return
+        self._held = job_id
+        try:
+            # Progress made by a process whose lease ran out is read after the claim
+            self._delete_keys(query_get_cleanup_job(job_id))
+        finally:
+            self._held = None
+
+    def _delete_keys(self, job):
+        job_id = job['jobId']
+        keys = job['keys']
+        processed = job['processedKeys']
+        deleted = job['deletedObjects']
+        failed = job['failedObjects']
+        while processed < len(keys):
+            batch = keys[processed:processed + self.batch_size]
+            cancel_replications(batch)
+            futures = {cleanup_executor.submit(delete, key): (key, target)
+                       for key in batch for target, delete in CLEANUP_TARGETS}
+            wait(futures)
+
+            last_error = None
+            for future, (key, target) in futures.items():
+                error = future.exception()
+                if error is None or is_missing_object(error):
+                    deleted += 1
+                else:
+                    failed += 1
+                    last_error = f"{target} {key}: {error}"
+                    logging.warning(f"Cleanup job {job_id} could not delete {key} from {target}: {error}")
+
+            processed += len(batch)
+            status = CLEANUP_DONE if processed >= len(keys) else CLEANUP_RUNNING
+            if not query_update_cleanup_progress(job_id, CLEANUP_WORKER_ID, status, processed, deleted, failed,
+                                                 last_error):
+                logging.warning(f"Cleanup job {job_id} was taken over by another process; stopping here")
+                return
+
+        if not keys:
+            query_update_cleanup_progress(job_id, CLEANUP_WORKER_ID, CLEANUP_DONE, 0, 0, 0)
+
+
+asset_cleanup_queue = AssetCleanupQueue()
+
+
+def schedule_community_cleanup(community_id, post_ids):
+    """
+    Records and enqueues the removal of a community's stored files.
+
+    :param post_ids: IDs of the community's posts, read before the posts were deleted.
+    :return: The ID of the cleanup job.
+    """
+    job_id = query_create_cleanup_job(community_id, community_asset_keys(community_id, post_ids))
+    asset_cleanup_queue.enqueue(job_id)
+    return job_id
+
+
+def delete_community_assets(community_id):
+    """
+    Schedules removal of every stored file of a community without waiting for it.
+    """
+    try:
+        job_id = schedule_community_cleanup(community_id, query_get_community_post_ids(community_id))
+        return {"message": "Asset cleanup scheduled.", "cleanupJobId": job_id}, 202
+    except Exception as e:
+        return {"message": f"An error occurred: {str(e)}"}, 500
+
+
+def manage_get_cleanup_status(community_id):
+    """
+    Reports the progress of the storage cleanup of a deleted community.
+    """
+    try:
+        jobs = query_get_cleanup_jobs_for_community(community_id)
+    except Exception as e:
+        return {"message": str(e)}, 500
+    if not jobs:
+        return {"message": "No cleanup found for this community"}, 404
+
+    job = jobs[-1]
+    job['progress'] = round(job['processedKeys'] / job['totalKeys'], 4) if job['totalKeys'] else 1.0
+    return job, 200
@@ -0,0 +1,262 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+
+from scripts.management.Community.community_asset_cleanup import community_asset_keys, post_asset_keys, \
+    is_missing_object
+from scripts.management.Community.community_asset_jobs import discard_staged_asset
+from scripts.management.Community.community_asset_store import blob_base_key
+from scripts.management.Community.community_image_variants import image_variant_keys
+from scripts.management.Community.community_storage_backends import storage_backends
+from scripts.management.Community.community_storage_replication import cancel_replications
+from scripts.modules.mysql.Communities.community_asset_blob_queries import query_stream_live_blob_hashes, \
+    query_get_dead_blob_hashes, query_delete_dead_blobs
+from scripts.modules.mysql.Communities.community_gc_queries import query_create_gc_run, query_update_gc_run, \
+    query_fail_stale_gc_runs, query_get_gc_run, query_get_recent_gc_runs, query_gc_running, gc_lock, \
+    query_stream_community_images, query_stream_post_images, GC_RUNNING, GC_DONE, GC_FAILED
+from scripts.modules.mysql.Communities.community_upload_queries import query_get_expired_uploads, \
+    query_delete_expired_upload
+
+# Key prefixes the collector owns; objects anywhere else in the buckets are never looked at
+GC_PREFIXES = tuple(prefix for prefix in os.getenv('GC_PREFIXES', 'communities/,assets/').split(',') if prefix)
+GC_PAGE_SIZE = int(os.getenv('GC_PAGE_SIZE', 1000))
+GC_DELETE_BATCH_SIZE = int(os.getenv('GC_DELETE_BATCH_SIZE', 100))
+GC_MAX_WORKERS = int(os.getenv('GC_MAX_WORKERS', 8))
+# Upper bound on deletes per second across all workers, so a large collection does not crowd out live traffic
+GC_DELETES_PER_SECOND = float(os.getenv('GC_DELETES_PER_SECOND', 50))
+# Objects and blobs younger than this are kept, since the upload that wrote them may not have been recorded yet
+GC_GRACE_SECONDS = int(os.getenv('GC_GRACE_SECONDS', 24 * 3600))
+# Resumable uploads that received nothing for this long are abandoned
+UPLOAD_EXPIRY_SECONDS = int(os.getenv('UPLOAD_EXPIRY_SECONDS', 24 * 3600))
+# Number of orphaned keys listed per backend in the report
+GC_SAMPLE_SIZE = 50
+GC_ROW_PAGE_SIZE = 500
+GC_RECENT_RUNS = 20
+# A run that has not reported progress for this long is considered interrupted
+GC_STALE_SECONDS = 3600
+
+gc_executor = ThreadPoolExecutor(max_workers=GC_MAX_WORKERS, thread_name_prefix='asset-gc')
+
+
+class RateLimiter:
+    """
+    Spaces calls out so that no more than rate of them start per second, across all threads.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(self._next, now)
+            self._next = start_at + self.interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+
+def _is_storage_url(value):
+    return '://' in value
+
+
+def build_reference_index():
+    """
+    Collects every storage key a database row points at: the variants of each live blob, the URLs on
+    communities and posts mapped back to keys, and the fixed paths images were uploaded to before content
+    addressing.
+
+    :return: Tuple of (set of referenced keys, list of URLs no backend could map to a key).
+    """
+    referenced = set()
+    unmapped = []
+
+    def add(value):
+        if not value:
+            return
+        if not _is_storage_url(value):
+            referenced.add(value)
+            return
+        for backend in storage_backends():
+            key = backend.key_from_url(value)
+            if key:
+                referenced.add(key)
+                return
+        unmapped.append(value)
+
+    for content_hash in query_stream_live_blob_hashes(GC_GRACE_SECONDS):
+        referenced.update(image_variant_keys(blob_base_key(content_hash)))
+    for community_id, logo, banner, logo_variants, banner_variants in query_stream_community_images():
+        referenced.update(community_asset_keys(community_id, []))
+        for value in (logo, banner, *(logo_variants or {}).values(), *(banner_variants or {}).values()):
+            add(value)
+    for community_id, post_id, image, image_variants in query_stream_post_images():
+        referenced.update(post_asset_keys(community_id, post_id))
+        for value in (image, *(image_variants or {}).values()):
+            add(value)
+    return referenced, unmapped
+
+
+def _rate_limited_delete(limiter, backend, key):
+    limiter.acquire()
+    backend.delete(key)
+
+
+def _delete_orphans(backend, orphans, stats, limiter):
+    """
+    Deletes one batch of orphaned objects in parallel and adds the outcome to the backend's stats.
+    """
+    cancel_replications([orphan['key'] for orphan in orphans])
+    futures = {gc_executor.submit(_rate_limited_delete, limiter, backend, orphan['key']): orphan
+               for orphan in orphans}
+    wait(futures)
+    for future, orphan in futures.items():
+        error = future.exception()
+        if error is None or is_missing_object(error):
+            stats['deletedObjects'] += 1
+            stats['deletedBytes'] += orphan['size']
+        else:
+            stats['failedObjects'] += 1
+            logging.warning(f"Garbage collection could not delete {orphan['key']} from {backend.name}: {error}")
+
+
+def _collect_backend(run_id, report, backend, referenced, delete, limiter):
+    stats = {'scannedObjects': 0, 'orphanObjects': 0, 'orphanBytes': 0, 'deletedObjects': 0, 'deletedBytes': 0,
+             'failedObjects': 0, 'sample': []}
+    report['backends'][backend.name] = stats
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=GC_GRACE_SECONDS)
+
+    for prefix in GC_PREFIXES:
+        page_token = None
+        while True:
+            try:
+                objects, page_token = backend.list_page(prefix, page_token, GC_PAGE_SIZE)
+            except NotImplementedError as e:
+                stats['skipped'] = str(e)
+                return
+            stats['scannedObjects'] += len(objects)
+            orphans = [obj for obj in objects if obj['key'] not in referenced
+                       and obj['updated'] is not None and obj['updated'] < cutoff]
+            stats['orphanObjects'] += len(orphans)
+            stats['orphanBytes'] += sum(orphan['size'] for orphan in orphans)
+            stats['sample'] += [orphan['key'] for orphan in orphans][:GC_SAMPLE_SIZE - len(stats['sample'])]
+
+            if delete:
+                for start in range(0, len(orphans), GC_DELETE_BATCH_SIZE):
+                    _delete_orphans(backend, orphans[start:start + GC_DELETE_BATCH_SIZE], stats, limiter)
+            query_update_gc_run(run_id, GC_RUNNING, report)
+            if not page_token:
+                break
+
+
+def _reap_dead_blobs(report, dry_run):
+    """
+    Removes blob rows that lost their last reference. Their objects are then no longer in the reference index
+    and are collected with the other orphans.
+    """
+    after = ''
+    while True:
+        hashes = query_get_dead_blob_hashes(GC_GRACE_SECONDS, after, GC_ROW_PAGE_SIZE)
+        if not hashes:
+            return
+        report['reapedBlobs'] += len(hashes) if dry_run else query_delete_dead_blobs(hashes)
+        after = hashes[-1]
+
+
+def _reap_expired_uploads(report, dry_run):
+    after = ''
+    while True:
+        uploads = query_get_expired_uploads(UPLOAD_EXPIRY_SECONDS, after, GC_ROW_PAGE_SIZE)
+        if not uploads:
+            return
+        for upload_id, staging_path in uploads:
+            try:
+                size = os.path.getsize(staging_path)
+            except OSError:
+                size = 0
+            if dry_run or query_delete_expired_upload(upload_id, UPLOAD_EXPIRY_SECONDS):
+                report['expiredUploads'] += 1
+                report['expiredUploadBytes'] += size
+                if not dry_run:
+                    discard_staged_asset(staging_path)
+        after = uploads[-1][0]
+
+
+def run_asset_gc(run_id, dry_run):
+    """
+    Finds stored objects no database row points at, reporting them in a dry run and deleting them otherwise.
+    Unreferenced blob rows and abandoned resumable uploads are reaped in the same pass.
+    """
+    report = {'reapedBlobs': 0, 'expiredUploads': 0, 'expiredUploadBytes': 0, 'unmappedReferences': 0,
+              'backends': {}, 'reclaimableBytes': 0}
+    try:
+        _reap_dead_blobs(report, dry_run)
+        referenced, unmapped = build_reference_index()
+        report['referencedKeys'] = len(referenced)
+        report['unmappedReferences'] = len(unmapped)
+        delete = not dry_run
+        if unmapped and delete:
+            # An object behind a URL that cannot be mapped would look orphaned, so nothing is deleted
+            report['deletionSkipped'] = f"{len(unmapped)} image URLs could not be mapped to keys, e.g. {unmapped[0]}"
+            delete = False
+
+        limiter = RateLimiter(GC_DELETES_PER_SECOND)
+        for backend in storage_backends():
+            _collect_backend(run_id, report, backend, referenced, delete, limiter)
+        _reap_expired_uploads(report, dry_run)
+
+        report['reclaimableBytes'] = (sum(stats['orphanBytes'] for stats in report['backends'].values())
+                                      + report['expiredUploadBytes'])
+        query_update_gc_run(run_id, GC_DONE, report)
+    except Exception as e:
+        logging.exception(f"Garbage collection run {run_id} failed")
+        query_update_gc_run(run_id, GC_FAILED, report, str(e))
+
+
+def _run_exclusively(run_id, dry_run):
+    """
+    Runs the collection under GC_LOCK, so one run at a time deletes across the whole deployment; a run that finds
+    the lock taken is recorded as failed without touching anything.
+    """
+    try:
+        with gc_lock() as locked:
+            if not locked:
+                query_update_gc_run(run_id, GC_FAILED, {}, "Another garbage collection run is in progress")
+                return
+            run_asset_gc(run_id, dry_run)
+    except Exception as e:
+        logging.exception(f"Garbage collection run {run_id} failed")
+        query_update_gc_run(run_id, GC_FAILED, {}, str(e))
+
+
+def manage_start_asset_gc(dry_run=True):
+    """
+    Starts a garbage collection run in the background; one run at a time across the deployment.
+
+    :param dry_run: Only report what would be reclaimed, without deleting anything.
+    :return: JSON object with the ID of the run.
+    """
+    if query_gc_running():
+        return {"message": "A garbage collection run is already in progress"}, 409
+    query_fail_stale_gc_runs(GC_STALE_SECONDS)
+    run_id = query_create_gc_run(dry_run)
+    threading.Thread(target=_run_exclusively, args=(run_id, dry_run), name='asset-gc-runner', daemon=True).start()
+    return {"message": "Garbage collection started.", "runId": run_id, "dryRun": dry_run}, 202
+
+
+def manage_get_asset_gc_runs(run_id=None):
+    """
+    Reports one garbage collection run, or the most recent runs when no ID is given.
+    """
+    if run_id is None:
+        return {"runs": query_get_recent_gc_runs(GC_RECENT_RUNS)}, 200
+    run = query_get_gc_run(run_id)
+    if run is None:
+        return {"message": "Garbage collection run not found"}, 404
+    return run, 200
@@ -0,0 +1,291 @@
+import json
+import logging
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+import uuid
+
+from werkzeug.datastructures import FileStorage
+
+from scripts.management.Community.community_asset_uploads import upload_failed
+from scripts.management.Community.community_asset_store import store_image_assets
+from scripts.management.Community.community_image_variants import transcode_failed
+from scripts.modules.mysql.Communities.community_asset_job_queries import query_create_asset_job, query_get_asset_job, query_get_asset_jobs_for_entity, query_get_claimable_asset_job_ids, \
+    query_claim_asset_job, query_renew_asset_job_lease, query_complete_asset_job, query_fail_asset_job, \
+    ASSET_JOB_DONE, ASSET_JOB_FAILED, ASSET_JOB_SUPERSEDED
+from scripts.modules.mysql.Communities.community_queries import community_query_invalidate_community, \
+    community_query_index_community, COMMUNITY_ROLES
+from scripts.modules.mysql.Communities.member.community_member_queries import query_get_member_roles
+from scripts.modules.mysql.Communities.post.community_post_queries import query_invalidate_community_post, \
+    query_get_community_post_by_id
+
+# Directory where uploaded files wait until a worker has copied them to storage. Any worker process may pick up
+# a job, so deployments with several hosts point it at storage every web and worker host mounts, e.g. a shared
+# volume. A worker that cannot find a staged file leaves the job to be retried, possibly on another host.
+ASSET_STAGING_DIR = os.getenv('ASSET_STAGING_DIR', os.path.join(tempfile.gettempdir(), 'social-vibes-asset-staging'))
+ASSET_JOB_WORKERS = int(os.getenv('ASSET_JOB_WORKERS', 4))
+ASSET_JOB_MAX_ATTEMPTS = int(os.getenv('ASSET_JOB_MAX_ATTEMPTS', 5))
+# Delay before the first retry, doubled after every further failed attempt
+ASSET_JOB_RETRY_SECONDS = float(os.getenv('ASSET_JOB_RETRY_SECONDS', 2))
+# A running job is renewed a few times per lease; once its lease runs out, another worker may take it over
+ASSET_JOB_LEASE_SECONDS = int(os.getenv('ASSET_JOB_LEASE_SECONDS', 300))
+# How often workers look for jobs left behind by a stopped process
+ASSET_JOB_SWEEP_SECONDS = int(os.getenv('ASSET_JOB_SWEEP_SECONDS', 60))
+# Identifies this process as the owner of the jobs it runs
+ASSET_JOB_WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def staging_directory():
+    os.makedirs(ASSET_STAGING_DIR, exist_ok=True)
+    return ASSET_STAGING_DIR
+
+
+def stage_asset(file_storage):
+    """
+    Saves an uploaded file to the staging directory so it can be uploaded after the request has returned.
+    :return: Path of the staged file.
+    """
+    staging_path = os.path.join(staging_directory(), uuid.uuid4().hex)
+    file_storage.save(staging_path)
+    return staging_path
+
+
+def discard_staged_asset(staging_path):
+    try:
+        os.remove(staging_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"Could not remove staged asset {staging_path}: {e}")
+
+
+def create_asset_jobs(session, entity_type, entity_id, community_id, assets, staged):
+    """
+    Stages the files and records one pending job per asset inside the caller's transaction.
+    The jobs are only handed to the workers by enqueue_asset_jobs once that transaction has been committed.
+
+    :param assets: Dictionary of asset name to a (FileStorage, bucket filename) tuple.
+    :param staged: List the staged file paths are appended to, so the caller can discard them on rollback.
+    :return: List of job IDs.
+    """
+    job_ids = []
+    for name, (file_storage, bucket_filename) in assets.items():
+        staging_path = stage_asset(file_storage)
+        staged.append(staging_path)
+        job_ids.append(query_create_asset_job(session, entity_type, entity_id, community_id, name, bucket_filename,
+                                              staging_path))
+    return job_ids
+
+
+def _on_asset_job_complete(job, url, variants):
+    """
+    Makes the new URLs visible to readers once they have been written to the community or post.
+    """
+    if job['entityType'] == 'post':
+        query_invalidate_community_post(job['entityId'])
+        return
+    community_query_invalidate_community(job['entityId'])
+    if job['asset'] == 'logo':
+        community_query_index_community(job['entityId'], {'imagePath': url, 'imageVariants': variants})
+
+
+class AssetJobQueue:
+    """
+    Background workers that store staged images through store_image_assets and record the outcome of every
+    attempt in communityAssetJob.
+    A job is claimed in the database before it runs and held under a lease the worker keeps renewing, so a job
+    queued in several processes runs once. Failed attempts are retried with exponential backoff; jobs left behind
+    by a stopped process are picked up by the periodic sweep once their lease has run out.
+    """
+
+    def __init__(self, workers=ASSET_JOB_WORKERS, max_attempts=ASSET_JOB_MAX_ATTEMPTS,
+                 retry_seconds=ASSET_JOB_RETRY_SECONDS, lease_seconds=ASSET_JOB_LEASE_SECONDS,
+                 sweep_seconds=ASSET_JOB_SWEEP_SECONDS):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.lease_seconds = lease_seconds
+        self.sweep_seconds = sweep_seconds
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._held = set()
+        self._held_lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        """
+        Starts the workers on first use and queues the jobs that are waiting to be claimed.
+        """
+        with self._lock:
+            if self._started:
+                return
+            for index in range(self.workers):
+                threading.Thread(target=self._run, name=f'asset-job-{index}', daemon=True).start()
+            threading.Thread(target=self._heartbeat_loop, name='asset-job-heartbeat', daemon=True).start()
+            threading.Thread(target=self._sweep_loop, name='asset-job-sweep', daemon=True).start()
+            for job_id in query_get_claimable_asset_job_ids(0):
+                self._queue.put(job_id)
+            self._started = True
+
+    def enqueue(self, job_ids):
+        self.start()
+        for job_id in job_ids:
+            self._queue.put(job_id)
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._process(job_id)
+            except Exception:
+                logging.exception(f"Asset job {job_id} crashed")
+            finally:
+                self._queue.task_done()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(max(self.lease_seconds / 3, 1))
+            with self._held_lock:
+                held = list(self._held)
+            for job_id in held:
+                try:
+                    if not query_renew_asset_job_lease(job_id, ASSET_JOB_WORKER_ID, self.lease_seconds):
+                        logging.warning(f"Lost the lease on asset job {job_id}")
+                except Exception:
+                    logging.exception(f"Could not renew the lease on asset job {job_id}")
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_seconds)
+            try:
+                # Jobs idle for a whole lease were queued or retried by a process that is gone
+                for job_id in query_get_claimable_asset_job_ids(self.lease_seconds):
+                    self._queue.put(job_id)
+            except Exception:
+                logging.exception("Asset job sweep failed")
+
+    def _process(self, job_id):
+        job = query_get_asset_job(job_id)
+        if job is None or job['status'] in (ASSET_JOB_DONE, ASSET_JOB_FAILED, ASSET_JOB_SUPERSEDED):
+            return
+        if not query_claim_asset_job(job_id, ASSET_JOB_WORKER_ID, self.lease_seconds):
+            # Already running in another worker, or finished since it was queued
+            return
+        with self._held_lock:
+            self._held.add(job_id)
+        try:
+            self._attempt(query_get_asset_job(job_id))
+        finally:
+            with self._held_lock:
+                self._held.discard(job_id)
+
+    def _attempt(self, job):
+        job_id = job['jobId']
+        attempts = job['attempts']
+
+        try:
+            with open(job['stagingPath'], 'rb') as staged:
+                file_storage = FileStorage(stream=staged, filename=os.path.basename(job['bucketFilename']))
+                result = store_image_assets(job['entityType'], job['entityId'], job['communityId'],
+                                            {job['asset']: file_storage}, job_id)[job['asset']]
+        except OSError as e:
+            # The staged file may only be missing on this host; the sweep hands the job to the other workers
+            # until it has used up its attempts
+            final = attempts >= self.max_attempts
+            query_fail_asset_job(job_id, ASSET_JOB_WORKER_ID, f"Staged file unavailable: {e}", final=final)
+            return
+
+        if upload_failed(result):
+            # An image that cannot be decoded will not decode on a later attempt either
+            final = attempts >= self.max_attempts or transcode_failed(result)
+            if not query_fail_asset_job(job_id, ASSET_JOB_WORKER_ID, json.dumps(result['errors']) or "No URL returned",
+                                        final=final):
+                logging.warning(f"Asset job {job_id} was taken over by another worker; its failure is not recorded")
+                return
+            if final:
+                logging.error(f"Asset job {job_id} failed after {attempts} attempts: {result['errors']}")
+                discard_staged_asset(job['stagingPath'])
+            else:
+                delay = self.retry_seconds * 2 ** (attempts - 1)
+                timer = threading.Timer(delay, self._queue.put, args=(job_id,))
+                timer.daemon = True
+                timer.start()
+            return
+
+        if not query_complete_asset_job(job_id, ASSET_JOB_WORKER_ID, result['url']):
+            current = query_get_asset_job(job_id)
+            if current is not None and current['status'] == ASSET_JOB_SUPERSEDED:
+                logging.info(f"Asset job {job_id} was superseded by a later upload of its {job['asset']}")
+                discard_staged_asset(job['stagingPath'])
+                return
+            # The other worker holding the job finishes it and discards the staged file
+            logging.warning(f"Asset job {job_id} was taken over by another worker before it completed here")
+            return
+        discard_staged_asset(job['stagingPath'])
+        if not result['unchanged']:
+            _on_asset_job_complete(job, result['url'], result['variants'])
+
+
+asset_job_queue = AssetJobQueue()
+
+
+def enqueue_asset_jobs(job_ids):
+    """
+    Hands committed jobs to the background workers.
+    """
+    if job_ids:
+        asset_job_queue.enqueue(job_ids)
+
+
+def manage_get_asset_status(user_id, entity_type, entity_id, community_id, author_id=None):
+    """
+    Reports the upload state of every asset of a community or post to the owner and moderators of its community,
+    and to the author of the post.
+
+    :param user_id: ID of the requesting user.
+    :param entity_type: 'community' or 'post'.
+    :param entity_id: ID of the community or post.
+    :param community_id: ID of the community the entity belongs to.
+    :param author_id: ID of the user who wrote the post, None for a community.
+    :return: JSON object with the overall status ('none', 'pending', 'done' or 'failed') and the individual jobs.
+        Jobs superseded by a later upload of the same asset do not count towards the overall status.
+    """
+    try:
+        if author_id is None or user_id != author_id:
+            role = query_get_member_roles(community_id, [user_id]).get(user_id)
+            if role not in (COMMUNITY_ROLES['owner'], COMMUNITY_ROLES['moderator']):
+                return {"message": "Only the owner, moderators and the author can see the upload status"}, 403
+        jobs = query_get_asset_jobs_for_entity(entity_type, entity_id)
+    except Exception as e:
+        return {"message": str(e)}, 500
+
+    statuses = {job['status'] for job in jobs} - {ASSET_JOB_SUPERSEDED}
+    if not jobs:
+        status = 'none'
+    elif ASSET_JOB_FAILED in statuses:
+        status = ASSET_JOB_FAILED
+    elif statuses <= {ASSET_JOB_DONE}:
+        status = ASSET_JOB_DONE
+    else:
+        status = 'pending'
+
+    for job in jobs:
+        # The staging location is internal to the worker host
+        job.pop('stagingPath', None)
+    return {"status": status, "jobs": jobs}, 200
+
+
+def manage_get_post_asset_status(user_id, post_id):
+    """
+    Reports the upload state of the image of a post, see manage_get_asset_status.
+    """
+    try:
+        post = query_get_community_post_by_id(post_id)
+    except Exception as e:
+        return {"message": str(e)}, 500
+    if post is None:
+        return {"message": "Post not found"}, 404
+    return manage_get_asset_status(user_id, 'post', post_id, post['communityId'], post['user']['userId'])
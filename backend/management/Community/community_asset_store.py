@@ -0,0 +1,81 @@
+import hashlib
+import io
+
+from werkzeug.datastructures import FileStorage
+
+from scripts.management.Community.community_asset_uploads import upload_failed
+from scripts.management.Community.community_image_variants import upload_image_variants
+from scripts.modules.mysql.Communities.community_asset_blob_queries import query_get_asset_hash, \
+    query_get_asset_blob, query_save_asset_blob, query_assign_asset
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def blob_base_key(digest):
+    """
+    Content addressed storage key shared by every community and post that uploads the same bytes,
+    e.g. assets/3f/3fa2..., to which image_variant_key appends the variant.
+    """
+    return f"assets/{digest[:2]}/{digest}"
+
+
+def store_image_assets(entity_type, entity_id, community_id, assets, job_id=None):
+    """
+    Stores images for a community or post, uploading only bytes that have never been stored before.
+    An asset whose bytes match what it already uses is left as it is; bytes already stored for any other
+    community or post are referenced instead of transcoded and uploaded again.
+
+    :param entity_type: 'community' or 'post'.
+    :param entity_id: ID of the community or post.
+    :param community_id: ID of the community the entity belongs to.
+    :param assets: Dictionary of asset name ('logo', 'banner' or 'image') to FileStorage.
+    :param job_id: ID of the asset job storing the images, or None when they are stored synchronously.
+    :return: Dictionary of asset name to {'hash', 'url', 'variants', 'errors', 'unchanged'}, so upload_failed
+             applies unchanged. Stored assets have already been written onto the community or post.
+    """
+    results = {}
+    uploads = {}
+    for name, file_storage in assets.items():
+        data = file_storage.read()
+        digest = content_hash(data)
+        result = {'hash': digest, 'url': None, 'variants': {}, 'errors': {}, 'unchanged': False}
+        results[name] = result
+
+        blob = query_get_asset_blob(digest)
+        if blob is not None:
+            result.update(url=blob['url'], variants=blob['variants'])
+            result['unchanged'] = query_get_asset_hash(entity_type, entity_id, name) == digest
+        elif digest not in uploads:
+            # Identical files within one request are uploaded once as well
+            uploads[digest] = (FileStorage(stream=io.BytesIO(data), filename=file_storage.filename,
+                                           content_type=file_storage.content_type), blob_base_key(digest))
+
+    if uploads:
+        for digest, uploaded in upload_image_variants(uploads).items():
+            if not upload_failed(uploaded):
+                query_save_asset_blob(digest, uploaded['url'], uploaded['variants'])
+            for result in results.values():
+                if result['hash'] == digest:
+                    result.update(url=uploaded['url'], variants=uploaded['variants'], errors=uploaded['errors'])
+
+    for name, result in results.items():
+        if upload_failed(result):
+            continue
+        # Unchanged assets are assigned as well, which supersedes older uploads of them that are still waiting
+        try:
+            if not query_assign_asset(entity_type, entity_id, community_id, name, result['hash'], result['url'],
+                                      result['variants'], job_id):
+                # Already in use, or a later upload of the asset has been assigned instead
+                result['unchanged'] = True
+        except LookupError as e:
+            result['errors']['store'] = str(e)
+    return results
+
+
+def assets_changed(results):
+    """
+    True when at least one asset was stored with new content.
+    """
+    return any(not result['unchanged'] for result in results.values())
@@ -0,0 +1,89 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from werkzeug.datastructures import FileStorage
+
+from scripts.management.Community.community_storage_backends import primary_storage, secondary_storage, \
+    replicates_async
+from scripts.management.Community.community_storage_replication import replicate
+
+# Upper bound on storage uploads running at the same time across all requests of this worker
+ASSET_UPLOAD_MAX_WORKERS = int(os.getenv('ASSET_UPLOAD_MAX_WORKERS', 16))
+
+asset_upload_executor = ThreadPoolExecutor(max_workers=ASSET_UPLOAD_MAX_WORKERS, thread_name_prefix='asset-upload')
+
+
+
+def upload_targets():
+    """
+    Backends an upload waits for: the primary, plus the secondary unless it is replicated asynchronously.
+    Only the primary's URL is returned to clients.
+    """
+    if secondary_storage is None or replicates_async():
+        return [primary_storage]
+    return [primary_storage, secondary_storage]
+
+
+def _copy_file_storage(file_storage, data):
+    """
+    Gives each upload its own stream over the same bytes, since one FileStorage cannot be read by two threads.
+    """
+    return FileStorage(stream=io.BytesIO(data), filename=file_storage.filename, name=file_storage.name,
+                       content_type=file_storage.content_type)
+
+
+def upload_assets(assets):
+    """
+    Uploads several files to the storage backends concurrently.
+    Every (asset, backend) pair is its own job, so the call takes as long as the slowest single upload.
+    In asynchronous replication mode only the primary is waited for and the copy to the secondary is queued.
+
+    :param assets: Dictionary of asset name to a (FileStorage, bucket filename) tuple.
+    :return: Dictionary of asset name to {'url': primary URL or None, 'errors': {backend: message}}.
+    """
+    results = {name: {'url': None, 'errors': {}} for name in assets}
+    contents = {}
+    futures = {}
+    for name, (file_storage, bucket_filename) in assets.items():
+        data = file_storage.read()
+        contents[name] = (data, bucket_filename, file_storage.content_type)
+        for backend in upload_targets():
+            future = asset_upload_executor.submit(backend.upload, _copy_file_storage(file_storage, data),
+                                                  bucket_filename)
+            futures[future] = (name, backend)
+
+    for future in as_completed(futures):
+        name, backend = futures[future]
+        try:
+            url = future.result()
+        except Exception as e:
+            logging.error(f"Upload of {name} to {backend.name} failed: {e}")
+            results[name]['errors'][backend.name] = str(e)
+            continue
+        if backend is primary_storage:
+            if url is None:
+                results[name]['errors'][backend.name] = "No URL returned"
+            results[name]['url'] = url
+
+    if replicates_async():
+        for name, result in results.items():
+            if upload_failed(result):
+                continue
+            data, bucket_filename, content_type = contents[name]
+            try:
+                replicate(data, bucket_filename, content_type)
+            except Exception as e:
+                # Without a queued copy the secondary would never receive the object, so the upload is retried
+                logging.error(f"Could not queue replication of {name}: {e}")
+                results[name]['errors']['replication'] = str(e)
+
+    return results
+
+
+def upload_failed(result):
+    """
+    True when an asset did not reach the storage backends it was written to, or its replication was not queued.
+    """
+    return result['url'] is None or bool(result['errors'])
@@ -0,0 +1,90 @@
+import asyncio
+
+from scripts.modules.mysql.Communities.community_async_queries import async_community_query_get_community_by_id, \
+    async_community_query_get_all_communities, async_community_query_get_all_community_users, \
+    async_community_query_get_community_users_page, async_query_get_all_community_posts, \
+    async_query_get_community_posts_page, async_get_query_community_invites, async_get_query_community_requests, \
+    async_query_count_community_requests
+
+
+async def async_community_manage_get_community_by_id(community_id):
+    community = await async_community_query_get_community_by_id(community_id)
+    if community is None:
+        return {"message": "No community found with the provided ID"}, 400  # HTTP 400 Bad Request
+
+    return community, 200  # HTTP 200 OK
+
+
+async def async_community_manage_get_all_communities(user_id):
+    communities = await async_community_query_get_all_communities(user_id)
+    if communities is None or len(communities) == 0:
+        return {"message": "No communities found"}, 400  # HTTP 400 Bad Request
+
+    return communities, 200  # HTTP 200 OK
+
+
+async def async_community_manage_get_community_users(community_id, limit=None, after=None, roles=None,
+                                                     name_prefix=None, paginate=False):
+    if not paginate:
+        community_users = await async_community_query_get_all_community_users(community_id)
+        if community_users is None:
+            return {"message": "No community found with the provided ID"}, 400  # HTTP 400 Bad Request
+        return community_users, 200
+
+    try:
+        members, next_cursor = await async_community_query_get_community_users_page(community_id, limit, after,
+                                                                                    roles, name_prefix)
+    except ValueError as e:
+        return {"message": str(e)}, 400
+    return {"members": members, "next_cursor": next_cursor}, 200
+
+
+async def async_manage_get_community_posts(community_id, limit=None, after=None, paginate=False):
+    if not paginate:
+        posts = await async_query_get_all_community_posts(community_id)
+        if posts:
+            return posts, 200
+        return {"message": "No posts found in this community"}, 404
+
+    try:
+        posts, next_cursor = await async_query_get_community_posts_page(community_id, limit, after)
+    except ValueError as e:
+        return {"message": str(e)}, 400
+    return {"posts": posts, "next_cursor": next_cursor}, 200
+
+
+async def async_manage_get_community_invitations(user_id):
+    invites = await async_get_query_community_invites(user_id)
+    if not invites:
+        return {"message": "No invites found"}, 404
+
+    return {"invites": invites}, 200
+
+
+async def async_manage_get_community_requests(community_id):
+    requests = await async_get_query_community_requests(community_id)
+    return requests, 200
+
+
+async def async_community_manage_get_community_page(community_id, posts_limit=None, members_limit=None):
+    """
+    Async version of community_manage_get_community_page: the four lookups are awaited together on the database
+    event loop instead of occupying four worker threads.
+    """
+    community, (posts, posts_next_cursor), (members, members_next_cursor), request_count = await asyncio.gather(
+        async_community_query_get_community_by_id(community_id),
+        async_query_get_community_posts_page(community_id, posts_limit),
+        async_community_query_get_community_users_page(community_id, members_limit),
+        async_query_count_community_requests(community_id),
+    )
+    if community is None:
+        return {"message": "No community found with the provided ID"}, 400  # HTTP 400 Bad Request
+
+    return {
+        "community": community,
+        "posts": posts,
+        "postsNextCursor": posts_next_cursor,
+        "members": members,
+        "membersNextCursor": members_next_cursor,
+        "pendingRequestCount": request_count
+    }, 200
@@ -0,0 +1,88 @@
+import logging
+import os
+import threading
+import time
+
+from scripts.modules.mysql.Communities.community_counter_queries import counter_reconcile_lock, \
+    query_counter_reconcile_running, query_create_counter_run, query_update_counter_run, \
+    query_fail_interrupted_counter_runs, query_get_counter_run, query_get_recent_counter_runs, \
+    query_get_community_id_batch, query_reconcile_community_counters, COUNTER_RUN_DONE, COUNTER_RUN_FAILED
+
+COUNTER_RECONCILE_BATCH = int(os.getenv('COUNTER_RECONCILE_BATCH', 500))
+# Pause between batches, so a pass over many communities does not keep the database busy
+COUNTER_RECONCILE_PAUSE_SECONDS = float(os.getenv('COUNTER_RECONCILE_PAUSE_SECONDS', 0.1))
+# Number of runs listed when no run ID is given
+COUNTER_RECENT_RUNS = 20
+
+
+def run_counter_reconcile(run_id, batch_size=COUNTER_RECONCILE_BATCH):
+    """
+    Recounts the members and visible posts of every community in batches and corrects the counters that drifted,
+    e.g. because a membership or post was changed outside the application. Writes keep the counters current;
+    this only repairs what they missed.
+    The pass holds a named database lock, so one pass runs at a time across the whole deployment; a run that
+    finds the lock taken is recorded as failed without counting anything.
+    """
+    report = {"checked": 0, "corrected": 0}
+    started = time.time()
+    try:
+        with counter_reconcile_lock() as locked:
+            if not locked:
+                query_update_counter_run(run_id, COUNTER_RUN_FAILED, report, "Another reconcile pass is running")
+                return
+            after = 0
+            while True:
+                community_ids = query_get_community_id_batch(after, batch_size)
+                if not community_ids:
+                    break
+                report['corrected'] += query_reconcile_community_counters(community_ids)
+                report['checked'] += len(community_ids)
+                after = community_ids[-1]
+                time.sleep(COUNTER_RECONCILE_PAUSE_SECONDS)
+            if report['corrected']:
+                logging.warning(f"Corrected drifted counters of {report['corrected']} communities")
+            report['durationSeconds'] = round(time.time() - started, 3)
+            query_update_counter_run(run_id, COUNTER_RUN_DONE, report)
+    except Exception as e:
+        logging.exception(f"Counter reconcile run {run_id} failed")
+        query_update_counter_run(run_id, COUNTER_RUN_FAILED, report, str(e))
+
+
+def manage_reconcile_counters():
+    """
+    Starts a counter reconcile pass in the background; one pass at a time across the deployment.
+
+    :return: JSON object with the ID of the run.
+    """
+    if query_counter_reconcile_running():
+        return {"message": "A counter reconcile pass is already in progress"}, 409
+    # With no pass holding the lock, runs still marked running were interrupted
+    query_fail_interrupted_counter_runs()
+    run_id = query_create_counter_run()
+    threading.Thread(target=run_counter_reconcile, args=(run_id,), name='community-counter-reconcile',
+                     daemon=True).start()
+    return {"message": "Counter reconcile started.", "runId": run_id}, 202
+
+
+def manage_get_counter_runs(run_id=None):
+    """
+    Reports one counter reconcile run, or the most recent runs when no ID is given.
+    """
+    if run_id is None:
+        return {"runs": query_get_recent_counter_runs(COUNTER_RECENT_RUNS)}, 200
+    run = query_get_counter_run(run_id)
+    if run is None:
+        return {"message": "Counter reconcile run not found"}, 404
+    return run, 200
+
+
+if __name__ == '__main__':
+    # Scheduled pass, e.g. from cron: python -m scripts.management.Community.community_counters
+    logging.basicConfig(level=logging.INFO)
+    if query_counter_reconcile_running():
+        print("A counter reconcile pass is already in progress")
+    else:
+        query_fail_interrupted_counter_runs()
+        scheduled_run_id = query_create_counter_run()
+        run_counter_reconcile(scheduled_run_id)
+        print(query_get_counter_run(scheduled_run_id))
@@ -0,0 +1,130 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import time
+
+from flask import request
+
+from scripts.modules.mysql.Communities.community_cache import TTLCache
+from scripts.modules.mysql.Communities.community_idempotency_queries import query_claim_idempotency_key, \
+    query_complete_idempotency_key, query_release_idempotency_key, \
+    query_purge_expired_idempotency_keys, IDEMPOTENCY_PROCESSING
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_MAX_KEY_LENGTH = 255
+# How long a key and its response are kept
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 24 * 3600))
+# A request still processing after this long is assumed lost, and its key can be claimed by a retry
+IDEMPOTENCY_PROCESSING_TIMEOUT_SECONDS = int(os.getenv('IDEMPOTENCY_PROCESSING_TIMEOUT_SECONDS', 300))
+# Completed responses kept in memory, so most retries are answered without a database read
+IDEMPOTENCY_CACHE_MAX_ENTRIES = int(os.getenv('IDEMPOTENCY_CACHE_MAX_ENTRIES', 2048))
+IDEMPOTENCY_PURGE_SECONDS = 600
+IDEMPOTENCY_PURGE_BATCH = 1000
+
+idempotency_cache = TTLCache(IDEMPOTENCY_CACHE_MAX_ENTRIES, IDEMPOTENCY_TTL_SECONDS)
+
+_next_purge = 0
+
+
+def _purge_expired_keys():
+    """
+    Deletes a batch of expired keys at most once every IDEMPOTENCY_PURGE_SECONDS, keeping the table bounded.
+    """
+    global _next_purge
+    now = time.monotonic()
+    if now < _next_purge:
+        return
+    _next_purge = now + IDEMPOTENCY_PURGE_SECONDS
+    try:
+        query_purge_expired_idempotency_keys(IDEMPOTENCY_PURGE_BATCH)
+    except Exception as e:
+        logging.warning(f"Could not purge expired idempotency keys: {e}")
+
+
+def request_fingerprint(view_args):
+    """
+    Hash of everything a request sends: URL arguments, form fields, JSON body and uploaded file contents.
+    A key reused for a different request is rejected instead of answered with the other request's response.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(view_args, sort_keys=True, default=str).encode())
+    digest.update(json.dumps(sorted(request.form.items(multi=True))).encode())
+    digest.update(json.dumps(request.get_json(silent=True), sort_keys=True, default=str).encode())
+    for name, file_storage in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+        digest.update(f"{name}:{file_storage.filename}:".encode())
+        for block in iter(lambda: file_storage.stream.read(64 * 1024), b''):
+            digest.update(block)
+        file_storage.stream.seek(0)
+    return digest.hexdigest()
+
+
+def _replay(fingerprint, stored_fingerprint, body, status):
+    if fingerprint != stored_fingerprint:
+        return {"message": f"{IDEMPOTENCY_HEADER} was already used for a different request"}, 422
+    return body, status, {'Idempotent-Replayed': 'true'}
+
+
+def _split_response(response):
+    """
+    :return: Tuple of (body, status) of a resource method's return value.
+    """
+    if isinstance(response, tuple):
+        return response[0], response[1] if len(response) > 1 else 200
+    return response, 200
+
+
+def idempotent(scope):
+    """
+    Makes a resource method safe to retry with an Idempotency-Key header: the first request with a key runs and
+    its response is stored, later requests with the same key get the stored response without running again.
+    Keys are scoped to the operation and the authenticated user. Requests failing with a server error, and
+    responses that are not JSON, are not stored, so they run again on a retry.
+    Has to be applied below authenticate_firebase_id_token.
+
+    :param scope: Name of the operation, e.g. 'community.create'.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            client_key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not client_key:
+                return func(*args, **kwargs)
+            if len(client_key) > IDEMPOTENCY_MAX_KEY_LENGTH:
+                return {"message": f"{IDEMPOTENCY_HEADER} is limited to {IDEMPOTENCY_MAX_KEY_LENGTH} characters"}, 400
+
+            key = hashlib.sha256(f"{scope}\n{request.current_user}\n{client_key}".encode()).hexdigest()
+            fingerprint = request_fingerprint(kwargs)
+            cached = idempotency_cache.get(key)
+            if cached is not None:
+                return _replay(fingerprint, *cached)
+
+            _purge_expired_keys()
+            claimed, stored = query_claim_idempotency_key(key, fingerprint, IDEMPOTENCY_TTL_SECONDS,
+                                                          IDEMPOTENCY_PROCESSING_TIMEOUT_SECONDS)
+            if not claimed and stored is None:
+                claimed, stored = query_claim_idempotency_key(key, fingerprint, IDEMPOTENCY_TTL_SECONDS,
+                                                              IDEMPOTENCY_PROCESSING_TIMEOUT_SECONDS)
+            if not claimed:
+                if stored is None or stored['status'] == IDEMPOTENCY_PROCESSING:
+                    return {"message": "A request with this Idempotency-Key is still being processed"}, 409, \
+                        {'Retry-After': '1'}
+                idempotency_cache.set(key, (stored['fingerprint'], stored['responseBody'], stored['responseStatus']))
+                return _replay(fingerprint, stored['fingerprint'], stored['responseBody'], stored['responseStatus'])
+
+            try:
+                response = func(*args, **kwargs)
+            except Exception:
+                query_release_idempotency_key(key)
+                raise
+
+            body, status = _split_response(response)
+            if status >= 500 or not isinstance(body, (dict, list)):
+                query_release_idempotency_key(key)
+                return response
+            query_complete_idempotency_key(key, status, body)
+            idempotency_cache.set(key, (fingerprint, body, status))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,140 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from firebase_admin import storage
+
+from scripts.modules.mysql.Communities.community_asset_blob_queries import query_get_visible_asset_hashes
+from scripts.modules.mysql.Communities.community_cache import TTLCache
+from scripts.modules.mysql.Communities.community_queries import community_query_get_visible_community_ids
+
+# Lifetime of a signed download URL
+SIGNED_URL_TTL_SECONDS = int(os.getenv('SIGNED_URL_TTL_SECONDS', 3600))
+# A cached URL is dropped this long before it expires, so every URL handed out is still valid for at least this long
+SIGNED_URL_REFRESH_MARGIN_SECONDS = int(os.getenv('SIGNED_URL_REFRESH_MARGIN_SECONDS', 300))
+SIGNED_URL_CACHE_MAX_ENTRIES = int(os.getenv('SIGNED_URL_CACHE_MAX_ENTRIES', 20000))
+SIGNED_URL_WORKERS = int(os.getenv('SIGNED_URL_WORKERS', 8))
+MAX_BATCH_PATHS = 500
+# Prefix of community logos, banners and post images: communities/<community ID>/...
+COMMUNITY_ASSET_PREFIX = 'communities/'
+# Prefix of content addressed images: assets/<2 hex>/<SHA-256>...
+BLOB_ASSET_PREFIX = 'assets/'
+# Prefix of user profile pictures, which every signed in user can see next to members and posts
+PROFILE_PICTURE_PREFIX = os.getenv('PROFILE_PICTURE_PREFIX', 'profilePictures/')
+
+signed_url_cache = TTLCache(SIGNED_URL_CACHE_MAX_ENTRIES,
+                            max(SIGNED_URL_TTL_SECONDS - SIGNED_URL_REFRESH_MARGIN_SECONDS, 1))
+signing_executor = ThreadPoolExecutor(max_workers=SIGNED_URL_WORKERS, thread_name_prefix='signed-url')
+
+
+def _is_valid_path(path):
+    return bool(path) and not path.startswith('/') and '..' not in path.split('/')
+
+
+def _community_id(path):
+    """
+    :return: The community ID of a communities/<ID>/... path, or None if the path has another form.
+    """
+    parts = path.split('/')
+    if path.startswith(COMMUNITY_ASSET_PREFIX) and len(parts) > 2 and parts[1].isdigit():
+        return int(parts[1])
+    return None
+
+
+def _blob_hash(path):
+    """
+    :return: The blob hash of an assets/<2 hex>/<SHA-256>... path, or None if the path has another form.
+    """
+    parts = path.split('/')
+    if path.startswith(BLOB_ASSET_PREFIX) and len(parts) == 3 and len(parts[2]) >= 64:
+        return parts[2][:64]
+    return None
+
+
+def _visible_paths(user_id, paths):
+    """
+    Keeps the paths of images the user could also read through the rows they belong to: images of public
+    communities and of private communities the user is a member of, and profile pictures.
+    Any other key in the bucket, e.g. staged uploads or another service's files, is never signed.
+    """
+    community_ids = {path: _community_id(path) for path in paths}
+    blob_hashes = {path: _blob_hash(path) for path in paths}
+    visible_communities = community_query_get_visible_community_ids(
+        user_id, {community_id for community_id in community_ids.values() if community_id is not None})
+    visible_hashes = query_get_visible_asset_hashes(
+        user_id, {blob_hash for blob_hash in blob_hashes.values() if blob_hash is not None})
+    return [
+        path for path in paths
+        if (community_ids[path] is not None and community_ids[path] in visible_communities)
+        or (blob_hashes[path] is not None and blob_hashes[path] in visible_hashes)
+        or (bool(PROFILE_PICTURE_PREFIX) and path.startswith(PROFILE_PICTURE_PREFIX))
+    ]
+
+
+def _is_url(path):
+    return path.startswith('https://') or path.startswith('http://')
+
+
+def _sign(path):
+    """
+    :return: Tuple of (download URL, ISO timestamp it expires at).
+    """
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=SIGNED_URL_TTL_SECONDS)
+    url = storage.bucket().blob(path).generate_signed_url(expiration=expires_at, version='v4', method='GET')
+    return url, expires_at.isoformat()
+
+
+def _sign_paths(paths):
+    """
+    Cache loader: signs the missing paths concurrently. Paths that fail to sign are left out, so they are
+    neither cached nor returned.
+    """
+    signed = {}
+    futures = {signing_executor.submit(_sign, path): path for path in paths}
+    for future, path in futures.items():
+        try:
+            signed[path] = future.result()
+        except Exception as e:
+            logging.warning(f"Could not sign a download URL for {path}: {e}")
+    return signed
+
+
+def resolve_image_urls(paths):
+    """
+    Resolves storage paths to download URLs, serving repeat paths from signed_url_cache.
+    Values that already are URLs, such as images stored before paths were used, are returned as they are.
+
+    :return: Dictionary of path to (URL, expiry timestamp or None).
+    """
+    resolved = {path: (path, None) for path in paths if _is_url(path)}
+    to_sign = [path for path in paths if path not in resolved]
+    if to_sign:
+        resolved.update(signed_url_cache.get_many_or_load(to_sign, _sign_paths))
+    return resolved
+
+
+def manage_resolve_image_urls(user_id, paths):
+    """
+    Resolves many storage paths to download URLs in one request.
+    Only image paths of rows the user can see are signed; every other path is reported as invalid.
+
+    :param user_id: ID of the user asking.
+    :param paths: List of storage paths, e.g. the imagePath of members and posts.
+    :return: JSON object with a URL and expiry per path, the paths that were rejected and those that failed to sign.
+    """
+    if not paths:
+        return {"message": "At least one path is required"}, 400
+    paths = list(dict.fromkeys(paths))
+    if len(paths) > MAX_BATCH_PATHS:
+        return {"message": f"At most {MAX_BATCH_PATHS} paths can be resolved at once"}, 400
+
+    # Values that already are URLs are returned as they are and need no check
+    urls_given = [path for path in paths if _is_url(path)]
+    allowed = set(urls_given + _visible_paths(user_id, [path for path in paths
+                                                         if _is_valid_path(path) and not _is_url(path)]))
+    invalid = [path for path in paths if path not in allowed]
+    resolved = resolve_image_urls([path for path in paths if path in allowed])
+    urls = {path: {"url": url, "expiresAt": expires_at} for path, (url, expires_at) in resolved.items()}
+    failed = [path for path in paths if path not in urls and path not in invalid]
+    return {"urls": urls, "invalid": invalid, "failed": failed}, 200
@@ -0,0 +1,100 @@
+import io
+import os
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from werkzeug.datastructures import FileStorage
+
+from scripts.management.Community.community_asset_uploads import upload_assets
+
+# Size variants produced for every uploaded image, largest first so each one is scaled down from the previous.
+# The number is the longest edge in pixels; smaller images are never scaled up.
+IMAGE_VARIANTS = (
+    ('full', 1920),
+    ('medium', 640),
+    ('thumbnail', 160),
+)
+IMAGE_VARIANT_FORMAT = 'WEBP'
+IMAGE_VARIANT_EXTENSION = '.webp'
+IMAGE_VARIANT_CONTENT_TYPE = 'image/webp'
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', 80))
+
+
+def image_variant_key(bucket_filename, variant):
+    """
+    Storage key of one variant, derived from the asset's base key,
+    e.g. communities/1/logo/1_logo.jpg -> communities/1/logo/1_logo_thumbnail.webp
+    """
+    return f"{os.path.splitext(bucket_filename)[0]}_{variant}{IMAGE_VARIANT_EXTENSION}"
+
+
+def image_variant_keys(bucket_filename):
+    """
+    Every key an image asset may occupy: the original upload path used before variants existed, and each variant.
+    """
+    return [bucket_filename] + [image_variant_key(bucket_filename, variant) for variant, _ in IMAGE_VARIANTS]
+
+
+def transcode_image(data):
+    """
+    Decodes an image once and encodes every size variant from it.
+    EXIF orientation is applied to the pixels and all metadata (EXIF, GPS, ICC, XMP) is dropped.
+
+    :param data: Bytes of the uploaded image.
+    :return: Dictionary of variant name to encoded bytes.
+    :raises ValueError: If the data is not a supported image.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as uploaded:
+            image = ImageOps.exif_transpose(uploaded)
+            has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ValueError(f"Unsupported image: {e}")
+
+    image.info = {}
+    variants = {}
+    for variant, max_edge in IMAGE_VARIANTS:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format=IMAGE_VARIANT_FORMAT, quality=IMAGE_VARIANT_QUALITY, method=4)
+        variants[variant] = buffer.getvalue()
+    return variants
+
+
+def upload_image_variants(assets):
+    """
+    Transcodes images and uploads all of their variants to both storage targets concurrently.
+
+    :param assets: Dictionary of asset name to a (FileStorage, bucket filename) tuple.
+    :return: Dictionary of asset name to {'url': URL of the full variant or None, 'variants': {variant: URL},
+             'errors': {variant.target or 'transcode': message}}, so upload_failed applies unchanged.
+    """
+    results = {}
+    uploads = {}
+    for name, (file_storage, bucket_filename) in assets.items():
+        results[name] = {'url': None, 'variants': {}, 'errors': {}}
+        try:
+            variants = transcode_image(file_storage.read())
+        except ValueError as e:
+            results[name]['errors']['transcode'] = str(e)
+            continue
+        for variant, data in variants.items():
+            key = image_variant_key(bucket_filename, variant)
+            uploads[(name, variant)] = (FileStorage(stream=io.BytesIO(data), filename=os.path.basename(key),
+                                                    content_type=IMAGE_VARIANT_CONTENT_TYPE), key)
+
+    for (name, variant), result in upload_assets(uploads).items():
+        results[name]['variants'][variant] = result['url']
+        for target, message in result['errors'].items():
+            results[name]['errors'][f"{variant}.{target}"] = message
+
+    for result in results.values():
+        result['url'] = result['variants'].get('full')
+    return results
+
+
+def transcode_failed(result):
+    """
+    True when the asset could not be decoded, which no retry will fix.
+    """
+    return 'transcode' in result['errors']
@@ -1,12 +1,14 @@
 import json
 import logging
+import os
 import traceback
 from sqlalchemy import text  # Correct import for text function to use in query
 import cgitb;
+from concurrent.futures import ThreadPoolExecutor
 
 cgitb.enable()  # Enables detailed traceback in web browser environments
 from urllib.parse import urlparse
-from flask import request
+from flask import request, Response, stream_with_context
 from sqlalchemy import exc
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -21,12 +23,38 @@ from scripts.modules.firebase.firebase_buckets import firebase_bucket_delete_fil
 from scripts.modules.mysql.Communities.community_queries import community_query_new_community, \
     community_query_get_community_by_id, community_query_get_all_communities, community_query_update_community, \
     community_query_delete_community, community_query_get_communities_by_user_id, \
-    community_query_get_all_community_users, Session, community_query_add_banner, community_query_update_banner
-
-from scripts.setup.db_setup import dbsession, Community, User
+    community_query_get_all_community_users, community_query_forget_community, \
+    community_query_stream_all_communities, community_query_stream_all_community_users, \
+    community_query_search_communities, community_query_index_community, \
+    community_query_get_communities_within_radius, community_query_get_nearest_communities, \
+    community_query_invalidate_community, community_query_get_cache_stats, community_query_get_communities_by_ids, \
+    MAX_BATCH_IDS, community_query_get_community_users_page, community_query_get_visible_community_ids
+from scripts.modules.mysql.Communities.community_updates import COMMUNITY_UPDATE_FIELDS, VersionConflict, \
+    diff_updates, version_matches
+
+from scripts.management.Community.community_asset_jobs import create_asset_jobs, enqueue_asset_jobs, \
+    discard_staged_asset
+from scripts.management.Community.community_asset_uploads import upload_failed
+from scripts.management.Community.community_asset_store import store_image_assets, assets_changed
+from scripts.management.Community.community_asset_cleanup import schedule_community_cleanup
+from scripts.modules.mysql.Communities.community_asset_blob_queries import query_release_community_assets
+from scripts.modules.mysql.Communities.community_cleanup_queries import query_get_community_post_ids, \
+    query_community_exists
+from scripts.modules.mysql.Communities.member.community_member_queries import query_count_community_requests
+from scripts.modules.mysql.Communities.pagination import clamp_page_limit, encode_cursor, decode_cursor
+from scripts.modules.mysql.Communities.post.community_post_queries import query_get_community_posts_page
+from scripts.modules.mysql.db_session import Session, get_pool_stats, DB_SYNC_POOL_SIZE, \
+    DB_SYNC_MAX_OVERFLOW
+from scripts.setup.db_setup import Community, User
 from scripts.utils import utils_check_file_in_form, utils_check_in_object, utils_check_if_int, utils_check_if_bool, \
     utils_parse_bool, utils_get_current_time, community_folder_bucket
 
+# Worker threads running the independent queries of community pages concurrently. Every worker holds at most one
+# pooled connection, so by default there are as many as the shared sync pool can hand out; more would only wait on
+# the pool, fewer would make page loads queue behind each other while connections sit idle.
+COMMUNITY_PAGE_WORKERS = int(os.getenv('COMMUNITY_PAGE_WORKERS', DB_SYNC_POOL_SIZE + DB_SYNC_MAX_OVERFLOW))
+community_page_executor = ThreadPoolExecutor(max_workers=COMMUNITY_PAGE_WORKERS, thread_name_prefix='community-page')
+
 
 def community_manage_get_communities_by_user_id(user_id):
     try:
@@ -57,6 +85,70 @@ def community_manage_get_community_by_id(community_id):
     return community, 200  # HTTP 200 OK
 
 
+def community_manage_get_community_page(community_id, posts_limit=None, members_limit=None):
+    """
+    Loads everything the community page needs in one request: the community, the first page of posts,
+    the first page of members and the number of pending join requests.
+    The four lookups are independent, so they run concurrently and the request takes as long as the slowest one.
+    The request thread reads the community itself, so only three lookups per page wait for a page worker.
+
+    :param community_id: ID of the community to look up
+    :param posts_limit: Number of posts in the first page
+    :param members_limit: Number of members in the first page
+    :return: JSON object with the community page data or an error message
+    """
+    posts_future = community_page_executor.submit(query_get_community_posts_page, community_id, posts_limit)
+    members_future = community_page_executor.submit(community_query_get_community_users_page, community_id,
+                                                    members_limit)
+    requests_future = community_page_executor.submit(query_count_community_requests, community_id)
+
+    community = community_query_get_community_by_id(community_id)
+    if community is None:
+        return {"message": "No community found with the provided ID"}, 400  # HTTP 400 Bad Request
+
+    posts, posts_next_cursor = posts_future.result()
+    members, members_next_cursor = members_future.result()
+
+    return {
+        "community": community,
+        "posts": posts,
+        "postsNextCursor": posts_next_cursor,
+        "members": members,
+        "membersNextCursor": members_next_cursor,
+        "pendingRequestCount": requests_future.result()
+    }, 200
+
+
+def community_manage_get_cache_stats():
+    """
+    Returns the hit, miss and eviction counters of the community read cache.
+    """
+    return community_query_get_cache_stats(), 200
+
+
+def community_manage_get_communities_by_ids(community_ids):
+    """
+    Retrieves many communities in one request.
+
+    :param community_ids: List of community IDs to look up
+    :return: JSON object with the communities in request order and the IDs that were not found
+    """
+    if not community_ids:
+        return {"message": "At least one community ID is required"}, 400
+    if len(community_ids) > MAX_BATCH_IDS:
+        return {"message": f"At most {MAX_BATCH_IDS} community IDs can be requested at once"}, 400
+
+    communities, missing = community_query_get_communities_by_ids(community_ids)
+    return {"communities": communities, "missing": missing}, 200
+
+
+def community_manage_get_pool_stats():
+    """
+    Returns the live usage and counters of the shared database connection pool.
+    """
+    return get_pool_stats(), 200
+
+
 def community_manage_get_all_communities(user_id):
     """
     Retrieves all communities from the database and returns them as a JSON array.
@@ -72,12 +164,131 @@ def community_manage_get_all_communities(user_id):
     return communities, 200  # HTTP 200 OK
 
 
+def community_manage_search_communities(user_id, search_text, limit=None, after=None):
+    """
+    Searches communities by name, description and city and returns one page of ranked matches.
+    Private communities are only returned to their members.
+
+    :param user_id: ID of the user searching
+    :param search_text: Text typed by the user
+    :param limit: Maximum number of matches in the page
+    :param after: Cursor returned with the previous page, or None for the first page
+    :return: JSON object with the matches and the cursor for the next page
+    """
+    if not search_text or not search_text.strip():
+        return {"message": "Search text cannot be blank"}, 400
+
+    try:
+        limit = clamp_page_limit(limit)
+        position = decode_cursor(after, {'offset': int})
+        offset = max(position['offset'], 0) if position else 0
+    except ValueError as e:
+        return {"message": str(e)}, 400
+
+    matches = community_query_search_communities(search_text)
+    visible = community_query_get_visible_community_ids(user_id, [match['id'] for match in matches])
+    matches = [match for match in matches if match['id'] in visible]
+    page = matches[offset:offset + limit]
+    next_cursor = encode_cursor({'offset': offset + limit}) if offset + limit < len(matches) else None
+
+    return {"communities": page, "total": len(matches), "next_cursor": next_cursor}, 200
+
+
+def community_manage_get_nearby_communities(user_id, latitude, longitude, radius_km=None, limit=None, after=None):
+    """
+    Returns one page of communities sorted by distance from the given point.
+    With a radius only communities inside it are returned, otherwise the nearest communities are paged through.
+    Private communities are only returned to their members.
+
+    :param user_id: ID of the user searching
+    :param latitude: Latitude of the search point
+    :param longitude: Longitude of the search point
+    :param radius_km: Optional search radius in kilometres
+    :param limit: Maximum number of communities in the page
+    :param after: Cursor returned with the previous page, or None for the first page
+    :return: JSON object with the communities and the cursor for the next page
+    """
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        return {"message": "Latitude or longitude out of range"}, 400
+    if radius_km is not None and radius_km <= 0:
+        return {"message": "Radius must be greater than zero"}, 400
+
+    try:
+        limit = clamp_page_limit(limit)
+        position = decode_cursor(after, {'distanceKm': float, 'id': int})
+    except ValueError as e:
+        return {"message": str(e)}, 400
+    after_position = (position['distanceKm'], position['id']) if position else None
+
+    # Communities the user cannot see are skipped, so candidates are read in batches until one more than the page
+    # size is visible, which tells whether another page exists
+    page = []
+    while len(page) <= limit:
+        if radius_km is not None:
+            candidates = community_query_get_communities_within_radius(latitude, longitude, radius_km, limit + 1,
+                                                                       after_position)
+        else:
+            candidates = community_query_get_nearest_communities(latitude, longitude, limit + 1, after_position)
+        visible = community_query_get_visible_community_ids(user_id, [community['id'] for _, community in candidates])
+        page.extend(candidate for candidate in candidates if candidate[1]['id'] in visible)
+        if len(candidates) <= limit:
+            break
+        after_position = candidates[-1][0]
+
+    next_cursor = None
+    if len(page) > limit:
+        distance, community_id = page[limit - 1][0]
+        next_cursor = encode_cursor({'distanceKm': distance, 'id': community_id})
+
+    return {"communities": [community for _, community in page[:limit]], "next_cursor": next_cursor}, 200
+
+
+def community_manage_stream_all_communities(user_id):
+    """
+    Streams all communities as a chunked JSON array instead of building the whole list in memory.
+    :return: Flask streaming response with a JSON array of communities, or the same error as the buffered endpoint
+    """
+    return stream_json_array(community_query_stream_all_communities(user_id),
+                             ({"message": "No communities found"}, 400))  # HTTP 400 Bad Request
+
+
+def stream_json_array(rows, empty_response):
+    """
+    Wraps a generator of JSON encoded strings in a chunked HTTP response containing a JSON array.
+    The first row is read before the response starts, so a failing query is still reported through the error
+    handlers with its status code, and an empty result gets the same response as the buffered endpoint.
+
+    :param rows: Generator yielding one JSON string per array element
+    :param empty_response: Response returned when the generator yields nothing
+    :return: Flask streaming response
+    """
+    first = next(rows, None)
+    if first is None:
+        return empty_response
+
+    def generate():
+        yield '[' + first
+        try:
+            for row in rows:
+                yield ',' + row
+        except Exception as e:
+            # The status has been sent already, so the client can only see the array cut short
+            logging.error(f"Streaming a JSON array failed after it started: {e}")
+            raise
+        yield ']'
+
+    return Response(stream_with_context(generate()), status=200, mimetype='application/json')
+
+
 def community_manage_create_community(args):
     """
-    Creates a new community using the provided details, then uploads an image and updates the community entry.
-    The community creation is rolled back only if the logo upload fails.
+    Creates a new community using the provided details and commits it straight away with its assets pending.
+    The logo and banner are staged locally and uploaded by the background asset workers, so no transaction or
+    pooled connection is held open while the files travel to storage.
+    Progress can be followed through manage_get_asset_status.
     """
     session = Session()
+    staged = []
     try:
         session.begin()  # Start transaction
         community_id = community_query_new_community(
@@ -97,86 +308,131 @@ def community_manage_create_community(args):
             is_closed=args['is_closed']
         )
 
-        # Call the function to handle image uploads and retrieve results
-        upload_results = upload_community_assets(community_id, args)
+        # Record the logo and banner uploads as jobs in the same transaction as the community
+        assets = {'logo': (args['image_path'], f"communities/{community_id}/logo/{community_id}_logo.jpg")}
+        if args.get('banner_path') is not None:
+            assets['banner'] = (args['banner_path'], f"communities/{community_id}/banner/{community_id}_banner.jpg")
+        job_ids = create_asset_jobs(session, 'community', community_id, community_id, assets, staged)
 
-        # Check specifically if the logo upload failed
-        if 'imagePath' not in upload_results[0] or upload_results[1] != 200:
-            session.rollback()  # Rollback the transaction if logo upload fails
-            return {"message": "Failed to upload logo", "error": upload_results[0].get('message', 'Unknown error')}, 500
+        session.commit()  # The community is visible now; its image paths are filled in by the workers
+        enqueue_asset_jobs(job_ids)
 
-        # Proceed if logo upload succeeds; check banner upload separately
-        imageUrl = upload_results[0].get('imagePath')
-        bannerUrl = upload_results[0].get('bannerPath')
+        community_query_index_community(community_id, {
+            'name': args['name'],
+            'description': args['description'],
+            'city': args['city'],
+            'latitude': args['latitude'],
+            'longitude': args['longitude']
+        })
 
-        # It's okay if the banner upload fails; we proceed with updating the community details for the logo only
-        result = session.execute(
-            text(
-                "UPDATE community SET community_imagePath = :imageUrl, community_bannerPath = :bannerPath WHERE community_id = :community_id "),
-            {'imageUrl': imageUrl, 'bannerPath': bannerUrl, 'community_id': community_id}
-        )
-        print(result)
-        session.commit()  # Commit the transaction if logo is successfully uploaded
-
-        return {"message": "Community created successfully", "imagePath": imageUrl, "bannerPath": bannerUrl}, 200
+        return {"message": "Community created successfully", "communityId": community_id,
+                "assetStatus": "pending", "assetJobs": job_ids}, 202
 
     except KeyError as e:
         session.rollback()
+        for staging_path in staged:
+            discard_staged_asset(staging_path)
         return {"message": f"Missing key: {e}"}, 400
     except Exception as e:
         session.rollback()
+        for staging_path in staged:
+            discard_staged_asset(staging_path)
         return {"message": str(e)}, 500
     finally:
         session.close()
 
 
-def community_manage_update_community(community_id, updates):
+def version_conflict_response(current):
+    """
+    409 response for an update made against an outdated version, carrying the current row.
+    """
+    if current is None:
+        return {"message": "Not found"}, 404
+    return {"message": "Changed by another request since the given version",
+            "version": current['version'], "current": current}, 409
+
+
+def community_manage_update_community(community_id, updates, expected_version=None):
+    """
+    Updates a community. Fields that already hold the requested value are not written, and a request that
+    changes nothing returns without touching the database or the cache.
+
+    :param expected_version: Version of the community the client edited. When given, the update is refused
+        with 409 if the community has been written since, and no image is replaced.
+    """
     logging.debug(f"Managing update for community ID: {community_id} with updates: {updates}")
 
+    # Compared against the row itself rather than the per-process cache, which may be older than the last write
+    current = community_query_get_community_by_id(community_id, fresh=True)
+    if current is None:
+        return {"message": "Community not found"}, 404
+    if expected_version is not None and not version_matches(current, expected_version):
+        return version_conflict_response(current)
+
     # Initialize optional variables with default values
     image_url = None
     banner_url = None
 
-    # Handle image upload if 'image_path' is provided in the updates
+    # Collect the logo and banner uploads provided in the updates so they are stored together
+    assets = {}
     if 'image_path' in updates:
-        logo_bucket_file = updates['image_path']
-        logo_bucket_filename = f"communities/{community_id}/logo/{community_id}_logo.jpg"
-        image_url = community_firebase_bucket_upload_file(logo_bucket_file, logo_bucket_filename)
-        bucket_upload_file(logo_bucket_file, logo_bucket_filename)  # Assuming this is also necessary
-
-        if image_url is None:
-            logging.error("Failed to upload new logo.")
-            return {"message": "Failed to upload new logo"}, 500
-        updates['imagePath'] = image_url  # Update the imagePath in the updates dictionary
-        updates.pop('image_path')  # Remove the original key after processing
-
-    # Handle banner upload if 'banner_path' is provided in the updates
+        assets['logo'] = updates.pop('image_path')
     if 'banner_path' in updates:
-        banner_bucket_file = updates['banner_path']
-        banner_bucket_filename = f"communities/{community_id}/banner/{community_id}_banner.jpg"
-        banner_url = community_firebase_bucket_upload_file(banner_bucket_file, banner_bucket_filename)
-        bucket_upload_file(banner_bucket_file, banner_bucket_filename)  # Assuming this is also necessary
-
-        if banner_url is None:
-            logging.error("Failed to upload new banner.")
-            return {"message": "Failed to upload new banner"}, 500
-        updates['bannerPath'] = banner_url  # Update the bannerPath in the updates dictionary
-        updates.pop('banner_path')  # Remove the original key after processing
-
-    # Proceed with the community update in the database
+        assets['banner'] = updates.pop('banner_path')
+
+    updates = diff_updates(current, updates, COMMUNITY_UPDATE_FIELDS)
+    if not updates and not assets:
+        return {"message": "Community unchanged", "version": current['version']}, 200
+
     try:
-        community_query_update_community(community_id, updates)
+        version = current['version']
+        # The version is checked and moved on under the row lock before any image is stored, so a request
+        # refused with 409 has not replaced the logo or banner
+        if updates or expected_version is not None:
+            version = community_query_update_community(community_id, updates, expected_version)
+
+        # Files identical to the stored ones are skipped; new ones are written onto the community when stored
+        stored = {}
+        if assets:
+            stored = store_image_assets('community', community_id, community_id, assets)
+            for name, result in stored.items():
+                if upload_failed(result):
+                    logging.error(f"Failed to upload new {name}: {result['errors']}")
+                    community_query_invalidate_community(community_id)
+                    return {"message": f"Failed to upload new {name}", "errors": result['errors'],
+                            "updated": sorted(updates)}, 500
+
+            if 'logo' in stored and not stored['logo']['unchanged']:
+                image_url = stored['logo']['url']
+            if 'banner' in stored and not stored['banner']['unchanged']:
+                banner_url = stored['banner']['url']
+
+        if not updates and not assets_changed(stored) and expected_version is None:
+            return {"message": "Community unchanged", "version": version}, 200
+
+        if image_url is not None:
+            community_query_index_community(community_id, {'imagePath': image_url,
+                                                           'imageVariants': stored['logo']['variants']})
+        community_query_invalidate_community(community_id)
+        if assets_changed(stored):
+            # Assigning an image moved the version on again
+            version = community_query_get_community_by_id(community_id, fresh=True)['version']
         logging.debug("Community update successful.")
 
         # Prepare the response dictionary
-        response = {"message": "Community updated successfully"}
+        response = {"message": "Community updated successfully", "updated": sorted(updates), "version": version}
         if image_url is not None:
             response["imagePath"] = image_url
+            response["imageVariants"] = stored['logo']['variants']
         if banner_url is not None:
             response["bannerPath"] = banner_url
+            response["bannerVariants"] = stored['banner']['variants']
 
         return response, 200
 
+    except VersionConflict as e:
+        community_query_invalidate_community(community_id)
+        return version_conflict_response(e.document)
     except Exception as e:
         logging.error(f"Error in community_manage_update_community: {e}")
         return {"message": str(e)}, 500
@@ -184,27 +440,25 @@ def community_manage_update_community(community_id, updates):
 
 def community_manage_delete_community(community_id, id_token: str):
     """
-    Manages the deletion of a community and its associated assets, including images and banners.
+    Manages the deletion of a community and its associated assets, including images, banners and post images.
+    The request returns as soon as the database row is gone; the stored files are removed by a background
+    cleanup job whose progress is reported by manage_get_cleanup_status.
     """
     try:
-        # Construct the paths for the logo and banner files
-        logo_bucket_filename = f"communities/{community_id}/logo/{community_id}_logo.jpg"
-        banner_bucket_filename = f"communities/{community_id}/banner/{community_id}_banner.jpg"
-
-        bucket_delete(logo_bucket_filename)
-        bucket_delete(banner_bucket_filename)
-
-        # Attempt to delete the logo and banner from Firebase
-        firebase_bucket_delete_file(logo_bucket_filename)
-        firebase_bucket_delete_file(banner_bucket_filename)
+        # The post IDs are needed to find the post images, so they are read before the posts are deleted
+        post_ids = query_get_community_post_ids(community_id)
 
         # Invoke your community deletion query function
         community_query_delete_community(community_id, id_token)
-
-        # Any additional logic to handle further asset deletion or cleanup post-deletion
-        # (if applicable and not handled by the stored procedure)
-
-        return {"message": "Community deleted successfully"}, 200
+        if query_community_exists(community_id):
+            # The stored procedure only deletes communities owned by the requester
+            return {"message": "Community could not be deleted"}, 403
+        community_query_forget_community(community_id)
+        # Release the logo, banner and post images; blobs no longer used anywhere are left for garbage collection
+        query_release_community_assets(community_id)
+
+        cleanup_job_id = schedule_community_cleanup(community_id, post_ids)
+        return {"message": "Community deleted successfully", "cleanupJobId": cleanup_job_id}, 200
     except Exception as e:
         return {"message": str(e)}, 500
 
@@ -223,6 +477,38 @@ def community_manage_get_all_community_users(community_id):
     return community_users, 200  # HTTP 200 OK
 
 
+def community_manage_get_community_users_page(community_id, limit=None, after=None, roles=None, name_prefix=None):
+    """
+    Retrieves one page of community members, optionally filtered by role and username prefix.
+
+    :param community_id: ID of the community to look up
+    :param limit: Maximum number of members in the page
+    :param after: Cursor returned with the previous page, or None for the first page
+    :param roles: Optional list of role names to filter on
+    :param name_prefix: Optional username prefix to search for
+    :return: JSON object with the members and the cursor for the next page
+    """
+    try:
+        members, next_cursor = community_query_get_community_users_page(community_id, limit, after, roles,
+                                                                        name_prefix)
+    except ValueError as e:
+        return {"message": str(e)}, 400
+
+    return {"members": members, "next_cursor": next_cursor}, 200
+
+
+def community_manage_stream_all_community_users(community_id):
+    """
+    Streams the users of a community as a chunked JSON array.
+
+    :param community_id: ID of the community to look up
+    :return: Flask streaming response with a JSON array of community users, or the same error as the buffered
+        endpoint
+    """
+    return stream_json_array(community_query_stream_all_community_users(community_id),
+                             ({"message": "No community found with the provided ID"}, 400))  # HTTP 400 Bad Request
+
+
 import logging
 
 
@@ -233,28 +519,23 @@ def community_manage_add_banner(community_id, banner_file):
     if not banner_file:
         return {"message": "No banner file provided"}, 400
 
-    # Construct a unique filename for the banner
-    banner_filename = f"communities/{community_id}/banner/{banner_file.filename}"
-
     try:
-        # Extract the original filename from the uploaded file
-        banner_bucket_file = banner_file
+        # Store the banner by content; the community entry is updated with its URL and variants when it is new
+        upload_result = store_image_assets('community', community_id, community_id, {'banner': banner_file})['banner']
+        bannerUrl = upload_result['url']
 
-        # Construct the new path in the desired directory structure using community ID
-        banner_bucket_filename = f"communities/{community_id}/banner/{community_id}_banner.jpg"
+        if upload_failed(upload_result):
+            logging.error(f"Failed to upload new banner: {upload_result['errors']}")
+            return {"message": "Failed to upload new banner", "errors": upload_result['errors']}, 500
 
-        # Upload the banner to Firebase and get the URL
-        bannerUrl = community_firebase_bucket_upload_file(banner_bucket_file, banner_bucket_filename)
-        bucket_upload_file(banner_bucket_file, banner_bucket_filename)
+        if upload_result['unchanged']:
+            return {"message": "Banner unchanged", "bannerPath": bannerUrl,
+                    "bannerVariants": upload_result['variants']}, 200
 
-        if bannerUrl is None:
-            logging.error("Failed to upload new banner.")
-            return {"message": "Failed to upload new banner"}, 500
-
-        # Update the community entry with the new banner URL
-        community_query_add_banner(community_id, bannerUrl)
+        community_query_invalidate_community(community_id)
         logging.debug(f"Community update successful with new banner URL: {bannerUrl}")
-        return {"message": "Community updated successfully", "bannerPath": bannerUrl}, 200
+        return {"message": "Community updated successfully", "bannerPath": bannerUrl,
+                "bannerVariants": upload_result['variants']}, 200
 
     except Exception as e:
         logging.error(f"Error in community_manage_add_banner: {e}")
@@ -268,28 +549,23 @@ def community_manage_update_banner(community_id, banner_file):
     if not banner_file:
         return {"message": "No banner file provided"}, 400
 
-    # Construct a unique filename for the banner
-    banner_filename = f"communities/{community_id}/banner/{banner_file.filename}"
-
     try:
-        # Extract the original filename from the uploaded file
-        banner_bucket_file = banner_file
-
-        # Construct the new path in the desired directory structure using community ID
-        banner_bucket_filename = f"communities/{community_id}/banner/{community_id}_banner.jpg"
+        # Store the banner by content; the community entry is updated with its URL and variants when it is new
+        upload_result = store_image_assets('community', community_id, community_id, {'banner': banner_file})['banner']
+        bannerUrl = upload_result['url']
 
-        # Upload the banner to Firebase and get the URL
-        bannerUrl = community_firebase_bucket_upload_file(banner_bucket_file, banner_bucket_filename)
-        bucket_upload_file(banner_bucket_file, banner_bucket_filename)
+        if upload_failed(upload_result):
+            logging.error(f"Failed to upload new banner: {upload_result['errors']}")
+            return {"message": "Failed to upload new banner", "errors": upload_result['errors']}, 500
 
-        if bannerUrl is None:
-            logging.error("Failed to upload new banner.")
-            return {"message": "Failed to upload new banner"}, 500
+        if upload_result['unchanged']:
+            return {"message": "Banner unchanged", "bannerPath": bannerUrl,
+                    "bannerVariants": upload_result['variants']}, 200
 
-        # Update the community entry with the new banner URL
-        community_query_update_banner(community_id, bannerUrl)
+        community_query_invalidate_community(community_id)
         logging.debug(f"Community update successful with new banner URL: {bannerUrl}")
-        return {"message": "Community updated successfully", "bannerPath": bannerUrl}, 200
+        return {"message": "Community updated successfully", "bannerPath": bannerUrl,
+                "bannerVariants": upload_result['variants']}, 200
 
     except Exception as e:
         logging.error(f"Error in community_manage_add_banner: {e}")
@@ -303,11 +579,12 @@ def get_community_image_path(community_id):
     :return: A dictionary with the message and the image path, or raises an error if not found.
     """
     try:
-        # Construct the query to retrieve the image path from the community table
-        query = dbsession.query(Community.community_imagePath).filter_by(community_id=community_id)
+        with Session() as session:
+            # Construct the query to retrieve the image path from the community table
+            query = session.query(Community.community_imagePath).filter_by(community_id=community_id)
 
-        # Execute the query and fetch one result
-        imageUrl = dbsession.execute(query).fetchone()
+            # Execute the query and fetch one result
+            imageUrl = session.execute(query).fetchone()
         print('p pic', imageUrl)
 
         # Check if the query returned a result
@@ -344,84 +621,3 @@ def extract_path_from_url(url):
         return path[len('/social-vibes-user-content/'):]  # This removes the bucket name part
     return None
 
-
-def upload_community_assets(community_id, args):
-    """
-    Uploads community logo and banner images to Firebase and another storage bucket, and updates community details with new image URLs.
-
-    Parameters:
-        community_id (int): The ID of the community to update.
-        args (dict): Dictionary containing 'image_path' and 'banner_path' keys with file storage objects as values.
-
-    Returns:
-        dict: Result message indicating success or failure, including HTTP status codes.
-    """
-    try:
-        # Extract the file storage objects from the provided arguments
-        logo_bucket_file = args['image_path']
-        banner_bucket_file = args['banner_path']
-
-        # Construct new paths for storing the images using the community ID
-        logo_bucket_filename = f"communities/{community_id}/logo/{community_id}_logo.jpg"
-        banner_bucket_filename = f"communities/{community_id}/banner/{community_id}_banner.jpg"
-
-        # Upload the logo to Firebase and another bucket, and retrieve the URL
-        image_url = community_firebase_bucket_upload_file(logo_bucket_file, logo_bucket_filename)
-        bucket_upload_file(logo_bucket_file, logo_bucket_filename)
-
-        # Upload the banner to Firebase and another bucket, and retrieve the URL
-        banner_url = community_firebase_bucket_upload_file(banner_bucket_file, banner_bucket_filename)
-        bucket_upload_file(banner_bucket_file, banner_bucket_filename)
-
-        # Check if either URL failed to be retrieved (assuming None as failure)
-        if image_url is None or banner_url is None:
-            failure_message = "Failed to upload " + ("logo." if image_url is None else "banner.")
-            return {"message": failure_message}, 500
-
-        # Successful upload response
-        return {
-            "message": "Assets uploaded successfully.",
-            "imagePath": image_url,
-            "bannerPath": banner_url
-        }, 200
-
-    except KeyError as e:
-        # Handle missing keys in the args dictionary
-        return {"message": f"Missing key: {e.args[0]} - required image path or banner path not provided."}, 400
-    except Exception as e:
-        # General exception handling for any other unforeseen errors
-        return {"message": f"An error occurred: {str(e)}"}, 500
-
-
-def delete_community_assets(community_id):
-    """
-    Deletes community logo and banner images from Firebase and another storage bucket.
-
-    Parameters:
-        community_id (int): The ID of the community whose assets are to be deleted.
-
-    Returns:
-        dict: Result message indicating success or failure, including HTTP status codes.
-    """
-    try:
-        # Construct paths for the stored images using the community ID
-        logo_bucket_filename = f"communities/{community_id}/logo/{community_id}_logo.jpg"
-        banner_bucket_filename = f"communities/{community_id}/banner/{community_id}_banner.jpg"
-
-        # Delete the logo from Firebase and another bucket
-        firebase_bucket_delete_file(logo_bucket_filename)
-        bucket_delete(logo_bucket_filename)
-
-        # Delete the banner from Firebase and another bucket
-        firebase_bucket_delete_file(banner_bucket_filename)
-        bucket_delete(banner_bucket_filename)
-
-        # Successful deletion response
-        return {"message": "Assets deleted successfully."}, 200
-
-    except KeyError as e:
-        # Handle missing keys in the args dictionary
-        return {"message": f"Missing key: {e.args[0]} - required image path or banner path not provided."}, 400
-    except Exception as e:
-        # General exception handling for any other unforeseen errors
-        return {"message": f"An error occurred: {str(e)}"}, 500
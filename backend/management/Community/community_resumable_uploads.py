@@ -0,0 +1,180 @@
+import os
+import uuid
+
+from werkzeug.exceptions import ClientDisconnected
+
+from scripts.management.Community.community_asset_jobs import staging_directory, enqueue_asset_jobs
+from scripts.modules.mysql.Communities.community_asset_blob_queries import ASSET_TARGET_COLUMNS
+from scripts.modules.mysql.Communities.community_asset_job_queries import query_create_asset_job
+from scripts.modules.mysql.Communities.community_queries import COMMUNITY_ROLES
+from scripts.modules.mysql.Communities.community_upload_queries import query_create_upload, query_get_upload, \
+    query_claim_upload_chunk, query_release_upload_chunk, query_advance_upload, query_complete_upload, \
+    UPLOAD_COMPLETE
+from scripts.modules.mysql.Communities.member.community_member_queries import query_get_member_roles
+from scripts.modules.mysql.Communities.post.community_post_queries import query_get_community_post_by_id
+from scripts.modules.mysql.db_session import Session
+
+# Size of the blocks the request body is copied to disk in; the only part of a chunk ever held in memory
+UPLOAD_BLOCK_BYTES = int(os.getenv('UPLOAD_BLOCK_BYTES', 256 * 1024))
+# Chunk size suggested to clients; smaller chunks lose less progress on a dropped connection
+UPLOAD_CHUNK_BYTES = int(os.getenv('UPLOAD_CHUNK_BYTES', 4 * 1024 * 1024))
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 50 * 1024 * 1024))
+# How long a request may take to write one chunk; a chunk cannot be sent again before its claim runs out
+UPLOAD_CHUNK_LEASE_SECONDS = int(os.getenv('UPLOAD_CHUNK_LEASE_SECONDS', 300))
+
+
+def _upload_state(upload):
+    return {
+        "uploadId": upload['uploadId'],
+        "offset": upload['receivedBytes'],
+        "totalBytes": upload['totalBytes'],
+        "status": upload['status'],
+        "jobId": upload['jobId'],
+    }
+
+
+def _get_own_upload(user_id, upload_id):
+    """
+    :return: Tuple of (upload or None, error response or None).
+    """
+    upload = query_get_upload(upload_id)
+    if upload is None:
+        return None, ({"message": "Upload not found"}, 404)
+    if upload['userId'] != user_id:
+        return None, ({"message": "Upload belongs to another user"}, 403)
+    return upload, None
+
+
+def manage_create_upload(user_id, entity_type, entity_id, asset_name, total_bytes, filename=None, content_type=None):
+    """
+    Opens a resumable upload for a community logo or banner, which only the owner and moderators of the
+    community may replace, or for a post image, which only its author may replace.
+
+    :param total_bytes: Size of the whole file, announced up front so completion can be detected.
+    :return: JSON object with the upload ID, the offset to send from and the suggested chunk size.
+    """
+    if (entity_type, asset_name) not in ASSET_TARGET_COLUMNS:
+        return {"message": f"Unsupported asset {asset_name} for {entity_type}"}, 400
+    if total_bytes is None or total_bytes <= 0:
+        return {"message": "size must be a positive number of bytes"}, 400
+    if total_bytes > UPLOAD_MAX_BYTES:
+        return {"message": f"Files are limited to {UPLOAD_MAX_BYTES} bytes"}, 413
+
+    if entity_type == 'post':
+        post = query_get_community_post_by_id(entity_id)
+        if post is None:
+            return {"message": "Post not found"}, 404
+        if post['user']['userId'] != user_id:
+            return {"message": "Only the author can change the image of a post"}, 403
+        community_id = post['communityId']
+    else:
+        community_id = entity_id
+        role = query_get_member_roles(community_id, [user_id]).get(user_id)
+        if role not in (COMMUNITY_ROLES['owner'], COMMUNITY_ROLES['moderator']):
+            return {"message": "Only the owner and moderators can change the images of a community"}, 403
+
+    upload_id = uuid.uuid4().hex
+    staging_path = os.path.join(staging_directory(), f"upload-{upload_id}")
+    open(staging_path, 'wb').close()
+
+    query_create_upload(upload_id, user_id, entity_type, entity_id, community_id, asset_name, filename, content_type,
+                        staging_path, total_bytes)
+    return {"uploadId": upload_id, "offset": 0, "totalBytes": total_bytes, "chunkBytes": UPLOAD_CHUNK_BYTES,
+            "status": "receiving"}, 201
+
+
+def manage_get_upload(user_id, upload_id):
+    """
+    Reports how much of an upload has arrived, so a client can resume after losing its connection.
+    """
+    upload, error = _get_own_upload(user_id, upload_id)
+    if error:
+        return error
+    return _upload_state(upload), 200
+
+
+def _write_chunk(staging_path, offset, stream, length):
+    """
+    Copies up to length bytes from the request body to the staged file at offset, one block at a time.
+    Bytes past offset left by an earlier interrupted request are discarded first.
+    :return: Number of bytes written, less than length if the client disconnected.
+    """
+    remaining = length
+    with open(staging_path, 'r+b') as staged:
+        staged.seek(offset)
+        staged.truncate()
+        try:
+            while remaining > 0:
+                block = stream.read(min(UPLOAD_BLOCK_BYTES, remaining))
+                if not block:
+                    break
+                staged.write(block)
+                remaining -= len(block)
+        except ClientDisconnected:
+            pass
+    return length - remaining
+
+
+def manage_append_upload_chunk(user_id, upload_id, offset, stream, length):
+    """
+    Appends one chunk of the file. Chunks must arrive in order; a chunk sent for any other offset is rejected
+    with the offset the upload actually has, which is where the client resumes. The upload is claimed before
+    the staged file is touched, so a chunk sent twice at once is only written by one of the requests.
+    Whatever part of a chunk arrived before a disconnect is kept.
+    Once the last byte has arrived the file is handed to the background asset workers.
+
+    :param offset: Position of the chunk in the file.
+    :param stream: Request body stream.
+    :param length: Content-Length of the chunk.
+    """
+    upload, error = _get_own_upload(user_id, upload_id)
+    if error:
+        return error
+    if upload['status'] == UPLOAD_COMPLETE:
+        return _upload_state(upload), 200
+    if offset != upload['receivedBytes']:
+        return dict(_upload_state(upload), message="Offset does not match the bytes received so far"), 409
+    if length is None:
+        return {"message": "Content-Length is required"}, 411
+    if offset + length > upload['totalBytes']:
+        return {"message": "Chunk extends past the announced size"}, 400
+
+    writer = uuid.uuid4().hex
+    if not query_claim_upload_chunk(upload_id, offset, writer, UPLOAD_CHUNK_LEASE_SECONDS):
+        # Another request is writing this chunk, or got there first
+        upload = query_get_upload(upload_id)
+        return dict(_upload_state(upload), message="Another request is writing to this upload"), 409
+    try:
+        received = offset + _write_chunk(upload['stagingPath'], offset, stream, length)
+    except Exception:
+        query_release_upload_chunk(upload_id, writer)
+        raise
+    if not query_advance_upload(upload_id, offset, received, writer):
+        # The claim ran out while the chunk was written and another request took the upload over
+        upload = query_get_upload(upload_id)
+        return dict(_upload_state(upload), message="Offset does not match the bytes received so far"), 409
+
+    upload['receivedBytes'] = received
+    if received < upload['totalBytes']:
+        return _upload_state(upload), 200
+    return _complete_upload(upload)
+
+
+def _complete_upload(upload):
+    session = Session()
+    try:
+        session.begin()
+        job_id = query_create_asset_job(session, upload['entityType'], upload['entityId'], upload['communityId'],
+                                        upload['asset'], upload['filename'] or f"upload-{upload['uploadId']}",
+                                        upload['stagingPath'])
+        query_complete_upload(session, upload['uploadId'], job_id)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        return {"message": str(e)}, 500
+    finally:
+        session.close()
+
+    enqueue_asset_jobs([job_id])
+    upload.update(status=UPLOAD_COMPLETE, jobId=job_id)
+    return _upload_state(upload), 202
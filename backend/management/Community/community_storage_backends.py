@@ -0,0 +1,222 @@
+import bisect
+import os
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlparse, unquote
+
+from firebase_admin import storage
+
+from scripts.modules.buckets.buckets import bucket_upload_file, bucket_delete
+from scripts.modules.firebase.firebase_buckets import community_firebase_bucket_upload_file, \
+    firebase_bucket_delete_file
+
+# Backend every asset is written to before the request or job finishes; its URL is the one returned to clients
+STORAGE_PRIMARY = os.getenv('STORAGE_PRIMARY', 'firebase')
+# Backend holding the copy of every asset; empty to keep a single copy
+STORAGE_SECONDARY = os.getenv('STORAGE_SECONDARY', 'bucket')
+# 'async' copies to the secondary through the replication queue, 'sync' waits for both writes
+STORAGE_REPLICATION_MODE = os.getenv('STORAGE_REPLICATION_MODE', 'async')
+LOCAL_STORAGE_ROOT = os.getenv('LOCAL_STORAGE_ROOT', os.path.join(tempfile.gettempdir(), 'social-vibes-storage'))
+# URL prefix the local files are served under; file:// URLs are returned when unset
+LOCAL_STORAGE_BASE_URL = os.getenv('LOCAL_STORAGE_BASE_URL')
+
+
+class StorageBackend:
+    """
+    A place assets are written to.
+    Backends that can also read objects back let the reconcile pass repair a replica whose spooled copy is gone.
+    """
+    name = None
+
+    def upload(self, file_storage, key):
+        """
+        :return: URL of the stored object.
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def read(self, key):
+        """
+        :return: Bytes of the stored object.
+        """
+        raise NotImplementedError(f"{self.name} storage cannot read objects back")
+
+    def exists(self, key):
+        raise NotImplementedError(f"{self.name} storage cannot look up objects")
+
+    def list_page(self, prefix, page_token=None, page_size=1000):
+        """
+        Lists one page of the objects under prefix.
+
+        :return: Tuple of (list of {'key', 'size', 'updated'}, token of the next page or None after the last page).
+        """
+        raise NotImplementedError(f"{self.name} storage cannot list objects")
+
+    def key_from_url(self, url):
+        """
+        Maps a URL this backend returned back to the key of the object, covering the Firebase download URL
+        (/v0/b/<bucket>/o/<quoted key>) and the public Cloud Storage URL (storage.googleapis.com/<bucket>/<key>).
+        :return: The key, or None if the URL has neither form.
+        """
+        parsed = urlparse(url)
+        if '/o/' in parsed.path:
+            return unquote(parsed.path.split('/o/', 1)[1])
+        if parsed.netloc == 'storage.googleapis.com':
+            parts = parsed.path.lstrip('/').split('/', 1)
+            return unquote(parts[1]) if len(parts) == 2 else None
+        if parsed.netloc.endswith('.storage.googleapis.com'):
+            return unquote(parsed.path.lstrip('/')) or None
+        return None
+
+
+class FirebaseStorageBackend(StorageBackend):
+    name = 'firebase'
+
+    def upload(self, file_storage, key):
+        return community_firebase_bucket_upload_file(file_storage, key)
+
+    def delete(self, key):
+        firebase_bucket_delete_file(key)
+
+    def list_page(self, prefix, page_token=None, page_size=1000):
+        blobs = storage.bucket().list_blobs(prefix=prefix, max_results=page_size, page_token=page_token)
+        page = next(blobs.pages, [])
+        objects = [{'key': blob.name, 'size': blob.size or 0, 'updated': blob.updated} for blob in page]
+        return objects, blobs.next_page_token
+
+
+class BucketStorageBackend(StorageBackend):
+    name = 'bucket'
+
+    def upload(self, file_storage, key):
+        return bucket_upload_file(file_storage, key)
+
+    def delete(self, key):
+        bucket_delete(key)
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Keeps objects as files under a local directory, so the upload pipeline can run and be benchmarked without
+    cloud services.
+    """
+    name = 'local'
+
+    def __init__(self, root=LOCAL_STORAGE_ROOT, base_url=LOCAL_STORAGE_BASE_URL):
+        self.root = os.path.realpath(root)
+        self.base_url = base_url
+
+    def _path(self, key):
+        path = os.path.realpath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Key {key} points outside the storage directory")
+        return path
+
+    def url(self, key):
+        if self.base_url:
+            return f"{self.base_url.rstrip('/')}/{key}"
+        return Path(self._path(key)).as_uri()
+
+    def upload(self, file_storage, key):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name and renamed, so a reader never sees a partial object
+        partial_path = f"{path}.{uuid.uuid4().hex}.partial"
+        try:
+            file_storage.save(partial_path)
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        return self.url(key)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def read(self, key):
+        with open(self._path(key), 'rb') as stored:
+            return stored.read()
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def list_page(self, prefix, page_token=None, page_size=1000):
+        """
+        The token is the last key of the previous page. The directory is walked again for every page,
+        which is fine for the test and benchmark data this backend holds.
+        """
+        keys = []
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                key = os.path.relpath(os.path.join(directory, filename), self.root).replace(os.sep, '/')
+                if key.startswith(prefix) and not key.endswith('.partial'):
+                    keys.append(key)
+        keys.sort()
+        start = bisect.bisect_right(keys, page_token) if page_token else 0
+        page = keys[start:start + page_size]
+
+        objects = []
+        for key in page:
+            try:
+                stat = os.stat(self._path(key))
+            except FileNotFoundError:
+                continue
+            objects.append({'key': key, 'size': stat.st_size,
+                            'updated': datetime.fromtimestamp(stat.st_mtime, timezone.utc)})
+        next_token = page[-1] if start + page_size < len(keys) else None
+        return objects, next_token
+
+    def key_from_url(self, url):
+        if self.base_url and url.startswith(self.base_url.rstrip('/') + '/'):
+            return url[len(self.base_url.rstrip('/')) + 1:]
+        parsed = urlparse(url)
+        if parsed.scheme == 'file':
+            path = os.path.realpath(unquote(parsed.path))
+            if path.startswith(self.root + os.sep):
+                return os.path.relpath(path, self.root).replace(os.sep, '/')
+        return None
+
+
+STORAGE_BACKEND_TYPES = {
+    FirebaseStorageBackend.name: FirebaseStorageBackend,
+    BucketStorageBackend.name: BucketStorageBackend,
+    LocalStorageBackend.name: LocalStorageBackend,
+}
+
+
+def create_storage_backend(name):
+    """
+    :raises ValueError: If no backend has that name.
+    """
+    if name not in STORAGE_BACKEND_TYPES:
+        raise ValueError(f"Unknown storage backend {name}, expected one of {', '.join(STORAGE_BACKEND_TYPES)}")
+    return STORAGE_BACKEND_TYPES[name]()
+
+
+primary_storage = create_storage_backend(STORAGE_PRIMARY)
+secondary_storage = create_storage_backend(STORAGE_SECONDARY) if STORAGE_SECONDARY else None
+
+
+def storage_backends():
+    """
+    Every configured backend, primary first.
+    """
+    return [backend for backend in (primary_storage, secondary_storage) if backend is not None]
+
+
+def get_storage_backend(name):
+    """
+    :return: The configured backend with that name, or None.
+    """
+    return next((backend for backend in storage_backends() if backend.name == name), None)
+
+
+def replicates_async():
+    return secondary_storage is not None and STORAGE_REPLICATION_MODE == 'async'
@@ -0,0 +1,292 @@
+import logging
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+import uuid
+
+from werkzeug.datastructures import FileStorage
+
+from scripts.management.Community.community_storage_backends import get_storage_backend, primary_storage, \
+    secondary_storage, storage_backends, STORAGE_REPLICATION_MODE
+from scripts.modules.mysql.Communities.community_replication_queries import query_create_replication, \
+    query_get_replication, query_get_claimable_replication_ids, query_get_replications_to_reconcile, \
+    query_start_replication, query_renew_replication_lease, query_complete_replication, query_fail_replication, \
+    query_reset_replication, query_cancel_replications, query_count_replications, \
+    UNFINISHED_REPLICATION_STATUSES, REPLICATION_CANCELLED
+
+# Local directory holding the bytes of every object until its replica has been written. Spool files only
+# exist on the host that wrote them; a worker on another host leaves such a replication to be retried.
+REPLICATION_SPOOL_DIR = os.getenv('REPLICATION_SPOOL_DIR',
+                                  os.path.join(tempfile.gettempdir(), 'social-vibes-replication-spool'))
+REPLICATION_WORKERS = int(os.getenv('REPLICATION_WORKERS', 2))
+REPLICATION_MAX_ATTEMPTS = int(os.getenv('REPLICATION_MAX_ATTEMPTS', 8))
+# Delay before the first retry, doubled after every further failed attempt
+REPLICATION_RETRY_SECONDS = float(os.getenv('REPLICATION_RETRY_SECONDS', 5))
+# How often the reconcile pass runs, and how long an unfinished replication may sit still before it is requeued
+REPLICATION_RECONCILE_SECONDS = int(os.getenv('REPLICATION_RECONCILE_SECONDS', 600))
+REPLICATION_STALE_SECONDS = int(os.getenv('REPLICATION_STALE_SECONDS', 900))
+REPLICATION_RECONCILE_BATCH = 200
+# A running copy is renewed a few times per lease; once its lease runs out, another worker may take it over
+REPLICATION_LEASE_SECONDS = int(os.getenv('REPLICATION_LEASE_SECONDS', 300))
+# How often workers look for replications left behind by a stopped process or by another host
+REPLICATION_SWEEP_SECONDS = int(os.getenv('REPLICATION_SWEEP_SECONDS', 60))
+# Identifies this process as the owner of the replications it copies
+REPLICATION_WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def _spool(data):
+    """
+    :return: Path of a new spool file holding data.
+    """
+    os.makedirs(REPLICATION_SPOOL_DIR, exist_ok=True)
+    spool_path = os.path.join(REPLICATION_SPOOL_DIR, uuid.uuid4().hex)
+    with open(spool_path, 'wb') as spooled:
+        spooled.write(data)
+    return spool_path
+
+
+def _discard_spool(spool_path):
+    try:
+        os.remove(spool_path)
+    except OSError:
+        pass
+
+
+class ReplicationQueue:
+    """
+    Background workers that copy objects already written to the primary storage backend to the secondary.
+    Every replication is a row in assetReplication, so copies owed at a restart are picked up again; failed
+    attempts are retried with exponential backoff, and a periodic reconcile pass requeues what is left over.
+    A replication is claimed in the database and held under a lease the worker keeps renewing, as asset jobs
+    are, so it is copied by one worker at a time; ones left behind by a stopped process, or by a worker on a host
+    without their spool file, are picked up by the periodic sweep.
+    """
+
+    def __init__(self, workers=REPLICATION_WORKERS, max_attempts=REPLICATION_MAX_ATTEMPTS,
+                 retry_seconds=REPLICATION_RETRY_SECONDS, lease_seconds=REPLICATION_LEASE_SECONDS,
+                 sweep_seconds=REPLICATION_SWEEP_SECONDS):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.lease_seconds = lease_seconds
+        self.sweep_seconds = sweep_seconds
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._held = set()
+        self._held_lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        """
+        Starts the workers, the heartbeat, the sweep and the reconcile loop on first use and queues the
+        replications that are waiting to be claimed.
+        """
+        with self._lock:
+            if self._started:
+                return
+            for index in range(self.workers):
+                threading.Thread(target=self._run, name=f'asset-replication-{index}', daemon=True).start()
+            threading.Thread(target=self._heartbeat_loop, name='asset-replication-heartbeat', daemon=True).start()
+            threading.Thread(target=self._sweep_loop, name='asset-replication-sweep', daemon=True).start()
+            threading.Thread(target=self._reconcile_loop, name='asset-replication-reconcile', daemon=True).start()
+            for replication_id in query_get_claimable_replication_ids(0):
+                self._queue.put(replication_id)
+            self._started = True
+
+    def enqueue(self, replication_id):
+        self.start()
+        self._queue.put(replication_id)
+
+    def _run(self):
+        while True:
+            replication_id = self._queue.get()
+            try:
+                self._process(replication_id)
+            except Exception:
+                logging.exception(f"Replication {replication_id} crashed")
+            finally:
+                self._queue.task_done()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(max(self.lease_seconds / 3, 1))
+            with self._held_lock:
+                held = list(self._held)
+            for replication_id in held:
+                try:
+                    if not query_renew_replication_lease(replication_id, REPLICATION_WORKER_ID, self.lease_seconds):
+                        logging.warning(f"Lost the lease on replication {replication_id}")
+                except Exception:
+                    logging.exception(f"Could not renew the lease on replication {replication_id}")
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_seconds)
+            try:
+                # Replications idle for a whole lease were queued by a process that is gone or on another host
+                for replication_id in query_get_claimable_replication_ids(self.lease_seconds):
+                    self._queue.put(replication_id)
+            except Exception:
+                logging.exception("Replication sweep failed")
+
+    def _reconcile_loop(self):
+        while True:
+            time.sleep(REPLICATION_RECONCILE_SECONDS)
+            try:
+                reconcile_replication()
+            except Exception:
+                logging.exception("Replication reconcile pass failed")
+
+    def _process(self, replication_id):
+        replication = query_get_replication(replication_id)
+        if replication is None or replication['status'] not in UNFINISHED_REPLICATION_STATUSES:
+            return
+        if not query_start_replication(replication_id, REPLICATION_WORKER_ID, self.lease_seconds):
+            # Already copied by another worker, or cancelled or finished since it was queued
+            return
+        with self._held_lock:
+            self._held.add(replication_id)
+        try:
+            self._copy(query_get_replication(replication_id))
+        finally:
+            with self._held_lock:
+                self._held.discard(replication_id)
+
+    def _copy(self, replication):
+        replication_id = replication['replicationId']
+        attempts = replication['attempts']
+
+        target = get_storage_backend(replication['target'])
+        if target is None:
+            query_fail_replication(replication_id, REPLICATION_WORKER_ID,
+                                   f"Storage backend {replication['target']} is not configured", final=True)
+            return
+
+        key = replication['key']
+        try:
+            with open(replication['spoolPath'], 'rb') as spooled:
+                target.upload(FileStorage(stream=spooled, filename=os.path.basename(key),
+                                          content_type=replication['contentType']), key)
+        except OSError as e:
+            if replication['spoolPath'] is None or not os.path.exists(replication['spoolPath']):
+                # The spool file may only exist on another host, whose sweep picks the replication up; once its
+                # attempts are used up the reconcile pass reads the object back from the source if it can
+                query_fail_replication(replication_id, REPLICATION_WORKER_ID, f"Spooled copy unavailable: {e}",
+                                       final=attempts >= self.max_attempts)
+                return
+            self._retry(replication_id, attempts, e)
+            return
+        except Exception as e:
+            self._retry(replication_id, attempts, e)
+            return
+
+        if query_complete_replication(replication_id, REPLICATION_WORKER_ID):
+            _discard_spool(replication['spoolPath'])
+            return
+        current = query_get_replication(replication_id)
+        if current is not None and current['status'] == REPLICATION_CANCELLED:
+            # The object was deleted while it was being copied
+            target.delete(key)
+            _discard_spool(replication['spoolPath'])
+        else:
+            # Another worker took the replication over and still needs the spool file
+            logging.warning(f"Replication {replication_id} was taken over by another worker before it completed here")
+
+    def _retry(self, replication_id, attempts, error):
+        final = attempts >= self.max_attempts
+        if not query_fail_replication(replication_id, REPLICATION_WORKER_ID, str(error) or type(error).__name__,
+                                      final=final):
+            logging.warning(f"Replication {replication_id} was taken over by another worker; its failure is not "
+                            f"recorded")
+            return
+        if final:
+            logging.error(f"Replication {replication_id} failed after {attempts} attempts: {error}")
+            return
+        delay = self.retry_seconds * 2 ** (attempts - 1)
+        timer = threading.Timer(delay, self._queue.put, args=(replication_id,))
+        timer.daemon = True
+        timer.start()
+
+
+replication_queue = ReplicationQueue()
+
+
+def replicate(data, key, content_type=None):
+    """
+    Records that the object just written to the primary is owed to the secondary, and queues the copy.
+
+    :param data: Bytes of the object, spooled to disk until the copy is written.
+    :return: The ID of the replication.
+    """
+    spool_path = _spool(data)
+    try:
+        replication_id = query_create_replication(secondary_storage.name, primary_storage.name, key, spool_path,
+                                                  content_type)
+    except Exception:
+        _discard_spool(spool_path)
+        raise
+    replication_queue.enqueue(replication_id)
+    return replication_id
+
+
+def cancel_replications(keys):
+    """
+    Stops outstanding copies of objects that are being deleted, so a late copy does not bring them back.
+    """
+    replication_queue.start()
+    for spool_path in query_cancel_replications(keys):
+        _discard_spool(spool_path)
+
+
+def reconcile_replication():
+    """
+    Requeues failed replications and those that stalled, e.g. because the process stopped mid-copy.
+    A replication whose spooled copy is gone is spooled again from its source backend when it can read objects back.
+
+    :return: Dictionary with the number of requeued replications and of those that could not be recovered.
+    """
+    replication_queue.start()
+    requeued = 0
+    unrecoverable = 0
+    for replication in query_get_replications_to_reconcile(REPLICATION_STALE_SECONDS, REPLICATION_RECONCILE_BATCH):
+        spool_path = replication['spoolPath']
+        if spool_path is None or not os.path.exists(spool_path):
+            source = get_storage_backend(replication['source'])
+            try:
+                spool_path = _spool(source.read(replication['key']))
+            except Exception as e:
+                logging.warning(f"Replication {replication['replicationId']} cannot be recovered: {e}")
+                unrecoverable += 1
+                continue
+        if not query_reset_replication(replication['replicationId'], spool_path):
+            # Claimed, finished or cancelled since it was read
+            if spool_path != replication['spoolPath']:
+                _discard_spool(spool_path)
+            continue
+        replication_queue.enqueue(replication['replicationId'])
+        requeued += 1
+    return {"requeued": requeued, "unrecoverable": unrecoverable}
+
+
+def manage_get_replication_status():
+    """
+    Reports the storage backends in use and how many replications are in each state.
+    """
+    replication_queue.start()
+    return {
+        "primary": primary_storage.name,
+        "secondary": secondary_storage.name if secondary_storage is not None else None,
+        "mode": STORAGE_REPLICATION_MODE,
+        "backends": [backend.name for backend in storage_backends()],
+        "replications": query_count_replications(),
+    }, 200
+
+
+def manage_reconcile_replication():
+    """
+    Runs the reconcile pass now instead of waiting for the next periodic run.
+    """
+    return reconcile_replication(), 200
@@ -8,7 +8,10 @@ from scripts.modules.mysql.Communities.member.community_member_queries import \
     deny_query_community_invite, accept_query_community_invite, community_query_request, get_query_community_requests, \
     get_query_community_request_by_id, get_query_community_invites, query_add_community_user, \
     query_remove_user_from_community, query_leave_community, query_community_user_promote, query_community_user_demote, \
-    query_community_user_change_owner
+    query_community_user_change_owner, query_get_member_roles, query_bulk_invite, MAX_BULK_USERS, \
+    BULK_INVITED, query_bulk_resolve_requests, BULK_ACCEPTED, BULK_DENIED, query_bulk_moderate, MODERATION_ACTIONS
+from scripts.modules.mysql.Communities.community_queries import community_query_invalidate_community, \
+    COMMUNITY_ROLES
 
 
 def manage_get_community_requests(community_id):
@@ -65,6 +68,7 @@ def manage_accept_community_request(user_id, community_id):
         """
     try:
         accept_query_community_request(user_id, community_id)
+        community_query_invalidate_community(community_id)
         return {"message": "Community request accepted successfully"}, 200
     except SQLAlchemyError as e:
         # Log the error or handle it according to your error management strategy
@@ -93,6 +97,103 @@ def manage_deny_community_request(community_id, user_id):
         return {"error": "An unexpected error occurred"}, 500
 
 
+def _dedupe_user_ids(user_ids):
+    """
+    :return: Tuple of (user IDs without duplicates in request order, error response or None).
+    """
+    if not user_ids:
+        return None, ({"message": "At least one user ID is required"}, 400)
+    user_ids = list(dict.fromkeys(user_ids))
+    if len(user_ids) > MAX_BULK_USERS:
+        return None, ({"message": f"At most {MAX_BULK_USERS} users can be handled at once"}, 400)
+    return user_ids, None
+
+
+def _bulk_results(user_ids, statuses):
+    """
+    :param statuses: Dictionary of user ID to (status, error message or None).
+    :return: List with the outcome for every user, in request order.
+    """
+    results = []
+    for user_id in user_ids:
+        status, error = statuses[user_id]
+        result = {"userId": user_id, "status": status}
+        if error:
+            result["error"] = error
+        results.append(result)
+    return results
+
+
+def _is_moderator(community_id, user_id):
+    """
+    True when the user is the owner or a moderator of the community.
+    """
+    role = query_get_member_roles(community_id, [user_id]).get(user_id)
+    return role in (COMMUNITY_ROLES['owner'], COMMUNITY_ROLES['moderator'])
+
+
+def manage_resolve_community_requests(requester_id, community_id, user_ids, accept):
+    """
+    Accepts or denies many join requests in one call.
+
+    :param requester_id: ID of the user handling the requests, who has to be the owner or a moderator
+    :param community_id: ID of the community the requests were made to
+    :param user_ids: IDs of the users whose requests are handled
+    :param accept: True to accept the requests, False to deny them
+    :return: JSON object with the status of every user: accepted or denied, no_request, already_member or failed
+    """
+    user_ids, error = _dedupe_user_ids(user_ids)
+    if error:
+        return error
+    if not _is_moderator(community_id, requester_id):
+        return {"message": "Only the owner and moderators can handle join requests"}, 403
+
+    results = _bulk_results(user_ids, query_bulk_resolve_requests(community_id, user_ids, accept))
+    done_status = BULK_ACCEPTED if accept else BULK_DENIED
+    done = sum(1 for result in results if result['status'] == done_status)
+    if accept and done:
+        community_query_invalidate_community(community_id)
+    return {"message": f"{done} of {len(user_ids)} requests {done_status}", "results": results}, 200
+
+
+def manage_moderate_community_members(requester_id, community_id, changes):
+    """
+    Removes, promotes and demotes many members in one call. The requester's role is checked once up front.
+
+    :param requester_id: ID of the user making the changes, who has to be the owner or a moderator
+    :param community_id: ID of the community
+    :param changes: List of {"user_id": ..., "action": "remove" | "promote" | "demote"}, at most one per user
+    :return: JSON object with the status of every user
+    """
+    if not changes:
+        return {"message": "At least one change is required"}, 400
+    if len(changes) > MAX_BULK_USERS:
+        return {"message": f"At most {MAX_BULK_USERS} users can be handled at once"}, 400
+    pairs = []
+    for change in changes:
+        user_id, action = change.get('user_id'), change.get('action')
+        if not isinstance(user_id, str) or not user_id or action not in MODERATION_ACTIONS:
+            return {"message": f"Every change needs a user_id and an action of {', '.join(MODERATION_ACTIONS)}"}, 400
+        pairs.append((user_id, action))
+    user_ids = [user_id for user_id, _ in pairs]
+    if len(set(user_ids)) != len(user_ids):
+        return {"message": "Each user can only be changed once per call"}, 400
+
+    requester_role = query_get_member_roles(community_id, [requester_id]).get(requester_id)
+    if requester_role not in (COMMUNITY_ROLES['owner'], COMMUNITY_ROLES['moderator']):
+        return {"message": "Only the owner and moderators can moderate members"}, 403
+
+    statuses = query_bulk_moderate(requester_id, requester_role, community_id, pairs)
+    results = _bulk_results(user_ids, statuses)
+    applied = 0
+    for result, (_, action) in zip(results, pairs):
+        result["action"] = action
+        applied += result["status"] == MODERATION_ACTIONS[action][1]
+    if applied:
+        community_query_invalidate_community(community_id)
+    return {"message": f"{applied} of {len(pairs)} changes applied", "results": results}, 200
+
+
 def manage_get_community_invitations(user_id):
     """
     Retrieves all community invitations for the authenticated user and returns them as a JSON array.
@@ -121,6 +222,26 @@ def manage_send_community_invite(user_id, community_id):
         return {"error": str(e)}, 500
 
 
+def manage_send_community_invites(requester_id, community_id, user_ids):
+    """
+    Invites many users to a community in one call.
+
+    :param requester_id: ID of the user sending the invites, who has to be a member of the community
+    :param community_id: ID of the community the users are invited to
+    :param user_ids: IDs of the users to invite
+    :return: JSON object with the status of every user: invited, already_member, already_invited or failed
+    """
+    user_ids, error = _dedupe_user_ids(user_ids)
+    if error:
+        return error
+    if requester_id not in query_get_member_roles(community_id, [requester_id]):
+        return {"message": "Only members can invite users to the community"}, 403
+
+    results = _bulk_results(user_ids, query_bulk_invite(community_id, user_ids))
+    invited = sum(1 for result in results if result['status'] == BULK_INVITED)
+    return {"message": f"{invited} of {len(user_ids)} users invited", "results": results}, 200
+
+
 def manage_accept_community_invite(user_id, community_id):
     """
             Manages the acceptance of a community join request.
@@ -131,6 +252,7 @@ def manage_accept_community_invite(user_id, community_id):
             """
     try:
         accept_query_community_invite(user_id, community_id)
+        community_query_invalidate_community(community_id)
         return {"message": "Community invite has been accepted"}, 200
     except SQLAlchemyError as e:
         # Log the error or handle it according to your error management strategy
@@ -162,6 +284,7 @@ def manage_deny_community_invite(community_id, user_id):
 def manage_add_community_user(user_id, community_id):
     try:
         query_add_community_user(user_id, community_id)
+        community_query_invalidate_community(community_id)
         return {"message": "User successfully added to the community"}, 201
     except Exception as e:
         return {"error": str(e)}, 500
@@ -170,6 +293,7 @@ def manage_add_community_user(user_id, community_id):
 def manage_remove_user_from_community(requester_user_id, user_id, community_id):
     try:
         query_remove_user_from_community(requester_user_id, user_id, community_id)
+        community_query_invalidate_community(community_id)
         return {"message": "User successfully removed from the community"}, 200
     except Exception as e:
         return {"error": str(e)}, 500
@@ -178,6 +302,7 @@ def manage_remove_user_from_community(requester_user_id, user_id, community_id):
 def manage_leave_community(user_id, community_id):
     try:
         query_leave_community(user_id, community_id)
+        community_query_invalidate_community(community_id)
         return {"message": "User successfully left the community"}, 200
     except Exception as e:
         return {"error": str(e)}, 500
@@ -1,17 +1,17 @@
-from sqlalchemy import text
 from flask import request
 
-from sqlalchemy.orm import sessionmaker
-
-from scripts.management.Community.community_managenment import upload_community_assets
-from scripts.modules.buckets.buckets import bucket_upload_file
-from scripts.modules.firebase.firebase_buckets import community_firebase_bucket_upload_file
+from scripts.management.Community.community_asset_jobs import create_asset_jobs, enqueue_asset_jobs, \
+    discard_staged_asset
+from scripts.management.Community.community_managenment import version_conflict_response
 from scripts.modules.mysql.Communities.post.community_post_queries import query_get_community_post_by_id, \
     query_get_all_community_user_posts, query_get_all_community_posts, query_create_community_post, \
-    query_update_community_post, query_delete_community_post, query_hide_community_post, query_show_community_post
-from scripts.setup.db_setup import engine
-
-Session = sessionmaker(bind=engine)
+    query_update_community_post, query_delete_community_post, query_hide_community_post, query_show_community_post, \
+    query_get_community_posts_page, query_get_community_posts_by_ids, query_invalidate_community_post
+from scripts.modules.mysql.Communities.community_asset_blob_queries import query_release_assets
+from scripts.modules.mysql.Communities.community_queries import MAX_BATCH_IDS
+from scripts.modules.mysql.Communities.community_updates import POST_UPDATE_FIELDS, VersionConflict, diff_updates, \
+    version_matches
+from scripts.modules.mysql.db_session import Session
 
 
 def manage_get_all_community_user_posts(user_id):
@@ -36,6 +36,25 @@ def manage_get_community_post_by_id(community_id, post_id):
         return {"error": str(e)}, 500
 
 
+def manage_get_community_posts_by_ids(post_ids):
+    """
+    Retrieves many posts in one request.
+
+    :param post_ids: List of post IDs to look up
+    :return: JSON object with the posts in request order and the IDs that were not found
+    """
+    if not post_ids:
+        return {"message": "At least one post ID is required"}, 400
+    if len(post_ids) > MAX_BATCH_IDS:
+        return {"message": f"At most {MAX_BATCH_IDS} post IDs can be requested at once"}, 400
+
+    try:
+        posts, missing = query_get_community_posts_by_ids(post_ids)
+        return {"posts": posts, "missing": missing}, 200
+    except Exception as e:
+        return {"error": str(e)}, 500
+
+
 def manage_get_all_community_posts(community_id):
     try:
         posts = query_get_all_community_posts(community_id)
@@ -47,16 +66,36 @@ def manage_get_all_community_posts(community_id):
         return {"error": str(e)}, 500
 
 
+def manage_get_community_posts_page(community_id, limit=None, after=None):
+    """
+    Returns one page of a community feed together with the cursor for the next page.
+
+    :param community_id: ID of the community whose posts are requested.
+    :param limit: Maximum number of posts in the page.
+    :param after: Cursor returned with the previous page, or None for the first page.
+    :return: A tuple containing the page dictionary and a status code.
+    """
+    try:
+        posts, next_cursor = query_get_community_posts_page(community_id, limit, after)
+        return {"posts": posts, "next_cursor": next_cursor}, 200
+    except ValueError as e:
+        return {"message": str(e)}, 400
+    except Exception as e:
+        return {"error": str(e)}, 500
+
+
 def manage_create_community_post(args, community_id):
     """
-    Creates a new community post using the provided details.
-    Optionally handles image uploads if an image is provided.
+    Creates a new community post using the provided details and commits it straight away.
+    An optional image is staged and uploaded by the background asset workers, which fill in the image path
+    once it has reached storage.
 
     Parameters:
         args (dict): Dictionary containing 'description' and optionally 'image_path'.
         community_id (int): The ID of the community to which the post belongs.
     """
     session = Session()
+    staged = []
     try:
         session.begin()
         # Fetch the current user's ID from request context or args
@@ -69,42 +108,56 @@ def manage_create_community_post(args, community_id):
             description=args['description']
         )
 
-        # Check if an image was provided and upload it
+        # Check if an image was provided and record its upload as a job in the same transaction
+        job_ids = []
         if 'image_path' in args and args['image_path']:
-            upload_results = upload_community_post_image(community_id, args['image_path'], post_id)
-
-            if 'imagePath' not in upload_results[0] or upload_results[1] != 200:
-                session.rollback()  # Rollback the transaction if the image upload fails
-                return {"message": "Failed to upload image", "error": upload_results[0].get('message', 'Unknown error')}, 500
+            image_bucket_filename = f"communities/{community_id}/posts/communityPost{post_id}.jpg"
+            job_ids = create_asset_jobs(session, 'post', post_id, community_id,
+                                        {'image': (args['image_path'], image_bucket_filename)}, staged)
 
-            imageUrl = upload_results[0].get('imagePath')
-
-            # Update the community post record with the image URL
-            session.execute(
-                text("UPDATE communityPost SET communityPost_imagePath = :imageUrl WHERE communityPost_postId = :post_id"),
-                {'imageUrl': imageUrl, 'post_id': post_id}
-            )
-        else:
-            imageUrl = None
-
-        session.commit()  # Commit the transaction if all operations succeed
-        return {"message": "Post created successfully", "imagePath": imageUrl}, 201
+        session.commit()  # The post is visible now; the image path is filled in by the workers
+        enqueue_asset_jobs(job_ids)
+        return {"message": "Post created successfully", "postId": post_id,
+                "assetStatus": "pending" if job_ids else "none", "assetJobs": job_ids}, 201
 
     except Exception as e:
         session.rollback()
+        for staging_path in staged:
+            discard_staged_asset(staging_path)
         return {"message": str(e)}, 500
+    finally:
+        session.close()
 
 
-def manage_update_community_post(post_id, updates):
+def manage_update_community_post(community_id, post_id, updates, expected_version=None):
     """
     Update a community post's attributes based on the provided updates json.
+    Only fields whose value changes are written; an update that changes nothing does not touch the database.
+
+    :param expected_version: Version of the post the client edited. When given, the update is refused with 409
+        if the post has been written since.
     """
     if not post_id:
         return {"message": "Post ID is required for updates."}, 400
 
     try:
-        query_update_community_post(post_id, updates)
-        return {"message": "Post updated successfully"}, 200
+        # Compared against the row itself rather than the per-process cache, which may be older than the last write
+        current = query_get_community_post_by_id(post_id, fresh=True)
+        if current is None:
+            return {"message": "Post not found"}, 404
+        if expected_version is not None and not version_matches(current, expected_version):
+            return version_conflict_response(current)
+
+        updates = diff_updates(current, updates, POST_UPDATE_FIELDS)
+        if not updates:
+            return {"message": "Post unchanged", "version": current['version']}, 200
+
+        version = query_update_community_post(post_id, updates, expected_version)
+        query_invalidate_community_post(post_id)
+        return {"message": "Post updated successfully", "updated": sorted(updates), "version": version}, 200
+    except VersionConflict as e:
+        query_invalidate_community_post(post_id)
+        return version_conflict_response(e.document)
     except Exception as e:
         return {"message": str(e)}, 500
 
@@ -115,6 +168,8 @@ def manage_delete_community_post(post_id):
     """
     try:
         query_delete_community_post(post_id)
+        query_invalidate_community_post(post_id)
+        query_release_assets('post', post_id)
         return {"message": "Post deleted successfully"}, 200
     except Exception as e:
         return {"message": str(e)}, 500
@@ -126,6 +181,7 @@ def manage_hide_community_post(post_id):
     """
     try:
         query_hide_community_post(post_id)
+        query_invalidate_community_post(post_id)
         return {"message": "Post hidden successfully"}, 200
     except Exception as e:
         return {"message": str(e)}, 500
@@ -137,47 +193,8 @@ def manage_show_community_post(post_id):
     """
     try:
         query_show_community_post(post_id)
+        query_invalidate_community_post(post_id)
         return {"message": "Post shown successfully"}, 200
     except Exception as e:
         return {"message": str(e)}, 500
 
-
-def upload_community_post_image(community_id, image, post_id):
-    """
-    Uploads community logo and banner images to Firebase and another storage bucket, and updates community details with new image URLs.
-
-    Parameters:
-        community_id (int): The ID of the community to update.
-        args (dict): Dictionary containing 'image_path' and 'banner_path' keys with file storage objects as values.
-
-    Returns:
-        dict: Result message indicating success or failure, including HTTP status codes.
-        :param image:
-        :param community_id:
-        :param post_id:
-    """
-    try:
-        # Construct new paths for storing the images using the community ID
-        image_bucket_filename = f"communities/{community_id}/posts/communityPost{post_id}.jpg"
-
-        # Upload the logo to Firebase and another bucket, and retrieve the URL
-        image_url = community_firebase_bucket_upload_file(image, image_bucket_filename)
-        bucket_upload_file(image, image_bucket_filename)
-
-        # Check if either URL failed to be retrieved (assuming None as failure)
-        if image_url is None:
-            failure_message = "Failed to upload " + ("logo." if image_url is None else "banner.")
-            return {"message": failure_message}, 500
-
-        # Successful upload response
-        return {
-            "message": "Assets uploaded successfully.",
-            "imagePath": image_url,
-        }, 200
-
-    except KeyError as e:
-        # Handle missing keys in the args dictionary
-        return {"message": f"Missing key: {e.args[0]} - required image path or banner path not provided."}, 400
-    except Exception as e:
-        # General exception handling for any other unforeseen errors
-        return {"message": f"An error occurred: {str(e)}"}, 500
@@ -0,0 +1,251 @@
+import json
+
+from sqlalchemy import exc, text, bindparam
+
+from scripts.handler.error_handler import SQLAlchemyError
+from scripts.modules.mysql.db_session import Session
+from scripts.modules.mysql.Communities.community_asset_job_queries import order_asset_assignment
+from scripts.modules.mysql.Communities.community_queries import MEMBER_ROLES_SQL
+
+# Number of rows pulled from the server side cursor per round trip while streaming
+STREAM_BATCH_SIZE = 1000
+
+# Where each kind of asset is stored: (table, key column, URL column, variant URLs column)
+ASSET_TARGET_COLUMNS = {
+    ('community', 'logo'): ('community', 'community_id', 'community_imagePath', 'community_imageVariants'),
+    ('community', 'banner'): ('community', 'community_id', 'community_bannerPath', 'community_bannerVariants'),
+    ('post', 'image'): ('communityPost', 'communityPost_postId', 'communityPost_imagePath',
+                        'communityPost_imageVariants'),
+}
+# Row version column of each table, incremented whenever an image of the row changes
+ASSET_VERSION_COLUMNS = {
+    'community': 'community_version',
+    'communityPost': 'communityPost_version',
+}
+
+def query_get_asset_hash(entity_type, entity_id, asset_name):
+    """
+    :return: Hash of the blob the asset currently uses, or None if it has none.
+    """
+    with Session() as session:
+        try:
+            return session.execute(
+                text("SELECT assetRef_hash FROM assetRef WHERE assetRef_entityType = :p_entity_type "
+                     "AND assetRef_entityId = :p_entity_id AND assetRef_assetName = :p_asset_name"),
+                {'p_entity_type': entity_type, 'p_entity_id': entity_id, 'p_asset_name': asset_name}).scalar()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_get_asset_blob(content_hash):
+    """
+    :return: Dictionary with hash, url and variants of a stored blob, or None if these bytes were never stored.
+    """
+    with Session() as session:
+        try:
+            row = session.execute(
+                text("SELECT assetBlob_hash, assetBlob_url, assetBlob_variants FROM assetBlob "
+                     "WHERE assetBlob_hash = :p_hash"),
+                {'p_hash': content_hash}).fetchone()
+            if row is None:
+                return None
+            variants = json.loads(row[2]) if isinstance(row[2], (str, bytes)) else row[2]
+            return {'hash': row[0], 'url': row[1], 'variants': variants}
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_save_asset_blob(content_hash, url, variants):
+    """
+    Records a newly uploaded blob. Two requests storing the same bytes at once both end up with the same row.
+    """
+    with Session() as session:
+        try:
+            session.execute(
+                text("INSERT INTO assetBlob (assetBlob_hash, assetBlob_url, assetBlob_variants) "
+                     "VALUES (:p_hash, :p_url, :p_variants) "
+                     "ON DUPLICATE KEY UPDATE assetBlob_url = VALUES(assetBlob_url), "
+                     "assetBlob_variants = VALUES(assetBlob_variants)"),
+                {'p_hash': content_hash, 'p_url': url, 'p_variants': json.dumps(variants)})
+            session.commit()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_assign_asset(entity_type, entity_id, community_id, asset_name, content_hash, url, variants, job_id=None):
+    """
+    Points an asset at a stored blob and writes its URLs onto the community or post in one transaction,
+    moving one reference from the previous blob to the new one.
+    Assignments of an asset are ordered by order_asset_assignment, so a job retried after a later upload of the
+    same asset does not replace it.
+
+    :param job_id: ID of the asset job assigning the blob, or None for a synchronous upload.
+    :return: False if nothing was changed, because the asset already used this blob or the job has been
+        superseded by a later upload, otherwise True.
+    :raises LookupError: If the blob no longer exists.
+    """
+    table, key_column, url_column, variants_column = ASSET_TARGET_COLUMNS[(entity_type, asset_name)]
+    ref_params = {'p_entity_type': entity_type, 'p_entity_id': entity_id, 'p_asset_name': asset_name}
+
+    with Session() as session:
+        try:
+            if not order_asset_assignment(session, entity_type, entity_id, asset_name, job_id):
+                # Keeps the job marked superseded
+                session.commit()
+                return False
+
+            previous_hash = session.execute(
+                text("SELECT assetRef_hash FROM assetRef WHERE assetRef_entityType = :p_entity_type "
+                     "AND assetRef_entityId = :p_entity_id AND assetRef_assetName = :p_asset_name FOR UPDATE"),
+                ref_params).scalar()
+            if previous_hash == content_hash:
+                # The older jobs stay superseded, the asset already shows the latest upload
+                session.commit()
+                return False
+
+            claimed = session.execute(
+                text("UPDATE assetBlob SET assetBlob_refCount = assetBlob_refCount + 1 WHERE assetBlob_hash = :p_hash"),
+                {'p_hash': content_hash})
+            if claimed.rowcount == 0:
+                session.rollback()
+                raise LookupError(f"Asset blob {content_hash} does not exist")
+
+            session.execute(
+                text("INSERT INTO assetRef (assetRef_entityType, assetRef_entityId, assetRef_assetName, "
+                     "assetRef_communityId, assetRef_hash) "
+                     "VALUES (:p_entity_type, :p_entity_id, :p_asset_name, :p_community_id, :p_hash) "
+                     "ON DUPLICATE KEY UPDATE assetRef_hash = VALUES(assetRef_hash)"),
+                dict(ref_params, p_community_id=community_id, p_hash=content_hash))
+            if previous_hash is not None:
+                session.execute(
+                    text("UPDATE assetBlob SET assetBlob_refCount = GREATEST(assetBlob_refCount - 1, 0) "
+                         "WHERE assetBlob_hash = :p_hash"),
+                    {'p_hash': previous_hash})
+
+            session.execute(
+                text(f"UPDATE {table} SET {url_column} = :p_url, {variants_column} = :p_variants, "
+                     f"{ASSET_VERSION_COLUMNS[table]} = {ASSET_VERSION_COLUMNS[table]} + 1 "
+                     f"WHERE {key_column} = :p_entity_id"),
+                {'p_url': url, 'p_variants': json.dumps(variants), 'p_entity_id': entity_id})
+            session.commit()
+            return True
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def _release_refs(where, params):
+    with Session() as session:
+        try:
+            # Grouped first, since one entity may reference the same blob from several assets
+            session.execute(
+                text("UPDATE assetBlob b JOIN (SELECT assetRef_hash, COUNT(*) AS refs FROM assetRef "
+                     f"WHERE {where} GROUP BY assetRef_hash) r ON r.assetRef_hash = b.assetBlob_hash "
+                     "SET b.assetBlob_refCount = GREATEST(b.assetBlob_refCount - r.refs, 0)"),
+                params)
+            session.execute(text(f"DELETE FROM assetRef WHERE {where}"), params)
+            session.commit()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_release_assets(entity_type, entity_id):
+    """
+    Drops every reference held by a community or post, e.g. when it is deleted.
+    The blobs themselves stay until garbage collection finds them unreferenced.
+    """
+    _release_refs("assetRef_entityType = :p_entity_type AND assetRef_entityId = :p_entity_id",
+                  {'p_entity_type': entity_type, 'p_entity_id': entity_id})
+
+
+def query_release_community_assets(community_id):
+    """
+    Drops the references of a community and of all of its posts.
+    """
+    _release_refs("assetRef_communityId = :p_community_id", {'p_community_id': community_id})
+
+
+def query_get_visible_asset_hashes(user_id, content_hashes):
+    """
+    :return: Set of the given blob hashes used by at least one community the user can see, i.e. a public
+             community or a private one they are a member of.
+    """
+    if not content_hashes:
+        return set()
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("SELECT DISTINCT r.assetRef_hash FROM assetRef r "
+                     "JOIN community c ON c.community_id = r.assetRef_communityId "
+                     "WHERE r.assetRef_hash IN :p_hashes AND (c.community_IsPrivate = 0 OR EXISTS ("
+                     "SELECT 1 FROM communityUser cu WHERE cu.communityUser_communityId = c.community_id "
+                     "AND cu.communityUser_userId = :p_user_id "
+                     f"AND cu.communityUser_role IN {MEMBER_ROLES_SQL}))")
+                .bindparams(bindparam('p_hashes', expanding=True)),
+                {'p_hashes': list(content_hashes), 'p_user_id': user_id}).fetchall()
+            return {row[0] for row in result}
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_stream_live_blob_hashes(grace_seconds):
+    """
+    Streams the hashes of blobs that are referenced, or were written too recently to be collected,
+    e.g. a blob saved by an upload that has not been assigned yet.
+    """
+    session = Session()
+    try:
+        result = session.execute(
+            text("SELECT assetBlob_hash FROM assetBlob WHERE assetBlob_refCount > 0 "
+                 "OR assetBlob_updatedAt >= NOW() - INTERVAL :p_grace_seconds SECOND"),
+            {'p_grace_seconds': grace_seconds}, execution_options={'stream_results': True})
+        for row in result.yield_per(STREAM_BATCH_SIZE):
+            yield row[0]
+    except exc.SQLAlchemyError as e:
+        session.rollback()
+        raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+    finally:
+        session.close()
+
+
+def query_get_dead_blob_hashes(grace_seconds, after, limit):
+    """
+    :param after: Hash the previous page ended at, or an empty string for the first page.
+    :return: Hashes of blobs no asset has referenced for at least grace_seconds, in hash order.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("SELECT assetBlob_hash FROM assetBlob WHERE assetBlob_refCount = 0 "
+                     "AND assetBlob_updatedAt < NOW() - INTERVAL :p_grace_seconds SECOND "
+                     "AND assetBlob_hash > :p_after ORDER BY assetBlob_hash LIMIT :p_limit"),
+                {'p_grace_seconds': grace_seconds, 'p_after': after, 'p_limit': limit}).fetchall()
+            return [row[0] for row in result]
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_delete_dead_blobs(content_hashes):
+    """
+    Deletes blob rows that are still unreferenced; a blob assigned again in the meantime is kept.
+    :return: Number of deleted rows.
+    """
+    if not content_hashes:
+        return 0
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("DELETE FROM assetBlob WHERE assetBlob_hash IN :p_hashes AND assetBlob_refCount = 0")
+                .bindparams(bindparam('p_hashes', expanding=True)),
+                {'p_hashes': list(content_hashes)})
+            session.commit()
+            return result.rowcount
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
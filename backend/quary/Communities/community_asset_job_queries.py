@@ -0,0 +1,240 @@
+from sqlalchemy import exc, text, bindparam
+
+from scripts.handler.error_handler import SQLAlchemyError
+from scripts.modules.mysql.db_session import Session
+
+ASSET_JOB_PENDING = 'pending'
+ASSET_JOB_RUNNING = 'running'
+ASSET_JOB_RETRYING = 'retrying'
+ASSET_JOB_DONE = 'done'
+ASSET_JOB_FAILED = 'failed'
+# A later upload of the same asset was assigned first, so this job's image is never assigned
+ASSET_JOB_SUPERSEDED = 'superseded'
+
+INSERT_ASSET_JOB = """
+    INSERT INTO communityAssetJob (assetJob_entityType, assetJob_entityId, assetJob_communityId, assetJob_assetName,
+                                   assetJob_bucketFilename, assetJob_stagingPath)
+    VALUES (:p_entity_type, :p_entity_id, :p_community_id, :p_asset_name, :p_bucket_filename, :p_staging_path)
+"""
+
+ASSET_JOB_COLUMNS = """
+    SELECT assetJob_id, assetJob_entityType, assetJob_entityId, assetJob_communityId, assetJob_assetName,
+           assetJob_bucketFilename, assetJob_stagingPath, assetJob_status, assetJob_attempts, assetJob_lastError,
+           assetJob_url, assetJob_updatedAt
+    FROM communityAssetJob
+"""
+
+
+def _row_to_job(row):
+    return {
+        'jobId': row[0],
+        'entityType': row[1],
+        'entityId': row[2],
+        'communityId': row[3],
+        'asset': row[4],
+        'bucketFilename': row[5],
+        'stagingPath': row[6],
+        'status': row[7],
+        'attempts': row[8],
+        'lastError': row[9],
+        'url': row[10],
+        'updatedAt': row[11].isoformat() if row[11] is not None else None,
+    }
+
+
+def query_create_asset_job(session, entity_type, entity_id, community_id, asset_name, bucket_filename, staging_path):
+    """
+    Records a pending asset upload inside the caller's transaction, so the job exists exactly when the row does.
+    :return: The ID of the new job.
+    """
+    session.execute(text(INSERT_ASSET_JOB), {
+        'p_entity_type': entity_type,
+        'p_entity_id': entity_id,
+        'p_community_id': community_id,
+        'p_asset_name': asset_name,
+        'p_bucket_filename': bucket_filename,
+        'p_staging_path': staging_path
+    })
+    return session.execute(text("SELECT LAST_INSERT_ID()")).scalar()
+
+
+LOCK_ASSET_JOBS = """
+    SELECT assetJob_id, assetJob_status FROM communityAssetJob
+    WHERE assetJob_entityType = :p_entity_type AND assetJob_entityId = :p_entity_id
+      AND assetJob_assetName = :p_asset_name
+    FOR UPDATE
+"""
+
+SUPERSEDE_ASSET_JOBS = text("""
+    UPDATE communityAssetJob SET assetJob_status = :p_superseded, assetJob_owner = NULL,
+                                 assetJob_leaseExpiresAt = NULL
+    WHERE assetJob_id IN :p_job_ids AND assetJob_status IN (:p_pending, :p_running, :p_retrying)
+""").bindparams(bindparam('p_job_ids', expanding=True))
+
+
+def order_asset_assignment(session, entity_type, entity_id, asset_name, job_id=None):
+    """
+    Orders the assignments of one asset inside the caller's transaction, so an older upload never replaces a
+    newer one. The asset's jobs are locked, which makes concurrent assignments of it run one after the other.
+    Jobs are ordered by their ID: a job only assigns if it has not been superseded and no later job of the asset
+    is waiting, running or done. An assignment made without a job, by a synchronous upload, is later than every
+    job already made. Unfinished jobs older than the assignment are marked superseded.
+
+    :param job_id: ID of the job assigning the asset, or None for a synchronous upload.
+    :return: False if the job has been superseded, in which case it is marked so and must not assign.
+    """
+    rows = session.execute(text(LOCK_ASSET_JOBS), {
+        'p_entity_type': entity_type,
+        'p_entity_id': entity_id,
+        'p_asset_name': asset_name
+    }).fetchall()
+    statuses = {row[0]: row[1] for row in rows}
+    superseded = [other for other, status in statuses.items()
+                  if (job_id is None or other < job_id)
+                  and status in (ASSET_JOB_PENDING, ASSET_JOB_RUNNING, ASSET_JOB_RETRYING)]
+    allowed = job_id is None or (
+        statuses.get(job_id) != ASSET_JOB_SUPERSEDED
+        and not any(other > job_id and status != ASSET_JOB_FAILED for other, status in statuses.items()))
+    if not allowed:
+        superseded = [job_id]
+    if superseded:
+        session.execute(SUPERSEDE_ASSET_JOBS, {
+            'p_superseded': ASSET_JOB_SUPERSEDED,
+            'p_job_ids': superseded,
+            'p_pending': ASSET_JOB_PENDING,
+            'p_running': ASSET_JOB_RUNNING,
+            'p_retrying': ASSET_JOB_RETRYING
+        })
+    return allowed
+
+
+def query_get_asset_job(job_id):
+    with Session() as session:
+        try:
+            row = session.execute(text(ASSET_JOB_COLUMNS + " WHERE assetJob_id = :p_job_id"),
+                                  {'p_job_id': job_id}).fetchone()
+            return _row_to_job(row) if row else None
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_get_asset_jobs_for_entity(entity_type, entity_id):
+    with Session() as session:
+        try:
+            result = session.execute(
+                text(ASSET_JOB_COLUMNS + " WHERE assetJob_entityType = :p_entity_type "
+                                         "AND assetJob_entityId = :p_entity_id ORDER BY assetJob_id"),
+                {'p_entity_type': entity_type, 'p_entity_id': entity_id}).fetchall()
+            return [_row_to_job(row) for row in result]
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_get_claimable_asset_job_ids(idle_seconds):
+    """
+    Returns the jobs a worker may claim: pending and retrying jobs untouched for idle_seconds, and running jobs
+    whose lease expired because their worker stopped.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("SELECT assetJob_id FROM communityAssetJob "
+                     "WHERE (assetJob_status IN (:p_pending, :p_retrying) "
+                     "AND assetJob_updatedAt <= NOW() - INTERVAL :p_idle SECOND) "
+                     "OR (assetJob_status = :p_running AND assetJob_leaseExpiresAt < NOW()) "
+                     "ORDER BY assetJob_id"),
+                {'p_pending': ASSET_JOB_PENDING, 'p_retrying': ASSET_JOB_RETRYING, 'p_running': ASSET_JOB_RUNNING,
+                 'p_idle': idle_seconds}).fetchall()
+            return [row[0] for row in result]
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_claim_asset_job(job_id, owner, lease_seconds):
+    """
+    Marks a job as running for one worker and counts the attempt. Only a pending or retrying job, or a running
+    job whose lease expired, can be claimed, so a job queued in several processes runs once.
+
+    :return: True if this worker claimed the job.
+    """
+    with Session() as session:
+        try:
+            claimed = session.execute(
+                text("UPDATE communityAssetJob SET assetJob_status = :p_running, assetJob_owner = :p_owner, "
+                     "assetJob_leaseExpiresAt = NOW() + INTERVAL :p_lease SECOND, "
+                     "assetJob_attempts = assetJob_attempts + 1 "
+                     "WHERE assetJob_id = :p_job_id AND (assetJob_status IN (:p_pending, :p_retrying) "
+                     "OR (assetJob_status = :p_running AND assetJob_leaseExpiresAt < NOW()))"),
+                {'p_running': ASSET_JOB_RUNNING, 'p_owner': owner, 'p_lease': lease_seconds, 'p_job_id': job_id,
+                 'p_pending': ASSET_JOB_PENDING, 'p_retrying': ASSET_JOB_RETRYING}).rowcount == 1
+            session.commit()
+            return claimed
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_renew_asset_job_lease(job_id, owner, lease_seconds):
+    """
+    Extends the lease of a job this worker is still running.
+
+    :return: False if the job is no longer held by this worker.
+    """
+    with Session() as session:
+        try:
+            renewed = session.execute(
+                text("UPDATE communityAssetJob SET assetJob_leaseExpiresAt = NOW() + INTERVAL :p_lease SECOND "
+                     "WHERE assetJob_id = :p_job_id AND assetJob_status = :p_running AND assetJob_owner = :p_owner"),
+                {'p_lease': lease_seconds, 'p_job_id': job_id, 'p_running': ASSET_JOB_RUNNING,
+                 'p_owner': owner}).rowcount == 1
+            session.commit()
+            return renewed
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_complete_asset_job(job_id, owner, url):
+    """
+    Marks a job done once its asset has been stored and assigned to the community or post.
+
+    :return: False if the job is no longer held by this worker, in which case nothing is written.
+    """
+    with Session() as session:
+        try:
+            completed = session.execute(
+                text("UPDATE communityAssetJob SET assetJob_status = :p_done, assetJob_url = :p_url, "
+                     "assetJob_lastError = NULL, assetJob_owner = NULL, assetJob_leaseExpiresAt = NULL "
+                     "WHERE assetJob_id = :p_job_id AND assetJob_status = :p_running AND assetJob_owner = :p_owner"),
+                {'p_done': ASSET_JOB_DONE, 'p_url': url, 'p_job_id': job_id, 'p_running': ASSET_JOB_RUNNING,
+                 'p_owner': owner}).rowcount == 1
+            session.commit()
+            return completed
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_fail_asset_job(job_id, owner, error, final):
+    """
+    Records a failed attempt; final failures are marked failed, others are left to be retried.
+    Only the worker holding the job writes, so a duplicate attempt never turns a done job into a failed one.
+
+    :return: False if the job is no longer held by this worker, in which case nothing is written.
+    """
+    with Session() as session:
+        try:
+            recorded = session.execute(
+                text("UPDATE communityAssetJob SET assetJob_status = :p_status, assetJob_lastError = :p_error, "
+                     "assetJob_owner = NULL, assetJob_leaseExpiresAt = NULL "
+                     "WHERE assetJob_id = :p_job_id AND assetJob_status = :p_running AND assetJob_owner = :p_owner"),
+                {'p_status': ASSET_JOB_FAILED if final else ASSET_JOB_RETRYING, 'p_error': error[:2000],
+                 'p_job_id': job_id, 'p_running': ASSET_JOB_RUNNING, 'p_owner': owner}).rowcount == 1
+            session.commit()
+            return recorded
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
@@ -0,0 +1,125 @@
+import json
+
+from sqlalchemy import exc, text
+
+from scripts.constants.queries_text import GET_COMMUNITY_USERS, GET_ALL_COMMUNITY_POSTS, GET_COMMUNITY_INVITES, \
+    GET_COMMUNITY_REQUESTS
+from scripts.handler.error_handler import SQLAlchemyError
+from scripts.modules.mysql.db_async_session import AsyncSessionLocal
+from scripts.modules.mysql.Communities.community_cache import community_cache
+from scripts.modules.mysql.Communities.community_queries import GET_COMMUNITY_USERS_PAGE, GET_COMMUNITIES_BY_IDS, \
+    GET_COMMUNITIES, build_community_users_page_params, read_community_users_page, community_document
+from scripts.modules.mysql.Communities.post.community_post_queries import GET_COMMUNITY_POSTS_PAGE, \
+    build_community_posts_page_params, read_community_posts_page
+from scripts.modules.mysql.Communities.member.community_member_queries import read_community_request_users
+
+# Async equivalents of the read queries. Each one mirrors its synchronous counterpart but awaits the MySQL round
+# trip, so many of them can be in flight on the database event loop at the same time.
+# Results are buffered by the async driver, which also drains the extra result sets a CALL returns.
+
+
+async def _fetch_all(sql, params):
+    async with AsyncSessionLocal() as session:
+        try:
+            result = await session.execute(sql, params)
+            return result.fetchall()
+        except exc.SQLAlchemyError as e:
+            await session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+async def async_community_query_get_community_by_id(id_community):
+    """
+    Returns a single community, sharing the read cache with community_query_get_community_by_id.
+    """
+    key = str(id_community)
+    cached = community_cache.get(key)
+    if cached is not None:
+        return cached
+
+    generation = community_cache.generation
+    result = await _fetch_all(GET_COMMUNITIES_BY_IDS, {'p_ids': [int(id_community)]})
+    community = community_document(result[0][1]) if result else None
+    if community is not None:
+        community_cache.set(key, community, generation=generation)
+    return community
+
+
+async def async_community_query_get_all_communities(user_id):
+    """
+    Fetches the communities offered to the user, see community_query_get_all_communities.
+    :return: A list of communities, or None if no communities are found.
+    """
+    result = await _fetch_all(text(GET_COMMUNITIES), {'userId': user_id})
+    if not result:
+        return None
+    return [json.loads(row[0]) for row in result]
+
+
+async def async_community_query_get_all_community_users(community_id):
+    """
+    Fetches all users of a community.
+    :return: A list of community users, or None if the community has none.
+    """
+    result = await _fetch_all(text(GET_COMMUNITY_USERS), {"p_community_id": community_id})
+    if not result:
+        return None
+    return [json.loads(row[0]) for row in result]
+
+
+async def async_community_query_get_community_users_page(community_id, limit=None, after=None, roles=None,
+                                                         name_prefix=None):
+    """
+    Fetches one keyset page of community members, see community_query_get_community_users_page.
+    """
+    params, limit = build_community_users_page_params(community_id, limit, after, roles, name_prefix)
+    result = await _fetch_all(GET_COMMUNITY_USERS_PAGE, params)
+    return read_community_users_page(result, limit)
+
+
+async def async_query_get_all_community_posts(community_id):
+    """
+    Fetches all posts of a community.
+    :return: A list of posts, or None if the community has none.
+    """
+    result = await _fetch_all(text(GET_ALL_COMMUNITY_POSTS), {'p_community_id': community_id})
+    if not result:
+        return None
+    return [json.loads(row[0]) for row in result]
+
+
+async def async_query_get_community_posts_page(community_id, limit=None, after=None):
+    """
+    Fetches one keyset page of posts for a community, see query_get_community_posts_page.
+    """
+    params, limit = build_community_posts_page_params(community_id, limit, after)
+    result = await _fetch_all(text(GET_COMMUNITY_POSTS_PAGE), params)
+    return read_community_posts_page(result, limit)
+
+
+async def async_get_query_community_invites(user_id):
+    """
+    Retrieves the community invites for a user.
+    :return: List of invites, empty if there are none.
+    """
+    result = await _fetch_all(text(GET_COMMUNITY_INVITES), {'p_userId': user_id})
+    if not result or result[0][0] is None:
+        return []
+    return json.loads(result[0][0])
+
+
+async def async_get_query_community_requests(community_id):
+    """
+    Retrieves the pending join requests of a community.
+    :return: List of requests, empty if there are none.
+    """
+    result = await _fetch_all(text(GET_COMMUNITY_REQUESTS), {"p_community_id": community_id})
+    return [json.loads(row[0]) for row in result if row[0] is not None]
+
+
+async def async_query_count_community_requests(community_id):
+    """
+    Async version of query_count_community_requests.
+    """
+    result = await _fetch_all(text(GET_COMMUNITY_REQUESTS), {"p_community_id": community_id})
+    return len(read_community_request_users(result))
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Default size and lifetime of the community read cache
+COMMUNITY_CACHE_MAX_ENTRIES = 1024
+COMMUNITY_CACHE_TTL_SECONDS = 60
+# Default size and lifetime of the community post read cache
+COMMUNITY_POST_CACHE_MAX_ENTRIES = 4096
+COMMUNITY_POST_CACHE_TTL_SECONDS = 60
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded, thread safe LRU cache whose entries also expire after a time to live.
+    Keeps hit, miss and eviction counters so the cache can be monitored.
+    """
+
+    def __init__(self, max_entries, ttl_seconds, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a load that raced with a write does not cache the stale row
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for key, or default when it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl_seconds=None, generation=None):
+        """
+        Stores value under key, evicting the least recently used entries when the cache is full.
+
+        :param ttl_seconds: Optional lifetime for this entry instead of the cache default.
+        :param generation: Optional generation read before the value was loaded; the value is dropped if the
+                           cache has been invalidated since.
+        """
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            now = self._clock()
+            self._entries[key] = (now + ttl, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._purge_expired(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _purge_expired(self, now):
+        """
+        Drops every expired entry, so a full cache makes room from dead entries before evicting live ones.
+        Entries can have different lifetimes, so expired ones are not necessarily the least recently used.
+        """
+        expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        self.expirations += len(expired)
+
+    def get_or_load(self, key, loader):
+        """
+        Read-through lookup: returns the cached value or calls loader() and caches its result.
+        None results are not cached so missing rows are looked up again on the next request.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        generation = self._generation
+        value = loader()
+        if value is not None:
+            self.set(key, value, generation=generation)
+        return value
+
+    def get_many_or_load(self, keys, loader, ttl_seconds=None):
+        """
+        Batch read-through lookup: serves the cached keys and calls loader(missing_keys) once for the rest.
+
+        :param keys: Iterable of cache keys.
+        :param loader: Callable taking a list of missing keys and returning a dictionary of key to value.
+        :param ttl_seconds: Optional lifetime for the loaded entries instead of the cache default.
+        :return: Dictionary with a value for every key that was cached or loaded.
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+
+        if missing:
+            generation = self._generation
+            loaded = loader(missing)
+            for key, value in loaded.items():
+                if value is not None:
+                    self.set(key, value, ttl_seconds=ttl_seconds, generation=generation)
+                    found[key] = value
+        return found
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(key, _MISSING) is not _MISSING:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "ttlSeconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRatio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+community_cache = TTLCache(COMMUNITY_CACHE_MAX_ENTRIES, COMMUNITY_CACHE_TTL_SECONDS)
+community_post_cache = TTLCache(COMMUNITY_POST_CACHE_MAX_ENTRIES, COMMUNITY_POST_CACHE_TTL_SECONDS)
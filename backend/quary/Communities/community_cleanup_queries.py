@@ -0,0 +1,198 @@
+import json
+
+from sqlalchemy import exc, text
+
+from scripts.handler.error_handler import SQLAlchemyError
+from scripts.modules.mysql.db_session import Session
+
+CLEANUP_PENDING = 'pending'
+CLEANUP_RUNNING = 'running'
+CLEANUP_DONE = 'done'
+
+CLEANUP_JOB_FIELDS = """
+    cleanupJob_id, cleanupJob_communityId, cleanupJob_status, cleanupJob_totalKeys, cleanupJob_processedKeys,
+    cleanupJob_deletedObjects, cleanupJob_failedObjects, cleanupJob_lastError, cleanupJob_createdAt,
+    cleanupJob_updatedAt
+"""
+CLEANUP_JOB_COLUMNS = f"SELECT {CLEANUP_JOB_FIELDS} FROM assetCleanupJob"
+
+
+def _row_to_cleanup_job(row):
+    return {
+        'jobId': row[0],
+        'communityId': row[1],
+        'status': row[2],
+        'totalKeys': row[3],
+        'processedKeys': row[4],
+        'deletedObjects': row[5],
+        'failedObjects': row[6],
+        'lastError': row[7],
+        'createdAt': row[8].isoformat() if row[8] is not None else None,
+        'updatedAt': row[9].isoformat() if row[9] is not None else None,
+    }
+
+
+def query_get_community_post_ids(community_id):
+    """
+    :return: IDs of every post in the community, hidden ones included.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("SELECT communityPost_postId FROM communityPost WHERE communityPost_communityId = :p_community_id"),
+                {'p_community_id': community_id}).fetchall()
+            return [row[0] for row in result]
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_community_exists(community_id):
+    with Session() as session:
+        try:
+            return session.execute(text("SELECT 1 FROM community WHERE community_id = :p_community_id"),
+                                   {'p_community_id': community_id}).scalar() is not None
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_create_cleanup_job(community_id, keys):
+    """
+    :return: The ID of the new cleanup job.
+    """
+    with Session() as session:
+        try:
+            session.execute(
+                text("INSERT INTO assetCleanupJob (cleanupJob_communityId, cleanupJob_keys, cleanupJob_totalKeys) "
+                     "VALUES (:p_community_id, :p_keys, :p_total_keys)"),
+                {'p_community_id': community_id, 'p_keys': json.dumps(keys), 'p_total_keys': len(keys)})
+            job_id = session.execute(text("SELECT LAST_INSERT_ID()")).scalar()
+            session.commit()
+            return job_id
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_get_cleanup_job(job_id):
+    """
+    :return: The job including its list of keys, or None.
+    """
+    with Session() as session:
+        try:
+            row = session.execute(
+                text(f"SELECT {CLEANUP_JOB_FIELDS}, cleanupJob_keys FROM assetCleanupJob WHERE cleanupJob_id = :p_job_id"),
+                {'p_job_id': job_id}).fetchone()
+            if row is None:
+                return None
+            job = _row_to_cleanup_job(row)
+            job['keys'] = json.loads(row[10]) if isinstance(row[10], (str, bytes)) else row[10]
+            return job
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_get_cleanup_jobs_for_community(community_id):
+    with Session() as session:
+        try:
+            result = session.execute(
+                text(CLEANUP_JOB_COLUMNS + " WHERE cleanupJob_communityId = :p_community_id ORDER BY cleanupJob_id"),
+                {'p_community_id': community_id}).fetchall()
+            return [_row_to_cleanup_job(row) for row in result]
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_get_claimable_cleanup_job_ids(idle_seconds):
+    """
+    Returns the jobs a process may claim: pending jobs untouched for idle_seconds, and running jobs whose lease
+    expired because their process stopped.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("SELECT cleanupJob_id FROM assetCleanupJob "
+                     "WHERE (cleanupJob_status = :p_pending "
+                     "AND cleanupJob_updatedAt <= NOW() - INTERVAL :p_idle SECOND) "
+                     "OR (cleanupJob_status = :p_running AND cleanupJob_leaseExpiresAt < NOW()) "
+                     "ORDER BY cleanupJob_id"),
+                {'p_pending': CLEANUP_PENDING, 'p_running': CLEANUP_RUNNING, 'p_idle': idle_seconds}).fetchall()
+            return [row[0] for row in result]
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_claim_cleanup_job(job_id, owner, lease_seconds):
+    """
+    Marks a job as running for one process. Only a pending job, or a running job whose lease expired, can be
+    claimed, so a job queued in several processes is deleted by one.
+
+    :return: True if this process claimed the job.
+    """
+    with Session() as session:
+        try:
+            claimed = session.execute(
+                text("UPDATE assetCleanupJob SET cleanupJob_status = :p_running, cleanupJob_owner = :p_owner, "
+                     "cleanupJob_leaseExpiresAt = NOW() + INTERVAL :p_lease SECOND "
+                     "WHERE cleanupJob_id = :p_job_id AND (cleanupJob_status = :p_pending "
+                     "OR (cleanupJob_status = :p_running AND cleanupJob_leaseExpiresAt < NOW()))"),
+                {'p_running': CLEANUP_RUNNING, 'p_owner': owner, 'p_lease': lease_seconds, 'p_job_id': job_id,
+                 'p_pending': CLEANUP_PENDING}).rowcount == 1
+            session.commit()
+            return claimed
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_renew_cleanup_job_lease(job_id, owner, lease_seconds):
+    """
+    Extends the lease of a job this process is still running.
+
+    :return: False if the job is no longer held by this process.
+    """
+    with Session() as session:
+        try:
+            renewed = session.execute(
+                text("UPDATE assetCleanupJob SET cleanupJob_leaseExpiresAt = NOW() + INTERVAL :p_lease SECOND "
+                     "WHERE cleanupJob_id = :p_job_id AND cleanupJob_status = :p_running "
+                     "AND cleanupJob_owner = :p_owner"),
+                {'p_lease': lease_seconds, 'p_job_id': job_id, 'p_running': CLEANUP_RUNNING,
+                 'p_owner': owner}).rowcount == 1
+            session.commit()
+            return renewed
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_update_cleanup_progress(job_id, owner, status, processed_keys, deleted_objects, failed_objects,
+                                  last_error=None):
+    """
+    Records the progress of a running job; a finished job gives up its lease.
+
+    :return: False if the job is no longer held by this process, in which case nothing is written.
+    """
+    with Session() as session:
+        try:
+            recorded = session.execute(
+                text("UPDATE assetCleanupJob SET cleanupJob_status = :p_status, "
+                     "cleanupJob_processedKeys = :p_processed_keys, cleanupJob_deletedObjects = :p_deleted_objects, "
+                     "cleanupJob_failedObjects = :p_failed_objects, "
+                     "cleanupJob_lastError = COALESCE(:p_last_error, cleanupJob_lastError), "
+                     "cleanupJob_owner = IF(:p_status = :p_running, cleanupJob_owner, NULL), "
+                     "cleanupJob_leaseExpiresAt = IF(:p_status = :p_running, cleanupJob_leaseExpiresAt, NULL) "
+                     "WHERE cleanupJob_id = :p_job_id AND cleanupJob_status = :p_running "
+                     "AND cleanupJob_owner = :p_owner"),
+                {'p_status': status, 'p_processed_keys': processed_keys, 'p_deleted_objects': deleted_objects,
+                 'p_failed_objects': failed_objects, 'p_last_error': last_error, 'p_running': CLEANUP_RUNNING,
+                 'p_job_id': job_id, 'p_owner': owner}).rowcount == 1
+            session.commit()
+            return recorded
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
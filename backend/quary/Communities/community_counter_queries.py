@@ -0,0 +1,223 @@
+import contextlib
+import json
+
+from sqlalchemy import event, exc, text, bindparam
+
+from scripts.handler.error_handler import SQLAlchemyError
+from scripts.modules.mysql.Communities.community_cache import community_cache
+from scripts.modules.mysql.db_session import Session, engine
+
+COUNTER_RUN_RUNNING = 'running'
+COUNTER_RUN_DONE = 'done'
+COUNTER_RUN_FAILED = 'failed'
+
+# Named lock held by the reconcile pass, so one pass runs at a time across every process of the deployment
+COUNTER_RECONCILE_LOCK = 'community_counter_reconcile'
+
+COUNTER_RUN_COLUMNS = """
+    SELECT counterRun_id, counterRun_status, counterRun_report, counterRun_lastError, counterRun_createdAt,
+           counterRun_updatedAt
+    FROM counterReconcileRun
+"""
+
+# Adds the given deltas; a counter never goes below zero even if it drifted
+ADJUST_COMMUNITY_COUNTERS = text("""
+    UPDATE community
+    SET community_memberCount = GREATEST(CAST(community_memberCount AS SIGNED) + :p_members, 0),
+        community_postCount = GREATEST(CAST(community_postCount AS SIGNED) + :p_posts, 0)
+    WHERE community_id = :p_community_id
+""")
+
+# Roles counted as members: owner, moderator and member, the COMMUNITY_ROLES of community_queries, which imports
+# this module. Pending join requests and invites are communityUser rows with other roles.
+COUNTED_MEMBER_ROLES_SQL = "(1, 2, 3)"
+
+# Recounts the given communities and writes the counters of those that drifted
+RECONCILE_COMMUNITY_COUNTERS = text("""
+    UPDATE community c
+    LEFT JOIN (
+        SELECT communityUser_communityId AS community_id, COUNT(*) AS members
+        FROM communityUser
+        WHERE communityUser_communityId IN :p_ids AND communityUser_role IN """ + COUNTED_MEMBER_ROLES_SQL + """
+        GROUP BY communityUser_communityId
+    ) m ON m.community_id = c.community_id
+    LEFT JOIN (
+        SELECT communityPost_communityId AS community_id, COUNT(*) AS posts
+        FROM communityPost
+        WHERE communityPost_communityId IN :p_ids AND communityPost_isHidden = 0
+        GROUP BY communityPost_communityId
+    ) p ON p.community_id = c.community_id
+    SET c.community_memberCount = COALESCE(m.members, 0),
+        c.community_postCount = COALESCE(p.posts, 0)
+    WHERE c.community_id IN :p_ids
+      AND (c.community_memberCount <> COALESCE(m.members, 0) OR c.community_postCount <> COALESCE(p.posts, 0))
+""").bindparams(bindparam('p_ids', expanding=True))
+
+
+def _row_to_counter_run(row):
+    return {
+        'runId': row[0],
+        'status': row[1],
+        'report': json.loads(row[2]) if isinstance(row[2], (str, bytes)) else row[2],
+        'lastError': row[3],
+        'createdAt': row[4].isoformat() if row[4] is not None else None,
+        'updatedAt': row[5].isoformat() if row[5] is not None else None,
+    }
+
+
+def adjust_community_counters(session, community_id, members=0, posts=0):
+    """
+    Applies member and post count deltas inside the caller's transaction, so they commit or roll back with
+    the change that caused them. The cached community is dropped once the transaction has been committed.
+    """
+    if not members and not posts:
+        return
+    session.execute(ADJUST_COMMUNITY_COUNTERS, {'p_members': members, 'p_posts': posts,
+                                                'p_community_id': community_id})
+    event.listen(session, 'after_commit', lambda _: community_cache.invalidate(str(community_id)), once=True)
+
+
+def query_get_community_id_batch(after, limit):
+    """
+    :return: Up to limit community IDs greater than after, in ascending order.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("SELECT community_id FROM community WHERE community_id > :p_after "
+                     "ORDER BY community_id LIMIT :p_limit"),
+                {'p_after': after, 'p_limit': limit}).fetchall()
+            return [row[0] for row in result]
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_reconcile_community_counters(community_ids):
+    """
+    Recounts the members and visible posts of the given communities and corrects the counters that drifted.
+
+    :return: Number of communities whose counters were corrected.
+    """
+    with Session() as session:
+        try:
+            corrected = session.execute(RECONCILE_COMMUNITY_COUNTERS, {'p_ids': list(community_ids)}).rowcount
+            session.commit()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+    if corrected:
+        for community_id in community_ids:
+            community_cache.invalidate(str(community_id))
+    return corrected
+
+
+def sync_community_counters(session, community_id):
+    """
+    Counts the members and posts of one community inside the caller's transaction, e.g. right after it was
+    created together with its owner's membership.
+    """
+    session.execute(RECONCILE_COMMUNITY_COUNTERS, {'p_ids': [community_id]})
+
+
+@contextlib.contextmanager
+def counter_reconcile_lock():
+    """
+    Holds COUNTER_RECONCILE_LOCK for as long as the block runs. The lock belongs to the connection that took it,
+    so that connection stays open until the block ends.
+
+    :return: Context manager yielding True if the lock was taken, or False if another process holds it.
+    """
+    with engine.connect() as connection:
+        try:
+            locked = connection.execute(text("SELECT GET_LOCK(:p_name, 0)"),
+                                        {'p_name': COUNTER_RECONCILE_LOCK}).scalar() == 1
+        except exc.SQLAlchemyError as e:
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+        try:
+            yield locked
+        finally:
+            if locked:
+                connection.execute(text("SELECT RELEASE_LOCK(:p_name)"), {'p_name': COUNTER_RECONCILE_LOCK})
+
+
+def query_counter_reconcile_running():
+    """
+    :return: True if a reconcile pass holds COUNTER_RECONCILE_LOCK in any process.
+    """
+    with Session() as session:
+        try:
+            return session.execute(text("SELECT IS_USED_LOCK(:p_name) IS NOT NULL"),
+                                   {'p_name': COUNTER_RECONCILE_LOCK}).scalar() == 1
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_create_counter_run():
+    """
+    :return: The ID of the new run.
+    """
+    with Session() as session:
+        try:
+            session.execute(text("INSERT INTO counterReconcileRun (counterRun_status) VALUES (:p_status)"),
+                            {'p_status': COUNTER_RUN_RUNNING})
+            run_id = session.execute(text("SELECT LAST_INSERT_ID()")).scalar()
+            session.commit()
+            return run_id
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_update_counter_run(run_id, status, report, last_error=None):
+    with Session() as session:
+        try:
+            session.execute(
+                text("UPDATE counterReconcileRun SET counterRun_status = :p_status, counterRun_report = :p_report, "
+                     "counterRun_lastError = COALESCE(:p_last_error, counterRun_lastError) "
+                     "WHERE counterRun_id = :p_run_id"),
+                {'p_status': status, 'p_report': json.dumps(report), 'p_last_error': last_error, 'p_run_id': run_id})
+            session.commit()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_fail_interrupted_counter_runs():
+    """
+    Marks runs still recorded as running as failed. Only called while no process holds COUNTER_RECONCILE_LOCK,
+    when such a run can only have been interrupted, e.g. by a restart.
+    """
+    with Session() as session:
+        try:
+            session.execute(
+                text("UPDATE counterReconcileRun SET counterRun_status = :p_failed, "
+                     "counterRun_lastError = 'Interrupted' WHERE counterRun_status = :p_running"),
+                {'p_failed': COUNTER_RUN_FAILED, 'p_running': COUNTER_RUN_RUNNING})
+            session.commit()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_get_counter_run(run_id):
+    with Session() as session:
+        try:
+            row = session.execute(text(COUNTER_RUN_COLUMNS + " WHERE counterRun_id = :p_run_id"),
+                                  {'p_run_id': run_id}).fetchone()
+            return _row_to_counter_run(row) if row is not None else None
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_get_recent_counter_runs(limit):
+    with Session() as session:
+        try:
+            result = session.execute(text(COUNTER_RUN_COLUMNS + " ORDER BY counterRun_id DESC LIMIT :p_limit"),
+                                     {'p_limit': limit}).fetchall()
+            return [_row_to_counter_run(row) for row in result]
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
@@ -0,0 +1,167 @@
+import contextlib
+import json
+
+from sqlalchemy import exc, text
+
+from scripts.handler.error_handler import SQLAlchemyError
+from scripts.modules.mysql.db_session import Session, engine
+
+GC_RUNNING = 'running'
+GC_DONE = 'done'
+GC_FAILED = 'failed'
+
+# Named database lock held by the garbage collection run in progress, whichever process it runs in
+GC_LOCK = 'asset_gc'
+
+# Number of rows pulled from the server side cursor per round trip while streaming
+STREAM_BATCH_SIZE = 1000
+
+GC_RUN_COLUMNS = """
+    SELECT gcRun_id, gcRun_dryRun, gcRun_status, gcRun_report, gcRun_lastError, gcRun_createdAt, gcRun_updatedAt
+    FROM assetGcRun
+"""
+
+
+@contextlib.contextmanager
+def gc_lock():
+    """
+    Holds GC_LOCK for as long as the block runs. The lock belongs to the connection that took it, so that
+    connection stays open until the block ends.
+
+    :return: Context manager yielding True if the lock was taken, or False if another process holds it.
+    """
+    with engine.connect() as connection:
+        try:
+            locked = connection.execute(text("SELECT GET_LOCK(:p_name, 0)"), {'p_name': GC_LOCK}).scalar() == 1
+        except exc.SQLAlchemyError as e:
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+        try:
+            yield locked
+        finally:
+            if locked:
+                connection.execute(text("SELECT RELEASE_LOCK(:p_name)"), {'p_name': GC_LOCK})
+
+
+def query_gc_running():
+    """
+    :return: True if a garbage collection run holds GC_LOCK in any process.
+    """
+    with Session() as session:
+        try:
+            return session.execute(text("SELECT IS_USED_LOCK(:p_name) IS NOT NULL"), {'p_name': GC_LOCK}).scalar() == 1
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def _row_to_gc_run(row):
+    return {
+        'runId': row[0],
+        'dryRun': bool(row[1]),
+        'status': row[2],
+        'report': json.loads(row[3]) if isinstance(row[3], (str, bytes)) else row[3],
+        'lastError': row[4],
+        'createdAt': row[5].isoformat() if row[5] is not None else None,
+        'updatedAt': row[6].isoformat() if row[6] is not None else None,
+    }
+
+
+def _stream(sql):
+    session = Session()
+    try:
+        result = session.execute(text(sql), execution_options={'stream_results': True})
+        for row in result.yield_per(STREAM_BATCH_SIZE):
+            yield row
+    except exc.SQLAlchemyError as e:
+        session.rollback()
+        raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+    finally:
+        session.close()
+
+
+def query_stream_community_images():
+    """
+    Streams (community ID, logo URL, banner URL, logo variants, banner variants) of every community.
+    """
+    for row in _stream("SELECT community_id, community_imagePath, community_bannerPath, community_imageVariants, "
+                       "community_bannerVariants FROM community"):
+        yield row[0], row[1], row[2], _load_json(row[3]), _load_json(row[4])
+
+
+def query_stream_post_images():
+    """
+    Streams (community ID, post ID, image URL, image variants) of every community post.
+    """
+    for row in _stream("SELECT communityPost_communityId, communityPost_postId, communityPost_imagePath, "
+                       "communityPost_imageVariants FROM communityPost"):
+        yield row[0], row[1], row[2], _load_json(row[3])
+
+
+def _load_json(value):
+    return json.loads(value) if isinstance(value, (str, bytes)) else value
+
+
+def query_create_gc_run(dry_run):
+    """
+    :return: The ID of the new run.
+    """
+    with Session() as session:
+        try:
+            session.execute(text("INSERT INTO assetGcRun (gcRun_dryRun) VALUES (:p_dry_run)"), {'p_dry_run': dry_run})
+            run_id = session.execute(text("SELECT LAST_INSERT_ID()")).scalar()
+            session.commit()
+            return run_id
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_update_gc_run(run_id, status, report, last_error=None):
+    with Session() as session:
+        try:
+            session.execute(
+                text("UPDATE assetGcRun SET gcRun_status = :p_status, gcRun_report = :p_report, "
+                     "gcRun_lastError = COALESCE(:p_last_error, gcRun_lastError) WHERE gcRun_id = :p_run_id"),
+                {'p_status': status, 'p_report': json.dumps(report), 'p_last_error': last_error, 'p_run_id': run_id})
+            session.commit()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_fail_stale_gc_runs(stale_seconds):
+    """
+    Marks runs that stopped reporting progress, e.g. because of a restart, as failed.
+    A run is not resumed; the next one starts over.
+    """
+    with Session() as session:
+        try:
+            session.execute(
+                text("UPDATE assetGcRun SET gcRun_status = :p_failed, gcRun_lastError = 'Interrupted' "
+                     "WHERE gcRun_status = :p_running AND gcRun_updatedAt < NOW() - INTERVAL :p_stale_seconds SECOND"),
+                {'p_failed': GC_FAILED, 'p_running': GC_RUNNING, 'p_stale_seconds': stale_seconds})
+            session.commit()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_get_gc_run(run_id):
+    with Session() as session:
+        try:
+            row = session.execute(text(GC_RUN_COLUMNS + " WHERE gcRun_id = :p_run_id"), {'p_run_id': run_id}).fetchone()
+            return _row_to_gc_run(row) if row is not None else None
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_get_recent_gc_runs(limit):
+    with Session() as session:
+        try:
+            result = session.execute(text(GC_RUN_COLUMNS + " ORDER BY gcRun_id DESC LIMIT :p_limit"),
+                                     {'p_limit': limit}).fetchall()
+            return [_row_to_gc_run(row) for row in result]
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
@@ -0,0 +1,241 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+
+EARTH_RADIUS_KM = 6371.0088
+# Size of the finest grid cell in degrees, roughly 2.8 km north-south
+GRID_CELL_DEGREES = 0.025
+# Number of grid levels; every level up doubles the cell size, so the coarsest cells cover a hemisphere
+GRID_LEVELS = 14
+LEVEL_CELL_DEGREES = [GRID_CELL_DEGREES * 2 ** level for level in reversed(range(GRID_LEVELS))]
+
+# Cells sort before points at the same distance, so a point is only yielded once every cell that could hold a
+# point as close has been opened, and points at the same distance come out in ID order
+_CELL = 0
+_POINT = 1
+
+
+def haversine_km(latitude_a, longitude_a, latitude_b, longitude_b):
+    """
+    Great-circle distance between two coordinates in kilometres.
+    """
+    phi_a = math.radians(latitude_a)
+    phi_b = math.radians(latitude_b)
+    delta_phi = phi_b - phi_a
+    delta_lambda = math.radians(longitude_b - longitude_a)
+    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi_a) * math.cos(phi_b) * math.sin(delta_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cells_of(latitude, longitude):
+    """
+    Returns the cell containing the point on every level, coarsest first.
+    Coarser cells are derived from the finest one by bit shifting so parents and children always line up.
+    """
+    row = int(math.floor((latitude + 90) / GRID_CELL_DEGREES))
+    column = int(math.floor((longitude + 180) / GRID_CELL_DEGREES))
+    return [(row >> shift, column >> shift) for shift in reversed(range(GRID_LEVELS))]
+
+
+def _cell_min_distance_km(level, cell, latitude, longitude):
+    """
+    Lower bound for the distance from the point to anything inside the cell.
+    Plugs the smallest latitude gap, the smallest longitude gap and the cell's most poleward latitude into the
+    haversine formula, which never overestimates, so cells can be visited strictly in order of how close they may be.
+    """
+    size = LEVEL_CELL_DEGREES[level]
+    row, column = cell
+    south = row * size - 90
+    north = south + size
+    west = column * size - 180
+    east = west + size
+
+    latitude_gap = 0.0 if south <= latitude <= north else min(abs(latitude - south), abs(latitude - north))
+    longitude_gap = 180.0
+    for shift in (-360, 0, 360):
+        if west + shift <= longitude <= east + shift:
+            longitude_gap = 0.0
+            break
+        longitude_gap = min(longitude_gap, abs(longitude - west - shift), abs(longitude - east - shift))
+
+    poleward = min(max(abs(latitude), abs(south), abs(north)), 90)
+    a = math.sin(math.radians(latitude_gap) / 2) ** 2 + \
+        (math.cos(math.radians(poleward)) * math.sin(math.radians(longitude_gap) / 2)) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class CommunityGeoIndex:
+    """
+    In-memory hierarchical grid over community coordinates answering radius and k-nearest queries.
+    Each level halves the cell size of the level above it. Lookups walk the occupied cells best-first by
+    their minimum possible distance, so only the few cells around the search point are ever opened.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._documents = {}
+        self._level_counts = [{} for _ in range(GRID_LEVELS)]
+        self._members = {}
+        self._loaded = False
+        self._refresh_lock = threading.Lock()
+        # Database time of the last load and the monotonic time it was applied at
+        self._as_of = None
+        self._refreshed_at = 0.0
+
+    def load(self, documents):
+        """
+        Replaces the index contents with the given documents.
+
+        :param documents: Iterable of dictionaries with 'id', 'latitude' and 'longitude' keys.
+        """
+        with self._lock:
+            self._documents = {}
+            self._level_counts = [{} for _ in range(GRID_LEVELS)]
+            self._members = {}
+            for document in documents:
+                self._add(document['id'], document)
+            self._loaded = True
+
+    def ensure_fresh(self, loader, max_age_seconds):
+        """
+        Builds the index with loader(None) the first time it is needed and afterwards applies loader(since) once it
+        is older than max_age_seconds, see CommunitySearchIndex.ensure_fresh.
+        """
+        if self._loaded and time.monotonic() - self._refreshed_at < max_age_seconds:
+            return
+        if not self._refresh_lock.acquire(blocking=not self._loaded):
+            return
+        try:
+            if not self._loaded:
+                as_of, documents, _ = loader(None)
+                self.load(documents)
+            elif time.monotonic() - self._refreshed_at >= max_age_seconds:
+                as_of, documents, live_ids = loader(self._as_of)
+                self.refresh(documents, live_ids)
+            else:
+                return
+            self._as_of = as_of
+            self._refreshed_at = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def refresh(self, documents, live_ids=None):
+        """
+        Replaces the entries of changed communities and drops the ones that no longer exist or lost their coordinates.
+
+        :param documents: Current documents of the communities that changed.
+        :param live_ids: IDs of every existing community, or None to drop nothing.
+        """
+        with self._lock:
+            for document in documents:
+                self._remove(document['id'])
+                self._add(document['id'], document)
+            if live_ids is not None:
+                for community_id in set(self._documents) - set(live_ids):
+                    self._remove(community_id)
+
+    def upsert(self, community_id, fields):
+        """
+        Adds a community or merges changed fields into its entry, moving it to new cells when the coordinates change.
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+            document = dict(self._documents.get(community_id, {}))
+            document.update({key: value for key, value in fields.items() if value is not None})
+            self._remove(community_id)
+            self._add(community_id, document)
+
+    def remove(self, community_id):
+        with self._lock:
+            self._remove(community_id)
+
+    def within_radius(self, latitude, longitude, radius_km, limit=None, after=None):
+        """
+        Returns the communities within radius_km of the point, nearest first.
+
+        :param limit: Optional maximum number of results.
+        :param after: Optional (distance, community_id) position of the last community of the previous page; only
+            communities after it in (distance, ID) order are returned.
+        :return: List of (position, community) pairs. The position is the (distance, community_id) to continue
+            after, the community a dictionary with the stored community fields and 'distanceKm'.
+        """
+        with self._lock:
+            results = []
+            for distance, community_id in self._nearest_first(latitude, longitude, after):
+                if distance > radius_km or (limit is not None and len(results) >= limit):
+                    break
+                results.append(((distance, community_id), self._result(community_id, distance)))
+            return results
+
+    def nearest(self, latitude, longitude, count, after=None):
+        """
+        Returns the count communities closest to the point, nearest first, in the format of within_radius.
+        """
+        with self._lock:
+            return [((distance, community_id), self._result(community_id, distance))
+                    for distance, community_id in itertools.islice(self._nearest_first(latitude, longitude, after),
+                                                                   count)]
+
+    def _nearest_first(self, latitude, longitude, after=None):
+        """
+        Yields (distance, community_id) pairs in increasing (distance, ID) order from the point, starting after the
+        given position. Points up to that position are never pushed, so a later page does not rebuild the ones
+        before it.
+        """
+        sequence = itertools.count()
+        heap = [(_cell_min_distance_km(0, cell, latitude, longitude), _CELL, next(sequence), 0, cell)
+                for cell in self._level_counts[0]]
+        heapq.heapify(heap)
+        finest = GRID_LEVELS - 1
+
+        while heap:
+            distance, kind, _, level, key = heapq.heappop(heap)
+            if kind == _POINT:
+                yield distance, key
+            elif level == finest:
+                for community_id in self._members.get(key, ()):
+                    document = self._documents[community_id]
+                    point_distance = haversine_km(latitude, longitude, document['latitude'], document['longitude'])
+                    if after is not None and (point_distance, community_id) <= after:
+                        continue
+                    heapq.heappush(heap, (point_distance, _POINT, community_id, level, community_id))
+            else:
+                row, column = key
+                child_counts = self._level_counts[level + 1]
+                for child in ((2 * row, 2 * column), (2 * row, 2 * column + 1),
+                              (2 * row + 1, 2 * column), (2 * row + 1, 2 * column + 1)):
+                    if child in child_counts:
+                        child_distance = _cell_min_distance_km(level + 1, child, latitude, longitude)
+                        heapq.heappush(heap, (child_distance, _CELL, next(sequence), level + 1, child))
+
+    def _result(self, community_id, distance):
+        return dict(self._documents[community_id], id=community_id, distanceKm=round(distance, 3))
+
+    def _add(self, community_id, document):
+        if document.get('latitude') is None or document.get('longitude') is None:
+            return
+        document['latitude'] = float(document['latitude'])
+        document['longitude'] = float(document['longitude'])
+        self._documents[community_id] = document
+        for counts, cell in zip(self._level_counts, _cells_of(document['latitude'], document['longitude'])):
+            counts[cell] = counts.get(cell, 0) + 1
+        self._members.setdefault(cell, set()).add(community_id)
+
+    def _remove(self, community_id):
+        document = self._documents.pop(community_id, None)
+        if document is None:
+            return
+        for counts, cell in zip(self._level_counts, _cells_of(document['latitude'], document['longitude'])):
+            counts[cell] -= 1
+            if not counts[cell]:
+                del counts[cell]
+        members = self._members[cell]
+        members.discard(community_id)
+        if not members:
+            del self._members[cell]
+
+
+community_geo_index = CommunityGeoIndex()
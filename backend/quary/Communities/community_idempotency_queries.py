@@ -0,0 +1,100 @@
+import json
+
+from sqlalchemy import exc, text
+
+from scripts.handler.error_handler import SQLAlchemyError
+from scripts.modules.mysql.db_session import Session
+
+IDEMPOTENCY_PROCESSING = 'processing'
+IDEMPOTENCY_COMPLETE = 'complete'
+
+
+def query_claim_idempotency_key(key, fingerprint, ttl_seconds, processing_timeout_seconds):
+    """
+    Claims a key for the request about to run. Expired keys, and keys whose request has been processing for
+    longer than processing_timeout_seconds, e.g. because its worker stopped, are claimed again.
+
+    :return: Tuple of (True, None) when the key was claimed, or (False, stored row) when another request holds it.
+    """
+    with Session() as session:
+        try:
+            session.execute(
+                text("DELETE FROM idempotencyKey WHERE idempotency_key = :p_key AND (idempotency_expiresAt < NOW() "
+                     "OR (idempotency_status = :p_processing "
+                     "AND idempotency_createdAt < NOW() - INTERVAL :p_timeout SECOND))"),
+                {'p_key': key, 'p_processing': IDEMPOTENCY_PROCESSING, 'p_timeout': processing_timeout_seconds})
+            session.execute(
+                text("INSERT INTO idempotencyKey (idempotency_key, idempotency_fingerprint, idempotency_expiresAt) "
+                     "VALUES (:p_key, :p_fingerprint, NOW() + INTERVAL :p_ttl SECOND)"),
+                {'p_key': key, 'p_fingerprint': fingerprint, 'p_ttl': ttl_seconds})
+            session.commit()
+            return True, None
+        except exc.IntegrityError:
+            session.rollback()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+        try:
+            row = session.execute(
+                text("SELECT idempotency_fingerprint, idempotency_status, idempotency_responseStatus, "
+                     "idempotency_responseBody FROM idempotencyKey WHERE idempotency_key = :p_key"),
+                {'p_key': key}).fetchone()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+        if row is None:
+            # Purged between the insert and the read; the caller retries the claim
+            return False, None
+        return False, {
+            'fingerprint': row[0],
+            'status': row[1],
+            'responseStatus': row[2],
+            'responseBody': json.loads(row[3]) if row[3] is not None else None,
+        }
+
+
+def query_complete_idempotency_key(key, response_status, response_body):
+    with Session() as session:
+        try:
+            session.execute(
+                text("UPDATE idempotencyKey SET idempotency_status = :p_status, "
+                     "idempotency_responseStatus = :p_response_status, idempotency_responseBody = :p_response_body "
+                     "WHERE idempotency_key = :p_key"),
+                {'p_status': IDEMPOTENCY_COMPLETE, 'p_response_status': response_status,
+                 'p_response_body': json.dumps(response_body), 'p_key': key})
+            session.commit()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_release_idempotency_key(key):
+    """
+    Drops the claim of a request that failed, so a retry runs it again.
+    """
+    with Session() as session:
+        try:
+            session.execute(
+                text("DELETE FROM idempotencyKey WHERE idempotency_key = :p_key AND idempotency_status = :p_processing"),
+                {'p_key': key, 'p_processing': IDEMPOTENCY_PROCESSING})
+            session.commit()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_purge_expired_idempotency_keys(limit):
+    """
+    :return: Number of purged rows.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("DELETE FROM idempotencyKey WHERE idempotency_expiresAt < NOW() LIMIT :p_limit"),
+                {'p_limit': limit})
+            session.commit()
+            return result.rowcount
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
@@ -1,16 +1,158 @@
 import json
 import logging
+import os
+from datetime import timedelta
 
-from sqlalchemy import exc, text
-from scripts.constants.queries_text import SINGLE_COMMUNITY, GET_COMMUNITIES, UPDATE_COMMUNITY, GET_USER_COMMUNITIES, \
-    GET_COMMUNITY_USERS
+from sqlalchemy import exc, text, bindparam
+from scripts.constants.queries_text import UPDATE_COMMUNITY, GET_COMMUNITY_USERS
 from scripts.modules.buckets.buckets import bucket_delete, bucket_upload_file
 from scripts.constants.http_response_msg import ERROR_SQL_DB, ERROR_UNEXPECTED
 from scripts.handler.error_handler import UnexpectedError, SQLAlchemyError
-from scripts.setup.db_setup import Community, dbsession, engine
-from sqlalchemy.orm import sessionmaker
+from scripts.modules.mysql.Communities.community_search_index import community_search_index, SEARCH_FIELD_WEIGHTS
+from scripts.modules.mysql.Communities.community_geo_index import community_geo_index
+from scripts.modules.mysql.Communities.community_cache import community_cache
+from scripts.modules.mysql.Communities.community_counter_queries import sync_community_counters
+from scripts.modules.mysql.Communities.community_updates import VersionConflict, version_matches
+from scripts.modules.mysql.Communities.pagination import clamp_page_limit, encode_cursor, decode_cursor
+from scripts.modules.mysql.db_session import Session
+from scripts.setup.db_setup import Community
 
-Session = sessionmaker(bind=engine)
+# Number of rows pulled from the server side cursor per round trip while streaming list endpoints
+STREAM_BATCH_SIZE = 500
+
+# How old the in-memory search and nearby indexes of a process may get before it reads the communities changed
+# since, so writes handled by other processes show up there too
+COMMUNITY_INDEX_REFRESH_SECONDS = int(os.getenv('COMMUNITY_INDEX_REFRESH_SECONDS', 30))
+# A write committed after a refresh read can carry an updatedAt from before it; rows this much older than the last
+# refresh are read again so such writes are not missed
+COMMUNITY_INDEX_REFRESH_OVERLAP_SECONDS = 60
+
+# Columns needed to build the in-memory community search index, optionally only of the rows changed since a time
+GET_COMMUNITY_SEARCH_DOCUMENTS = """
+    SELECT community_id, community_name, community_description, community_city, community_imagePath,
+           community_imageVariants
+    FROM community
+    WHERE :p_since IS NULL OR community_updatedAt >= :p_since
+"""
+# Every existing community, so a refresh can drop the ones deleted by other processes
+GET_COMMUNITY_IDS = "SELECT community_id FROM community"
+
+# Columns needed to build the in-memory nearby communities index. Changed rows are read with or without
+# coordinates, so a community whose coordinates were cleared leaves the index.
+GET_COMMUNITY_GEO_DOCUMENTS = """
+    SELECT community_id, community_name, community_city, community_imagePath,
+           community_latitude, community_longitude, community_imageVariants
+    FROM community
+    WHERE (:p_since IS NULL AND community_latitude IS NOT NULL AND community_longitude IS NOT NULL)
+       OR community_updatedAt >= :p_since
+"""
+GEO_INDEX_FIELDS = ('name', 'city', 'imagePath', 'imageVariants', 'latitude', 'longitude')
+# Image fields carried by both indexes so list results can show the smallest variant
+INDEX_IMAGE_FIELDS = ('imagePath', 'imageVariants')
+
+# Role values stored on a community membership
+COMMUNITY_ROLES = {
+    'owner': 1,
+    'moderator': 2,
+    'member': 3,
+}
+# The roles above as an SQL list. Pending join requests and invites are communityUser rows with other roles,
+# so membership checks and member counts filter on these.
+MEMBER_ROLES_SQL = "(" + ", ".join(str(role) for role in COMMUNITY_ROLES.values()) + ")"
+
+# Keyset page of community members ordered by username, optionally filtered by role and username prefix.
+# The (username, userId) pair makes the order stable even when several members share a username.
+GET_COMMUNITY_USERS_PAGE = text("""
+    SELECT JSON_OBJECT(
+        'userId', u.user_userId,
+        'username', u.user_username,
+        'profilePic', u.user_profilePicturePath,
+        'role', cu.communityUser_role
+    ), u.user_username, u.user_userId
+    FROM communityUser cu
+    JOIN user u ON u.user_userId = cu.communityUser_userId
+    WHERE cu.communityUser_communityId = :p_community_id
+      AND (:p_filter_roles = 0 OR cu.communityUser_role IN :p_roles)
+      AND (:p_name_prefix IS NULL OR u.user_username LIKE :p_name_prefix)
+      AND (:p_after_username IS NULL
+           OR u.user_username > :p_after_username
+           OR (u.user_username = :p_after_username AND u.user_userId > :p_after_user_id))
+    ORDER BY u.user_username, u.user_userId
+    LIMIT :p_limit
+""").bindparams(bindparam('p_roles', expanding=True))
+
+# Largest number of IDs accepted by one batch lookup
+MAX_BATCH_IDS = 100
+
+# Builds the community document. Single, batch and list lookups all build it here, so they share the community
+# cache and read the member and post counts from the counter columns. The variant columns hold {variant: URL}
+# objects.
+COMMUNITY_JSON = """
+    JSON_OBJECT(
+        'id', community_id,
+        'name', community_name,
+        'description', community_description,
+        'imagePath', community_imagePath,
+        'bannerPath', community_bannerPath,
+        'imageVariants', community_imageVariants,
+        'bannerVariants', community_bannerVariants,
+        'isPrivate', community_IsPrivate,
+        'isClosed', community_IsClosed,
+        'createdDate', community_createdDate,
+        'memberCount', community_memberCount,
+        'postCount', community_postCount,
+        'version', community_version,
+        'location', JSON_OBJECT(
+            'street', community_street,
+            'city', community_city,
+            'country', community_country,
+            'timezone', community_timezone,
+            'latitude', community_latitude,
+            'longitude', community_longitude
+        )
+    )
+"""
+COMMUNITY_DOCUMENT = "SELECT community_id, " + COMMUNITY_JSON + " FROM community"
+
+# Communities the user has not joined, the ones offered on the overview page
+GET_COMMUNITIES = "SELECT " + COMMUNITY_JSON + """
+    FROM community
+    WHERE community_IsPrivate = 0 AND NOT EXISTS (
+        SELECT 1 FROM communityUser cu
+        WHERE cu.communityUser_communityId = community.community_id AND cu.communityUser_userId = :userId)
+    ORDER BY community_id
+"""
+
+# Communities the user is a member of, as one JSON array
+GET_USER_COMMUNITIES = "SELECT JSON_ARRAYAGG(" + COMMUNITY_JSON + """)
+    FROM community
+    JOIN communityUser cu ON cu.communityUser_communityId = community.community_id
+    WHERE cu.communityUser_userId = :p_userId AND cu.communityUser_role IN """ + MEMBER_ROLES_SQL + """
+"""
+
+# Resolves many communities in one statement
+GET_COMMUNITIES_BY_IDS = text(COMMUNITY_DOCUMENT + " WHERE community_id IN :p_ids") \
+    .bindparams(bindparam('p_ids', expanding=True))
+
+# Reads a community and locks its row until the transaction ends, so a versioned update can check and write it
+GET_COMMUNITY_FOR_UPDATE = text(COMMUNITY_DOCUMENT + " WHERE community_id = :p_community_id FOR UPDATE")
+
+# Every write to a community moves its version on, so a client's version goes stale whatever was changed
+BUMP_COMMUNITY_VERSION = text("UPDATE community SET community_version = community_version + 1 "
+                              "WHERE community_id = :p_community_id")
+
+# Which of the given communities a user can see: public ones and the private ones they are a member of
+GET_VISIBLE_COMMUNITY_IDS = text("""
+    SELECT c.community_id
+    FROM community c
+    WHERE c.community_id IN :p_ids
+      AND (c.community_IsPrivate = 0 OR EXISTS (
+          SELECT 1 FROM communityUser cu
+          WHERE cu.communityUser_communityId = c.community_id AND cu.communityUser_userId = :p_user_id
+            AND cu.communityUser_role IN """ + MEMBER_ROLES_SQL + """))
+""").bindparams(bindparam('p_ids', expanding=True))
+# IDs checked per GET_VISIBLE_COMMUNITY_IDS statement
+VISIBILITY_CHUNK_SIZE = 1000
 
 
 def community_query_get_communities_by_user_id(user_id):
@@ -19,12 +161,8 @@ def community_query_get_communities_by_user_id(user_id):
             sql = text(GET_USER_COMMUNITIES)
             result = session.execute(sql, {'p_userId': user_id})
             first_result = result.fetchone()
-            # Ensure all additional result sets are consumed
-            while True:
-                if not result.cursor.nextset():
-                    break
-            # Parse the JSON string into a Python object
-            if first_result:
+            # Parse the JSON string into a Python object; the aggregate is NULL when the user has no communities
+            if first_result and first_result[0] is not None:
                 return json.loads(first_result[0])  # Parse the JSON string from the first column
             else:
                 return None
@@ -35,31 +173,107 @@ def community_query_get_communities_by_user_id(user_id):
             session.close()
 
 
-def community_query_get_community_by_id(id_community):
+def community_query_get_community_by_id(id_community, fresh=False):
+    """
+    Returns a single community, served from the read-through cache when possible.
+    Writes that change the community must call community_query_invalidate_community.
+
+    :param fresh: Read the row from the database and refresh the cache with it.
+    """
+    key = str(id_community)
+    if fresh:
+        community = _community_query_load_communities_by_ids([key]).get(key)
+        if community is not None:
+            community_cache.set(key, community)
+        return community
+    return community_cache.get_or_load(key, lambda: _community_query_load_communities_by_ids([key]).get(key))
+
+
+def community_query_get_communities_by_ids(community_ids):
+    """
+    Resolves many communities at once. Cached communities are served from the read cache and all
+    misses are loaded with a single query.
+
+    :param community_ids: List of community IDs, at most MAX_BATCH_IDS.
+    :return: Tuple of (communities in request order, IDs that do not exist).
+    """
+    keys = list(dict.fromkeys(str(community_id) for community_id in community_ids))
+    found = community_cache.get_many_or_load(keys, _community_query_load_communities_by_ids)
+
+    communities = [found[key] for key in keys if key in found]
+    missing = [community_id for community_id in community_ids if str(community_id) not in found]
+    return communities, missing
+
+
+def community_query_get_visible_community_ids(user_id, community_ids):
+    """
+    :return: Set of the given community IDs the user can see. Long lists are checked VISIBILITY_CHUNK_SIZE IDs
+        per statement.
+    """
+    community_ids = list(community_ids)
+    if not community_ids:
+        return set()
     with Session() as session:
         try:
-            sql = text(SINGLE_COMMUNITY)
-            result = session.execute(sql, {'p_id': id_community})
-            first_result = result.fetchone()
-            # Ensure all additional result sets are consumed
-            while True:
-                if not result.cursor.nextset():
-                    break
-            # Parse the JSON string into a Python object
-            if first_result:
-                return json.loads(first_result[0])  # Parse the JSON string from the first column
-            else:
-                return None
+            visible = set()
+            for start in range(0, len(community_ids), VISIBILITY_CHUNK_SIZE):
+                result = session.execute(GET_VISIBLE_COMMUNITY_IDS,
+                                         {'p_ids': community_ids[start:start + VISIBILITY_CHUNK_SIZE],
+                                          'p_user_id': user_id}).fetchall()
+                visible.update(row[0] for row in result)
+            return visible
         except exc.SQLAlchemyError as e:
             session.rollback()
-            raise Exception(f"Database error occurred: {str(e)}")
-        finally:
-            session.close()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def _community_query_load_communities_by_ids(keys):
+    with Session() as session:
+        try:
+            result = session.execute(GET_COMMUNITIES_BY_IDS, {'p_ids': [int(key) for key in keys]}).fetchall()
+            return {str(row[0]): community_document(row[1]) for row in result}
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def community_document(value):
+    """
+    Decodes a community document; its version is the row version, which every write increments.
+    """
+    return json.loads(value)
+
+
+def community_query_invalidate_community(id_community):
+    """
+    Drops a community from the read cache after it has been changed.
+    """
+    community_cache.invalidate(str(id_community))
+
+
+def community_query_forget_community(id_community):
+    """
+    Drops a deleted community from the read cache and from the search and nearby indexes.
+    """
+    community_cache.invalidate(str(id_community))
+    community_search_index.remove(int(id_community))
+    community_geo_index.remove(int(id_community))
+
+
+def community_query_get_cache_stats():
+    return community_cache.stats()
+
+
+def _load_json_column(value):
+    """
+    Decodes a JSON column, which the driver returns as a string.
+    """
+    return json.loads(value) if isinstance(value, (str, bytes)) else value
 
 
 def community_query_get_all_communities(user_id):
     """
-    Fetches all communities from the database using a stored procedure.
+    Fetches the communities the user has not joined, with their counters read from the community row.
     :return: A list of all communities in JSON format, or None if no communities are found.
     """
     session = Session()
@@ -78,6 +292,27 @@ def community_query_get_all_communities(user_id):
         session.close()
 
 
+def community_query_stream_all_communities(user_id):
+    """
+    Streams all communities from the database using a server side cursor.
+    Rows are yielded as the raw JSON strings produced by GET_COMMUNITIES, so nothing is decoded
+    or buffered in the worker beyond the current batch.
+    :return: A generator of JSON strings, one per community.
+    """
+    session = Session()
+    try:
+        sql = text(GET_COMMUNITIES)
+        result = session.execute(sql, {'userId': user_id}, execution_options={'stream_results': True})
+        for row in result.yield_per(STREAM_BATCH_SIZE):
+            if row[0] is not None:
+                yield row[0]
+    except exc.SQLAlchemyError:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
 def community_query_new_community(session, user_id, name, imagePath, bannerPath, description, street, city, country, timezone,
                                   latitude, longitude, is_private, is_closed):
     """
@@ -105,10 +340,20 @@ def community_query_new_community(session, user_id, name, imagePath, bannerPath,
         }
     )
     community_id = session.execute(text("SELECT @p_community_id")).scalar()
+    # The procedure adds the owner as the first member
+    sync_community_counters(session, community_id)
     return community_id
 
 
-def community_query_update_community(community_id, updates):
+def community_query_update_community(community_id, updates, expected_version=None):
+    """
+    Writes changed community fields and increments the row version. Only the given fields are sent to the stored
+    procedure. With no fields to write, only the version is moved on, e.g. to claim it before new images are stored.
+
+    :param expected_version: Version the client edited. The row is locked and the update refused with
+        VersionConflict when its current version differs.
+    :return: The new version of the community.
+    """
     logging.debug("first line in community Query")
     updates_json = json.dumps(updates)
     logging.debug(f"Query Updating community with ID: {community_id} using updates: {updates_json}")
@@ -117,12 +362,28 @@ def community_query_update_community(community_id, updates):
 
     try:
         with Session() as session:
-            session.execute(update_sql, {
-                'p_community_id': community_id,
-                'p_updates': updates_json
-            })
+            if expected_version is not None:
+                row = session.execute(GET_COMMUNITY_FOR_UPDATE, {'p_community_id': community_id}).fetchone()
+                current = community_document(row[1]) if row is not None else None
+                if not version_matches(current, expected_version):
+                    session.rollback()
+                    raise VersionConflict(current)
+            if updates:
+                session.execute(update_sql, {
+                    'p_community_id': community_id,
+                    'p_updates': updates_json
+                })
+            session.execute(BUMP_COMMUNITY_VERSION, {'p_community_id': community_id})
+            version = session.execute(text("SELECT community_version FROM community "
+                                           "WHERE community_id = :p_community_id"),
+                                      {'p_community_id': community_id}).scalar()
             session.commit()
             logging.debug("Community update committed successfully.")
+        if updates:
+            community_query_index_community(community_id, updates)
+        return version
+    except VersionConflict:
+        raise
     except exc.SQLAlchemyError as e:
         logging.error(f"SQLAlchemyError: {e}")
         session.rollback()
@@ -136,6 +397,8 @@ def community_query_delete_community(community_id, id_token: str):
     """
     Deletes a community based on the provided community ID and requester user ID.
     Checks if the requester is the owner of the community before deletion.
+    The procedure does nothing for other requesters, so the caller confirms the row is gone before calling
+    community_query_forget_community.
     """
     delete_sql = text("""
         CALL DeleteCommunity(:p_community_id, :p_requester_userId)
@@ -176,6 +439,188 @@ def community_query_get_all_community_users(community_id):
         session.close()
 
 
+def community_query_stream_all_community_users(community_id):
+    """
+    Streams all community users from the database using a server side cursor.
+    :return: A generator of JSON strings, one per community user.
+    """
+    session = Session()
+    try:
+        sql = text(GET_COMMUNITY_USERS)
+        result = session.execute(sql, {"p_community_id": community_id}, execution_options={'stream_results': True})
+        for row in result.yield_per(STREAM_BATCH_SIZE):
+            if row[0] is not None:
+                yield row[0]
+    except exc.SQLAlchemyError:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _community_query_load_index_documents(sql, since, read_row):
+    """
+    Reads the documents of an in-memory community index, see CommunitySearchIndex.ensure_fresh.
+
+    :param sql: Query selecting the indexed columns, filtered on :p_since.
+    :param since: Database time of the previous load, or None to read every community.
+    :param read_row: Turns one result row into a document.
+    :return: Tuple of (database time of this load, documents, IDs of every community or None on a full load).
+    """
+    with Session() as session:
+        try:
+            as_of = session.execute(text("SELECT NOW(3)")).scalar()
+            if since is not None:
+                since = since - timedelta(seconds=COMMUNITY_INDEX_REFRESH_OVERLAP_SECONDS)
+            result = session.execute(text(sql), {'p_since': since}, execution_options={'stream_results': True})
+            documents = [read_row(row) for row in result.yield_per(STREAM_BATCH_SIZE)]
+            live_ids = None
+            if since is not None:
+                live_ids = {row[0] for row in session.execute(text(GET_COMMUNITY_IDS))}
+            return as_of, documents, live_ids
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def community_query_get_search_documents(since=None):
+    """
+    Loads the searchable fields of the communities changed since the given time, or of every community.
+    :return: Tuple of (database time of the load, list of dictionaries with id, name, description, city, imagePath
+        and imageVariants, IDs of every community or None on a full load).
+    """
+    return _community_query_load_index_documents(
+        GET_COMMUNITY_SEARCH_DOCUMENTS, since,
+        lambda row: {'id': row[0], 'name': row[1], 'description': row[2], 'city': row[3], 'imagePath': row[4],
+                     'imageVariants': _load_json_column(row[5])})
+
+
+def community_query_search_communities(search_text):
+    """
+    Searches communities by name, description and city using the in-memory trigram index, which picks up the
+    writes of other processes every COMMUNITY_INDEX_REFRESH_SECONDS.
+    :return: A ranked list of matching communities, private ones included.
+    """
+    community_search_index.ensure_fresh(community_query_get_search_documents, COMMUNITY_INDEX_REFRESH_SECONDS)
+    return community_search_index.search(search_text)
+
+
+def community_query_get_geo_documents(since=None):
+    """
+    Loads the coordinates of the communities changed since the given time, or of every community.
+    :return: Tuple of (database time of the load, list of dictionaries with id, name, city, imagePath,
+        imageVariants, latitude and longitude, IDs of every community or None on a full load).
+    """
+    return _community_query_load_index_documents(
+        GET_COMMUNITY_GEO_DOCUMENTS, since,
+        lambda row: {'id': row[0], 'name': row[1], 'city': row[2], 'imagePath': row[3],
+                     'latitude': row[4], 'longitude': row[5], 'imageVariants': _load_json_column(row[6])})
+
+
+def community_query_get_communities_within_radius(latitude, longitude, radius_km, limit=None, after=None):
+    """
+    Finds the communities within radius_km of a point using the in-memory spatial index, which picks up the
+    writes of other processes every COMMUNITY_INDEX_REFRESH_SECONDS.
+    :param after: Optional (distance, community_id) position to continue after.
+    :return: A list of (position, community) pairs, nearest first, private communities included.
+    """
+    community_geo_index.ensure_fresh(community_query_get_geo_documents, COMMUNITY_INDEX_REFRESH_SECONDS)
+    return community_geo_index.within_radius(latitude, longitude, radius_km, limit, after)
+
+
+def community_query_get_nearest_communities(latitude, longitude, count, after=None):
+    """
+    Finds the count communities closest to a point using the in-memory spatial index.
+    :param after: Optional (distance, community_id) position to continue after.
+    :return: A list of (position, community) pairs, nearest first, private communities included.
+    """
+    community_geo_index.ensure_fresh(community_query_get_geo_documents, COMMUNITY_INDEX_REFRESH_SECONDS)
+    return community_geo_index.nearest(latitude, longitude, count, after)
+
+
+def community_query_index_community(community_id, fields):
+    """
+    Applies created or changed community fields to the search and nearby indexes once the transaction has been committed.
+    Other processes pick the change up with their next refresh.
+    """
+    # Keyed like the rows the indexes are loaded from, whatever type the route passed the ID as
+    community_id = int(community_id)
+    community_search_index.upsert(community_id, {
+        key: value for key, value in fields.items() if key in SEARCH_FIELD_WEIGHTS or key in INDEX_IMAGE_FIELDS
+    })
+    community_geo_index.upsert(community_id, {
+        key: value for key, value in fields.items() if key in GEO_INDEX_FIELDS
+    })
+
+
+def community_query_get_community_users_page(community_id, limit=None, after=None, roles=None, name_prefix=None):
+    """
+    Fetches one keyset page of community members ordered by username.
+
+    :param community_id: ID of the community whose members are requested.
+    :param limit: Maximum number of members to return.
+    :param after: Opaque cursor returned with the previous page, or None for the first page.
+    :param roles: Optional list of role names ('owner', 'moderator', 'member') to filter on.
+    :param name_prefix: Optional username prefix to search for.
+    :return: Tuple of (list of members, cursor for the next page or None when this was the last page).
+    :raises ValueError: If a role name or the cursor is invalid.
+    """
+    params, limit = build_community_users_page_params(community_id, limit, after, roles, name_prefix)
+
+    with Session() as session:
+        try:
+            result = session.execute(GET_COMMUNITY_USERS_PAGE, params).fetchall()
+            return read_community_users_page(result, limit)
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def build_community_users_page_params(community_id, limit, after, roles, name_prefix):
+    """
+    Validates the member page arguments and turns them into GET_COMMUNITY_USERS_PAGE parameters.
+    :return: Tuple of (query parameters, clamped page size).
+    """
+    limit = clamp_page_limit(limit)
+    position = decode_cursor(after, {'username': str, 'userId': str}) or {}
+
+    role_values = []
+    for role in roles or []:
+        if role not in COMMUNITY_ROLES:
+            raise ValueError(f"Unknown role: {role}")
+        role_values.append(COMMUNITY_ROLES[role])
+
+    if name_prefix:
+        # Escape LIKE wildcards so the prefix is matched literally
+        escaped = name_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        name_pattern = escaped + '%'
+    else:
+        name_pattern = None
+
+    # Ask for one row more than the page size to know whether another page exists
+    return {
+        'p_community_id': community_id,
+        'p_filter_roles': 1 if role_values else 0,
+        'p_roles': role_values or [0],
+        'p_name_prefix': name_pattern,
+        'p_after_username': position.get('username'),
+        'p_after_user_id': position.get('userId'),
+        'p_limit': limit + 1
+    }, limit
+
+
+def read_community_users_page(result, limit):
+    """
+    Decodes the rows of GET_COMMUNITY_USERS_PAGE into a page of members and the next cursor.
+    """
+    rows = result[:limit]
+    members = [json.loads(row[0]) for row in rows]
+    next_cursor = None
+    if len(result) > limit:
+        next_cursor = encode_cursor({'username': rows[-1][1], 'userId': rows[-1][2]})
+    return members, next_cursor
+
+
 def community_query_add_banner(community_id, banner_path):
     """
     Adds a banner path to the specified community in the database.
@@ -183,16 +628,17 @@ def community_query_add_banner(community_id, banner_path):
     :param banner_path: The path to the banner image after it has been uploaded to storage.
     :return: Updates the database with the new banner path or raises an error.
     """
-    try:
-        community = dbsession.query(Community).filter_by(community_id=community_id).one()
-        community.banner_path = banner_path
-        dbsession.commit()
-        return {"message": "Banner added successfully", "banner_path": banner_path}
-    except exc.NoResultFound:
-        raise ValueError("Community not found")
-    except exc.SQLAlchemyError as e:
-        dbsession.rollback()
-        raise SQLAlchemyError(f"Failed to add banner: {str(e)}")
+    with Session() as session:
+        try:
+            community = session.query(Community).filter_by(community_id=community_id).one()
+            community.banner_path = banner_path
+            session.commit()
+            return {"message": "Banner added successfully", "banner_path": banner_path}
+        except exc.NoResultFound:
+            raise ValueError("Community not found")
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Failed to add banner: {str(e)}")
 
 
 def community_query_update_banner(community_id, banner_path):
@@ -202,13 +648,14 @@ def community_query_update_banner(community_id, banner_path):
     :param new_banner_path: The new path to the banner image after it has been uploaded to storage.
     :return: Updates the database with the new banner path or raises an error.
     """
-    try:
-        community = dbsession.query(Community).filter_by(community_id=community_id).one()
-        community.banner_path = banner_path
-        dbsession.commit()
-        return {"message": "Banner added successfully", "banner_path": banner_path}
-    except exc.NoResultFound:
-        raise ValueError("Community not found")
-    except exc.SQLAlchemyError as e:
-        dbsession.rollback()
-        raise SQLAlchemyError(f"Failed to add banner: {str(e)}")
+    with Session() as session:
+        try:
+            community = session.query(Community).filter_by(community_id=community_id).one()
+            community.banner_path = banner_path
+            session.commit()
+            return {"message": "Banner added successfully", "banner_path": banner_path}
+        except exc.NoResultFound:
+            raise ValueError("Community not found")
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Failed to add banner: {str(e)}")
@@ -0,0 +1,257 @@
+from sqlalchemy import exc, text, bindparam
+
+from scripts.handler.error_handler import SQLAlchemyError
+from scripts.modules.mysql.db_session import Session
+
+REPLICATION_PENDING = 'pending'
+REPLICATION_RUNNING = 'running'
+REPLICATION_RETRYING = 'retrying'
+REPLICATION_DONE = 'done'
+REPLICATION_FAILED = 'failed'
+REPLICATION_CANCELLED = 'cancelled'
+
+GET_REPLICATION = """
+    SELECT replication_id, replication_target, replication_source, replication_key, replication_spoolPath,
+           replication_contentType, replication_status, replication_attempts, replication_lastError
+    FROM assetReplication
+"""
+
+UNFINISHED_REPLICATION_STATUSES = (REPLICATION_PENDING, REPLICATION_RUNNING, REPLICATION_RETRYING)
+
+
+def _row_to_replication(row):
+    return {
+        'replicationId': row[0],
+        'target': row[1],
+        'source': row[2],
+        'key': row[3],
+        'spoolPath': row[4],
+        'contentType': row[5],
+        'status': row[6],
+        'attempts': row[7],
+        'lastError': row[8],
+    }
+
+
+def query_create_replication(target, source, key, spool_path, content_type):
+    """
+    :return: The ID of the new replication.
+    """
+    with Session() as session:
+        try:
+            session.execute(
+                text("INSERT INTO assetReplication (replication_target, replication_source, replication_key, "
+                     "replication_spoolPath, replication_contentType) "
+                     "VALUES (:p_target, :p_source, :p_key, :p_spool_path, :p_content_type)"),
+                {'p_target': target, 'p_source': source, 'p_key': key, 'p_spool_path': spool_path,
+                 'p_content_type': content_type})
+            replication_id = session.execute(text("SELECT LAST_INSERT_ID()")).scalar()
+            session.commit()
+            return replication_id
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_get_replication(replication_id):
+    with Session() as session:
+        try:
+            row = session.execute(text(GET_REPLICATION + " WHERE replication_id = :p_replication_id"),
+                                  {'p_replication_id': replication_id}).fetchone()
+            return _row_to_replication(row) if row is not None else None
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_get_claimable_replication_ids(idle_seconds):
+    """
+    Returns the replications a worker may claim: pending and retrying ones untouched for idle_seconds, and running
+    ones whose lease expired because their worker stopped.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("SELECT replication_id FROM assetReplication "
+                     "WHERE (replication_status IN (:p_pending, :p_retrying) "
+                     "AND replication_updatedAt <= NOW() - INTERVAL :p_idle SECOND) "
+                     "OR (replication_status = :p_running AND replication_leaseExpiresAt < NOW()) "
+                     "ORDER BY replication_id"),
+                {'p_pending': REPLICATION_PENDING, 'p_retrying': REPLICATION_RETRYING, 'p_running': REPLICATION_RUNNING,
+                 'p_idle': idle_seconds}).fetchall()
+            return [row[0] for row in result]
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_get_replications_to_reconcile(stale_seconds, limit):
+    """
+    :return: Failed replications, and unfinished ones that have not moved for stale_seconds, oldest first.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text(GET_REPLICATION + " WHERE replication_status = :p_failed OR (replication_status IN :p_statuses "
+                     "AND replication_updatedAt < NOW() - INTERVAL :p_stale_seconds SECOND) "
+                     "ORDER BY replication_id LIMIT :p_limit").bindparams(bindparam('p_statuses', expanding=True)),
+                {'p_failed': REPLICATION_FAILED, 'p_statuses': list(UNFINISHED_REPLICATION_STATUSES),
+                 'p_stale_seconds': stale_seconds, 'p_limit': limit}).fetchall()
+            return [_row_to_replication(row) for row in result]
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_start_replication(replication_id, owner, lease_seconds):
+    """
+    Marks a replication as running for one worker and counts the attempt. Only a pending or retrying
+    replication, or a running one whose lease expired, can be claimed, so a replication queued in several
+    processes is copied by one worker at a time.
+    :return: False if it is held by another worker, or was cancelled or finished in the meantime.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("UPDATE assetReplication SET replication_status = :p_running, replication_owner = :p_owner, "
+                     "replication_leaseExpiresAt = NOW() + INTERVAL :p_lease SECOND, "
+                     "replication_attempts = replication_attempts + 1 "
+                     "WHERE replication_id = :p_replication_id AND (replication_status IN (:p_pending, :p_retrying) "
+                     "OR (replication_status = :p_running AND replication_leaseExpiresAt < NOW()))"),
+                {'p_running': REPLICATION_RUNNING, 'p_owner': owner, 'p_lease': lease_seconds,
+                 'p_replication_id': replication_id, 'p_pending': REPLICATION_PENDING,
+                 'p_retrying': REPLICATION_RETRYING})
+            session.commit()
+            return result.rowcount == 1
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_renew_replication_lease(replication_id, owner, lease_seconds):
+    """
+    Extends the lease of a replication this worker is still copying.
+    :return: False if the replication is no longer held by this worker.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("UPDATE assetReplication SET replication_leaseExpiresAt = NOW() + INTERVAL :p_lease SECOND "
+                     "WHERE replication_id = :p_replication_id AND replication_status = :p_running "
+                     "AND replication_owner = :p_owner"),
+                {'p_lease': lease_seconds, 'p_replication_id': replication_id, 'p_running': REPLICATION_RUNNING,
+                 'p_owner': owner})
+            session.commit()
+            return result.rowcount == 1
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_complete_replication(replication_id, owner):
+    """
+    :return: False if the replication is no longer held by this worker, because it was cancelled while it ran
+        or another worker took it over; nothing is written then.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("UPDATE assetReplication SET replication_status = :p_status, replication_lastError = NULL, "
+                     "replication_owner = NULL, replication_leaseExpiresAt = NULL "
+                     "WHERE replication_id = :p_replication_id AND replication_status = :p_running "
+                     "AND replication_owner = :p_owner"),
+                {'p_status': REPLICATION_DONE, 'p_replication_id': replication_id, 'p_running': REPLICATION_RUNNING,
+                 'p_owner': owner})
+            session.commit()
+            return result.rowcount == 1
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_fail_replication(replication_id, owner, error, final):
+    """
+    Records a failed attempt; final failures are marked failed, others are left to be retried.
+    :return: False if the replication is no longer held by this worker, in which case nothing is written.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("UPDATE assetReplication SET replication_status = :p_status, replication_lastError = :p_error, "
+                     "replication_owner = NULL, replication_leaseExpiresAt = NULL "
+                     "WHERE replication_id = :p_replication_id AND replication_status = :p_running "
+                     "AND replication_owner = :p_owner"),
+                {'p_status': REPLICATION_FAILED if final else REPLICATION_RETRYING, 'p_error': error[:2000],
+                 'p_replication_id': replication_id, 'p_running': REPLICATION_RUNNING, 'p_owner': owner})
+            session.commit()
+            return result.rowcount == 1
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_reset_replication(replication_id, spool_path):
+    """
+    Gives a failed or stalled replication a fresh set of attempts, optionally from a new spool file.
+    A replication still held by a worker whose lease has not run out, or one that finished or was cancelled in
+    the meantime, is left alone.
+    :return: True if the replication was reset.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("UPDATE assetReplication SET replication_status = :p_status, replication_attempts = 0, "
+                     "replication_spoolPath = :p_spool_path, replication_owner = NULL, "
+                     "replication_leaseExpiresAt = NULL "
+                     "WHERE replication_id = :p_replication_id AND (replication_status IN (:p_failed, :p_pending, "
+                     ":p_retrying) OR (replication_status = :p_running AND replication_leaseExpiresAt < NOW()))"),
+                {'p_status': REPLICATION_PENDING, 'p_spool_path': spool_path, 'p_replication_id': replication_id,
+                 'p_failed': REPLICATION_FAILED, 'p_pending': REPLICATION_PENDING,
+                 'p_retrying': REPLICATION_RETRYING, 'p_running': REPLICATION_RUNNING})
+            session.commit()
+            return result.rowcount == 1
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_cancel_replications(keys):
+    """
+    Cancels the outstanding replications of deleted objects, so they are not copied after the delete.
+    :return: Spool paths of the cancelled replications, which are no longer needed.
+    """
+    if not keys:
+        return []
+    with Session() as session:
+        try:
+            statuses = list(UNFINISHED_REPLICATION_STATUSES) + [REPLICATION_FAILED]
+            result = session.execute(
+                text("SELECT replication_spoolPath FROM assetReplication "
+                     "WHERE replication_key IN :p_keys AND replication_status IN :p_statuses FOR UPDATE")
+                .bindparams(bindparam('p_keys', expanding=True), bindparam('p_statuses', expanding=True)),
+                {'p_keys': list(keys), 'p_statuses': statuses}).fetchall()
+            session.execute(
+                text("UPDATE assetReplication SET replication_status = :p_status, replication_owner = NULL, "
+                     "replication_leaseExpiresAt = NULL "
+                     "WHERE replication_key IN :p_keys AND replication_status IN :p_statuses")
+                .bindparams(bindparam('p_keys', expanding=True), bindparam('p_statuses', expanding=True)),
+                {'p_status': REPLICATION_CANCELLED, 'p_keys': list(keys), 'p_statuses': statuses})
+            session.commit()
+            return [row[0] for row in result if row[0]]
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_count_replications():
+    """
+    :return: Dictionary of status to number of replications.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("SELECT replication_status, COUNT(*) FROM assetReplication GROUP BY replication_status")).fetchall()
+            return {row[0]: row[1] for row in result}
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
@@ -0,0 +1,197 @@
+import re
+import threading
+import time
+import unicodedata
+
+# Fields that are indexed and how much a match in each of them counts towards the rank
+SEARCH_FIELD_WEIGHTS = {
+    'name': 3.0,
+    'city': 2.0,
+    'description': 1.0,
+}
+# Extra score for communities whose name starts with the search text
+NAME_PREFIX_BONUS = 2.0
+# Share of the query trigrams a community must contain to be returned at all
+MIN_MATCH_RATIO = 0.6
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def _normalise(value):
+    """
+    Lowercases a value and strips accents so 'Århus' and 'arhus' produce the same trigrams.
+    """
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(value).lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _trigrams(value, partial_last_token=False):
+    """
+    Splits a value into padded word trigrams. Words are padded as '$$word$' so short prefixes still produce grams.
+    When partial_last_token is set the last word is not closed, which lets a query match while the user is typing.
+    """
+    tokens = _TOKEN_PATTERN.findall(_normalise(value))
+    grams = set()
+    for index, token in enumerate(tokens):
+        is_open = partial_last_token and index == len(tokens) - 1
+        padded = f"$${token}" if is_open else f"$${token}$"
+        for start in range(len(padded) - 2):
+            grams.add(padded[start:start + 3])
+    return grams
+
+
+class CommunitySearchIndex:
+    """
+    In-memory inverted trigram index over community name, description and city.
+    Postings map each trigram to the communities containing it, with a bitmask of the fields it occurs in.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._documents = {}
+        self._postings = {}
+        self._loaded = False
+        # Database time of the last load and the monotonic time it was applied at
+        self._as_of = None
+        self._refreshed_at = 0.0
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def load(self, documents):
+        """
+        Replaces the index contents with the given documents.
+
+        :param documents: Iterable of dictionaries with an 'id' key plus the indexed fields.
+        """
+        with self._lock:
+            self._documents = {}
+            self._postings = {}
+            for document in documents:
+                self._add(document['id'], document)
+            self._loaded = True
+
+    def ensure_fresh(self, loader, max_age_seconds):
+        """
+        Builds the index with loader(None) the first time it is needed. After that, once the index is older than
+        max_age_seconds, loader(since) returns what changed in the database since the previous load, so writes
+        handled by other processes reach this index as well. Only one thread refreshes at a time; the others keep
+        searching the current contents meanwhile.
+
+        :param loader: Callable taking the database time of the previous load, or None for everything, and
+            returning (database time of this load, documents, IDs of every existing community or None).
+        """
+        if self._loaded and time.monotonic() - self._refreshed_at < max_age_seconds:
+            return
+        if not self._refresh_lock.acquire(blocking=not self._loaded):
+            return
+        try:
+            if not self._loaded:
+                as_of, documents, _ = loader(None)
+                self.load(documents)
+            elif time.monotonic() - self._refreshed_at >= max_age_seconds:
+                as_of, documents, live_ids = loader(self._as_of)
+                self.refresh(documents, live_ids)
+            else:
+                return
+            self._as_of = as_of
+            self._refreshed_at = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def refresh(self, documents, live_ids=None):
+        """
+        Replaces the entries of changed communities and drops the ones that no longer exist.
+
+        :param documents: Current documents of the communities that changed.
+        :param live_ids: IDs of every existing community, or None to drop nothing.
+        """
+        with self._lock:
+            for document in documents:
+                self._remove(document['id'])
+                self._add(document['id'], document)
+            if live_ids is not None:
+                for community_id in set(self._documents) - set(live_ids):
+                    self._remove(community_id)
+
+    def upsert(self, community_id, fields):
+        """
+        Adds a community or merges changed fields into an existing entry, re-indexing only that community.
+
+        :param community_id: ID of the community.
+        :param fields: Dictionary with any of the indexed fields and 'imagePath'.
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+            document = dict(self._documents.get(community_id, {}))
+            document.update({key: value for key, value in fields.items() if value is not None})
+            self._remove(community_id)
+            self._add(community_id, document)
+
+    def remove(self, community_id):
+        with self._lock:
+            self._remove(community_id)
+
+    def search(self, query):
+        """
+        Returns the communities matching the query ordered by rank.
+
+        :param query: Free text search term.
+        :return: List of dictionaries with the stored community fields and a 'score'.
+        """
+        query_grams = _trigrams(query, partial_last_token=True)
+        if not query_grams:
+            return []
+        normalised_query = _normalise(query).strip()
+
+        with self._lock:
+            matched = {}
+            weighted = {}
+            for gram in query_grams:
+                for community_id, field_mask in self._postings.get(gram, {}).items():
+                    matched[community_id] = matched.get(community_id, 0) + 1
+                    weight = sum(SEARCH_FIELD_WEIGHTS[field] for bit, field in enumerate(SEARCH_FIELD_WEIGHTS)
+                                 if field_mask & (1 << bit))
+                    weighted[community_id] = weighted.get(community_id, 0.0) + weight
+
+            results = []
+            for community_id, count in matched.items():
+                if count / len(query_grams) < MIN_MATCH_RATIO:
+                    continue
+                document = self._documents[community_id]
+                score = weighted[community_id] / len(query_grams)
+                if _normalise(document.get('name')).startswith(normalised_query):
+                    score += NAME_PREFIX_BONUS
+                results.append(dict(document, id=community_id, score=round(score, 4)))
+
+        results.sort(key=lambda result: (-result['score'], result['id']))
+        return results
+
+    def _add(self, community_id, document):
+        self._documents[community_id] = document
+        masks = {}
+        for bit, field in enumerate(SEARCH_FIELD_WEIGHTS):
+            for gram in _trigrams(document.get(field)):
+                masks[gram] = masks.get(gram, 0) | (1 << bit)
+        for gram, mask in masks.items():
+            self._postings.setdefault(gram, {})[community_id] = mask
+
+    def _remove(self, community_id):
+        document = self._documents.pop(community_id, None)
+        if document is None:
+            return
+        for field in SEARCH_FIELD_WEIGHTS:
+            for gram in _trigrams(document.get(field)):
+                posting = self._postings.get(gram)
+                if posting is not None:
+                    posting.pop(community_id, None)
+                    if not posting:
+                        del self._postings[gram]
+
+
+community_search_index = CommunitySearchIndex()
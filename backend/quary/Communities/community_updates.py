@@ -0,0 +1,74 @@
+from decimal import Decimal
+
+# Editable community fields, keyed by the name used in update requests, with their path in the community document
+COMMUNITY_UPDATE_FIELDS = {
+    'name': ('name',),
+    'description': ('description',),
+    'street': ('location', 'street'),
+    'city': ('location', 'city'),
+    'country': ('location', 'country'),
+    'timezone': ('location', 'timezone'),
+    'latitude': ('location', 'latitude'),
+    'longitude': ('location', 'longitude'),
+    'is_private': ('isPrivate',),
+    'is_closed': ('isClosed',),
+}
+
+# Editable post fields, keyed by the name used in update requests, with their path in the post document
+POST_UPDATE_FIELDS = {
+    'description': ('description',),
+    'image_path': ('imagePath',),
+}
+
+# Decimal places numbers are compared at; the coordinate columns do not store more
+NUMBER_PRECISION = 6
+
+
+class VersionConflict(Exception):
+    """
+    Raised when an update was made against a version of the row that is no longer current.
+    """
+
+    def __init__(self, document):
+        super().__init__("The row was changed by another request")
+        self.document = document
+
+
+def _document_value(document, path):
+    for part in path:
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+
+def _normalize(value):
+    """
+    Brings a request value and a stored value to the same form: flags are stored as 0/1 and coordinates
+    as decimals, while requests send booleans and floats.
+    """
+    if isinstance(value, (bool, int, float, Decimal)):
+        return round(float(value), NUMBER_PRECISION)
+    return value
+
+
+def diff_updates(document, updates, fields):
+    """
+    Drops the updates that would write the value the row already has.
+
+    :param document: Current document of the row.
+    :param updates: Requested {field: value} updates.
+    :param fields: COMMUNITY_UPDATE_FIELDS or POST_UPDATE_FIELDS.
+    :return: The updates that change something. Fields that cannot be compared are always kept.
+    """
+    return {
+        key: value for key, value in updates.items()
+        if key not in fields or _normalize(value) != _normalize(_document_value(document, fields[key]))
+    }
+
+
+def version_matches(document, expected_version):
+    """
+    Compares the row version of a document with the version a client sent back, e.g. from an If-Match header.
+    """
+    return document is not None and str(document.get('version')) == str(expected_version).strip()
@@ -0,0 +1,170 @@
+from sqlalchemy import exc, text
+
+from scripts.handler.error_handler import SQLAlchemyError
+from scripts.modules.mysql.db_session import Session
+
+UPLOAD_RECEIVING = 'receiving'
+UPLOAD_COMPLETE = 'complete'
+
+GET_UPLOAD = """
+    SELECT assetUpload_id, assetUpload_userId, assetUpload_entityType, assetUpload_entityId, assetUpload_communityId,
+           assetUpload_assetName, assetUpload_filename, assetUpload_contentType, assetUpload_stagingPath,
+           assetUpload_totalBytes, assetUpload_receivedBytes, assetUpload_status, assetUpload_jobId
+    FROM assetUpload
+    WHERE assetUpload_id = :p_upload_id
+"""
+
+
+def query_create_upload(upload_id, user_id, entity_type, entity_id, community_id, asset_name, filename, content_type,
+                        staging_path, total_bytes):
+    with Session() as session:
+        try:
+            session.execute(
+                text("INSERT INTO assetUpload (assetUpload_id, assetUpload_userId, assetUpload_entityType, "
+                     "assetUpload_entityId, assetUpload_communityId, assetUpload_assetName, assetUpload_filename, "
+                     "assetUpload_contentType, assetUpload_stagingPath, assetUpload_totalBytes) "
+                     "VALUES (:p_upload_id, :p_user_id, :p_entity_type, :p_entity_id, :p_community_id, "
+                     ":p_asset_name, :p_filename, :p_content_type, :p_staging_path, :p_total_bytes)"),
+                {'p_upload_id': upload_id, 'p_user_id': user_id, 'p_entity_type': entity_type,
+                 'p_entity_id': entity_id, 'p_community_id': community_id, 'p_asset_name': asset_name,
+                 'p_filename': filename, 'p_content_type': content_type, 'p_staging_path': staging_path,
+                 'p_total_bytes': total_bytes})
+            session.commit()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_get_upload(upload_id):
+    with Session() as session:
+        try:
+            row = session.execute(text(GET_UPLOAD), {'p_upload_id': upload_id}).fetchone()
+            if row is None:
+                return None
+            return {
+                'uploadId': row[0],
+                'userId': row[1],
+                'entityType': row[2],
+                'entityId': row[3],
+                'communityId': row[4],
+                'asset': row[5],
+                'filename': row[6],
+                'contentType': row[7],
+                'stagingPath': row[8],
+                'totalBytes': row[9],
+                'receivedBytes': row[10],
+                'status': row[11],
+                'jobId': row[12],
+            }
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_claim_upload_chunk(upload_id, offset, writer, lease_seconds):
+    """
+    Claims the upload for one request before it writes a chunk to the staged file. Only an upload still at
+    offset and not claimed by another request, or whose claim ran out, can be claimed.
+    :return: True if the request holds the claim.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("UPDATE assetUpload SET assetUpload_writer = :p_writer, "
+                     "assetUpload_writeLeaseExpiresAt = NOW() + INTERVAL :p_lease SECOND "
+                     "WHERE assetUpload_id = :p_upload_id AND assetUpload_receivedBytes = :p_offset "
+                     "AND assetUpload_status = :p_status "
+                     "AND (assetUpload_writer IS NULL OR assetUpload_writeLeaseExpiresAt < NOW())"),
+                {'p_writer': writer, 'p_lease': lease_seconds, 'p_upload_id': upload_id, 'p_offset': offset,
+                 'p_status': UPLOAD_RECEIVING})
+            session.commit()
+            return result.rowcount == 1
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_release_upload_chunk(upload_id, writer):
+    """
+    Gives up the claim of a request that did not write its chunk.
+    """
+    with Session() as session:
+        try:
+            session.execute(
+                text("UPDATE assetUpload SET assetUpload_writer = NULL, assetUpload_writeLeaseExpiresAt = NULL "
+                     "WHERE assetUpload_id = :p_upload_id AND assetUpload_writer = :p_writer"),
+                {'p_upload_id': upload_id, 'p_writer': writer})
+            session.commit()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_advance_upload(upload_id, offset, received_bytes, writer):
+    """
+    Moves the upload offset forward and releases the claim, but only for the request holding the claim
+    taken at the offset the chunk was written at.
+    :return: True if the offset was advanced.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("UPDATE assetUpload SET assetUpload_receivedBytes = :p_received_bytes, "
+                     "assetUpload_writer = NULL, assetUpload_writeLeaseExpiresAt = NULL "
+                     "WHERE assetUpload_id = :p_upload_id AND assetUpload_receivedBytes = :p_offset "
+                     "AND assetUpload_status = :p_status AND assetUpload_writer = :p_writer"),
+                {'p_received_bytes': received_bytes, 'p_upload_id': upload_id, 'p_offset': offset,
+                 'p_status': UPLOAD_RECEIVING, 'p_writer': writer})
+            session.commit()
+            return result.rowcount == 1
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_complete_upload(session, upload_id, job_id):
+    """
+    Marks an upload complete inside the caller's transaction, together with the asset job created for it.
+    """
+    session.execute(
+        text("UPDATE assetUpload SET assetUpload_status = :p_status, assetUpload_jobId = :p_job_id "
+             "WHERE assetUpload_id = :p_upload_id"),
+        {'p_status': UPLOAD_COMPLETE, 'p_job_id': job_id, 'p_upload_id': upload_id})
+
+
+def query_get_expired_uploads(expiry_seconds, after, limit):
+    """
+    :param after: Upload ID the previous page ended at, or an empty string for the first page.
+    :return: List of (upload ID, staging path) of uploads that stopped receiving chunks expiry_seconds ago.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("SELECT assetUpload_id, assetUpload_stagingPath FROM assetUpload "
+                     "WHERE assetUpload_status = :p_status "
+                     "AND assetUpload_updatedAt < NOW() - INTERVAL :p_expiry_seconds SECOND "
+                     "AND assetUpload_id > :p_after ORDER BY assetUpload_id LIMIT :p_limit"),
+                {'p_status': UPLOAD_RECEIVING, 'p_expiry_seconds': expiry_seconds, 'p_after': after,
+                 'p_limit': limit}).fetchall()
+            return [(row[0], row[1]) for row in result]
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def query_delete_expired_upload(upload_id, expiry_seconds):
+    """
+    Deletes an abandoned upload, unless a chunk arrived since it was found.
+    :return: True if the upload was deleted.
+    """
+    with Session() as session:
+        try:
+            result = session.execute(
+                text("DELETE FROM assetUpload WHERE assetUpload_id = :p_upload_id AND assetUpload_status = :p_status "
+                     "AND assetUpload_updatedAt < NOW() - INTERVAL :p_expiry_seconds SECOND"),
+                {'p_upload_id': upload_id, 'p_status': UPLOAD_RECEIVING, 'p_expiry_seconds': expiry_seconds})
+            session.commit()
+            return result.rowcount == 1
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
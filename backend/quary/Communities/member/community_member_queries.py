@@ -1,17 +1,83 @@
 import json
+from contextlib import contextmanager
 
 from flask import session
-from sqlalchemy import text, exc
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text, exc, bindparam
 
 from scripts.constants.queries_text import ADD_COMMUNITY_USER, COMMUNITY_INVITE, COMMUNITY_REQUEST, \
     ACCEPT_COMMUNITY_INVITE, ACCEPT_COMMUNITY_REQUEST, DENY_COMMUNITY_INVITE, DENY_COMMUNITY_REQUEST, \
     GET_COMMUNITY_INVITES, GET_COMMUNITY_REQUESTS, GET_COMMUNITY_REQUEST_BY_ID, REMOVE_COMMUNITY_USER, LEAVE_COMMUNITY, \
     PROMOTE_MODERATOR, DEMOTE_MODERATOR, CHANGE_OWNER
 from scripts.handler.error_handler import SQLAlchemyError, UnexpectedError
-from scripts.setup.db_setup import engine, dbsession
-
-Session = sessionmaker(bind=engine)
+from scripts.modules.mysql.Communities.community_queries import COMMUNITY_ROLES, MEMBER_ROLES_SQL
+from scripts.modules.mysql.Communities.community_counter_queries import adjust_community_counters
+from scripts.modules.mysql.db_session import Session
+
+# Most users a single bulk membership call may act on
+MAX_BULK_USERS = 200
+
+# Per user outcomes of the bulk membership calls
+BULK_INVITED = 'invited'
+BULK_ALREADY_MEMBER = 'already_member'
+BULK_ALREADY_INVITED = 'already_invited'
+BULK_ACCEPTED = 'accepted'
+BULK_DENIED = 'denied'
+BULK_NO_REQUEST = 'no_request'
+BULK_REMOVED = 'removed'
+BULK_PROMOTED = 'promoted'
+BULK_DEMOTED = 'demoted'
+BULK_NOT_MEMBER = 'not_member'
+BULK_ALREADY_MODERATOR = 'already_moderator'
+BULK_NOT_MODERATOR = 'not_moderator'
+BULK_FORBIDDEN = 'forbidden'
+
+# Moderation changes applied per transaction, so one large call does not hold locks on the whole member list
+MODERATION_CHUNK_SIZE = 50
+
+# Procedure, outcome and parameters of each bulk moderation action
+MODERATION_ACTIONS = {
+    'remove': (REMOVE_COMMUNITY_USER, BULK_REMOVED,
+               lambda requester_id, user_id, community_id: {'p_requester_userId': requester_id, 'p_userId': user_id,
+                                                            'p_communityId': community_id}),
+    'promote': (PROMOTE_MODERATOR, BULK_PROMOTED,
+                lambda requester_id, user_id, community_id: {'p_requester_user_id': requester_id,
+                                                             'p_user_id': user_id, 'p_community_id': community_id}),
+    'demote': (DEMOTE_MODERATOR, BULK_DEMOTED,
+               lambda requester_id, user_id, community_id: {'p_requester_user_id': requester_id,
+                                                            'p_moderator_user_id': user_id,
+                                                            'p_community_id': community_id}),
+}
+BULK_FAILED = 'failed'
+
+GET_MEMBER_ROLES = text("""
+    SELECT communityUser_userId, communityUser_role
+    FROM communityUser
+    WHERE communityUser_communityId = :p_community_id AND communityUser_userId IN :p_user_ids
+""").bindparams(bindparam('p_user_ids', expanding=True))
+
+# Locks the membership rows of the given users, so concurrent changes to them count once. Pending requests and
+# invites are locked as well, since accepting one turns it into a membership, but only members are counted.
+COUNT_MEMBERS_FOR_UPDATE = text("""
+    SELECT COALESCE(SUM(communityUser_role IN """ + MEMBER_ROLES_SQL + """), 0)
+    FROM communityUser
+    WHERE communityUser_communityId = :p_community_id AND communityUser_userId IN :p_user_ids
+    FOR UPDATE
+""").bindparams(bindparam('p_user_ids', expanding=True))
+
+
+@contextmanager
+def _counting_members(session, community_id, user_ids):
+    """
+    Moves the community's member count by the number of the given users that became members or stopped being
+    members while the block ran; sending, accepting or denying a request or invite counts by its role.
+    The count changes in the same transaction as the membership, and only by what actually changed.
+    """
+    params = {'p_community_id': community_id, 'p_user_ids': list(user_ids)}
+    before = session.execute(COUNT_MEMBERS_FOR_UPDATE, params).scalar() if user_ids else 0
+    yield
+    if user_ids:
+        after = session.execute(COUNT_MEMBERS_FOR_UPDATE, params).scalar()
+        adjust_community_counters(session, community_id, members=after - before)
 
 
 def get_query_community_requests(community_id):
@@ -23,7 +89,8 @@ def get_query_community_requests(community_id):
     """
     try:
         sql = text(GET_COMMUNITY_REQUESTS)  # Ensure this is your correct SQL query
-        result = dbsession.execute(sql, {"p_community_id": community_id}).fetchall()
+        with Session() as session:
+            result = session.execute(sql, {"p_community_id": community_id}).fetchall()
 
         if not result:
             return []  # Return an empty list if no results are found
@@ -37,10 +104,42 @@ def get_query_community_requests(community_id):
         raise UnexpectedError(f"An unexpected error occurred: {str(e)}")
 
 
+def read_community_request_users(rows):
+    """
+    Decodes the rows of GET_COMMUNITY_REQUESTS, which hold a JSON array of the requesting users, into one list.
+    """
+    users = []
+    for row in rows:
+        if row[0] is None:
+            continue
+        requests = json.loads(row[0])
+        users.extend(requests if isinstance(requests, list) else [requests])
+    return users
+
+
+def query_count_community_requests(community_id):
+    """
+    Counts the pending join requests of a community.
+
+    :param community_id: ID of the community to count requests for
+    :return: Number of pending requests
+    """
+    session = Session()
+    try:
+        result = session.execute(text(GET_COMMUNITY_REQUESTS), {"p_community_id": community_id}).fetchall()
+        return len(read_community_request_users(result))
+    except exc.SQLAlchemyError as e:
+        session.rollback()
+        raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+    finally:
+        session.close()
+
+
 def get_query_community_request_by_id(community_id, user_id):
     try:
         sql = text(GET_COMMUNITY_REQUEST_BY_ID)  # Ensure this is your correct SQL query
-        result = dbsession.execute(sql, {"p_communityId": community_id, "p_userId": user_id}).fetchall()
+        with Session() as session:
+            result = session.execute(sql, {"p_communityId": community_id, "p_userId": user_id}).fetchall()
 
         if not result:
             return []  # Return an empty list if no results are found
@@ -93,7 +192,8 @@ def accept_query_community_request(user_id, community_id):
         # Start a transaction
         session.begin()
         sql = text(ACCEPT_COMMUNITY_REQUEST)
-        session.execute(sql, {'p_userId': user_id, 'p_communityId': community_id})
+        with _counting_members(session, community_id, [user_id]):
+            session.execute(sql, {'p_userId': user_id, 'p_communityId': community_id})
         session.commit()  # Commit the transaction
         print("Community request has been accepted.")
     except SQLAlchemyError as e:
@@ -143,7 +243,8 @@ def get_query_community_invites(user_id):
     """
     try:
         sql = text(GET_COMMUNITY_INVITES)  # Correctly reference the stored procedure
-        result = dbsession.execute(sql, {'p_userId': user_id}).fetchall()
+        with Session() as session:
+            result = session.execute(sql, {'p_userId': user_id}).fetchall()
 
         if not result or result[0][0] is None:
             return []  # Return an empty list if no results or null results are found
@@ -194,7 +295,8 @@ def accept_query_community_invite(user_id, community_id):
         # Start a transaction
         session.begin()
         sql = text(ACCEPT_COMMUNITY_INVITE)
-        session.execute(sql, {'p_userId': user_id, 'p_communityId': community_id})
+        with _counting_members(session, community_id, [user_id]):
+            session.execute(sql, {'p_userId': user_id, 'p_communityId': community_id})
         session.commit()  # Commit the transaction
         print("Community invite has been accepted.")
     except SQLAlchemyError as e:
@@ -238,7 +340,8 @@ def deny_query_community_invite(community_id, user_id):
 def query_add_community_user(user_id, community_id):
     session = Session()
     try:
-        session.execute(text(ADD_COMMUNITY_USER), {'p_user_userId': user_id, 'p_community_id': community_id})
+        with _counting_members(session, community_id, [user_id]):
+            session.execute(text(ADD_COMMUNITY_USER), {'p_user_userId': user_id, 'p_community_id': community_id})
         session.commit()
     except Exception as e:
         session.rollback()
@@ -250,8 +353,9 @@ def query_add_community_user(user_id, community_id):
 def query_remove_user_from_community(requester_user_id, user_id, community_id):
     session = Session()
     try:
-        session.execute(text(REMOVE_COMMUNITY_USER),
-                        {'p_requester_userId': requester_user_id, 'p_userId': user_id, 'p_communityId': community_id})
+        with _counting_members(session, community_id, [user_id]):
+            session.execute(text(REMOVE_COMMUNITY_USER), {'p_requester_userId': requester_user_id,
+                                                          'p_userId': user_id, 'p_communityId': community_id})
         session.commit()
     except Exception as e:
         session.rollback()
@@ -263,7 +367,8 @@ def query_remove_user_from_community(requester_user_id, user_id, community_id):
 def query_leave_community(user_id, community_id):
     session = Session()
     try:
-        session.execute(text(LEAVE_COMMUNITY), {'p_userId': user_id, 'p_communityId': community_id})
+        with _counting_members(session, community_id, [user_id]):
+            session.execute(text(LEAVE_COMMUNITY), {'p_userId': user_id, 'p_communityId': community_id})
         session.commit()
     except Exception as e:
         session.rollback()
@@ -306,4 +411,201 @@ def query_community_user_change_owner(requester_id, user_id, community_id):
         session.rollback()
         raise e
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+
+def _get_member_roles(session, community_id, user_ids):
+    """
+    :return: Dictionary of user ID to role value for the given users that are members of the community.
+    """
+    if not user_ids:
+        return {}
+    result = session.execute(GET_MEMBER_ROLES, {'p_community_id': community_id, 'p_user_ids': list(user_ids)})
+    return {row[0]: row[1] for row in result.fetchall()}
+
+
+def query_get_member_roles(community_id, user_ids):
+    with Session() as session:
+        try:
+            return _get_member_roles(session, community_id, user_ids)
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+
+def _execute_batched(session, sql, params):
+    """
+    Runs one statement for many parameter sets inside the caller's transaction and commit.
+    The sets are passed to the driver's executemany. PyMySQL only folds INSERT ... VALUES into one multi-row
+    statement; for the CALL statements used here it still sends one statement per set, so this saves a
+    transaction and commit per item, not round trips. Only when the batch fails is each set run again under its
+    own savepoint, to find the ones that fail while keeping the rest.
+
+    :return: Dictionary of the index of each failed parameter set to its exception.
+    """
+    if not params:
+        return {}
+    try:
+        with session.begin_nested():
+            session.execute(sql, params)
+        return {}
+    except exc.DBAPIError:
+        pass
+
+    failures = {}
+    for index, param in enumerate(params):
+        try:
+            with session.begin_nested():
+                session.execute(sql, param)
+        except exc.DBAPIError as e:
+            failures[index] = e
+    return failures
+
+
+def query_bulk_invite(community_id, user_ids):
+    """
+    Invites many users to a community in one transaction, skipping users that are members already.
+    The invites go through the COMMUNITY_INVITE procedure; a duplicate key means the user was already invited.
+
+    :param user_ids: IDs of the users to invite, without duplicates.
+    :return: Dictionary of user ID to (status, error message or None).
+    """
+    with Session() as session:
+        try:
+            members = _get_member_roles(session, community_id, user_ids)
+            to_invite = [user_id for user_id in user_ids if user_id not in members]
+            failures = _execute_batched(session, text(COMMUNITY_INVITE),
+                                        [{'p_userId': user_id, 'p_communityId': community_id}
+                                         for user_id in to_invite])
+            session.commit()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+    results = {user_id: (BULK_ALREADY_MEMBER, None) for user_id in members}
+    for index, user_id in enumerate(to_invite):
+        error = failures.get(index)
+        if error is None:
+            results[user_id] = (BULK_INVITED, None)
+        elif isinstance(error, exc.IntegrityError):
+            results[user_id] = (BULK_ALREADY_INVITED, None)
+        else:
+            results[user_id] = (BULK_FAILED, str(error.orig))
+    return results
+
+
+def _get_pending_request_user_ids(session, community_id):
+    """
+    :return: Set of the IDs of users with a pending request to join the community.
+    """
+    result = session.execute(text(GET_COMMUNITY_REQUESTS), {"p_community_id": community_id}).fetchall()
+    return {join_request['userId'] for join_request in read_community_request_users(result)}
+
+
+def query_bulk_resolve_requests(community_id, user_ids, accept):
+    """
+    Accepts or denies many join requests in one transaction and one commit.
+    Users without a pending request are reported instead of being passed to the procedure.
+
+    :param user_ids: IDs of the requesting users, without duplicates.
+    :param accept: True to accept the requests, False to deny them.
+    :return: Dictionary of user ID to (status, error message or None).
+    """
+    with Session() as session:
+        try:
+            pending = _get_pending_request_user_ids(session, community_id)
+            members = _get_member_roles(session, community_id, [user_id for user_id in user_ids
+                                                                 if user_id not in pending])
+            to_resolve = [user_id for user_id in user_ids if user_id in pending]
+            if accept:
+                sql = text(ACCEPT_COMMUNITY_REQUEST)
+                params = [{'p_userId': user_id, 'p_communityId': community_id} for user_id in to_resolve]
+            else:
+                sql = text(DENY_COMMUNITY_REQUEST)
+                params = [{'p_community_id': community_id, 'p_userId': user_id} for user_id in to_resolve]
+            with _counting_members(session, community_id, to_resolve if accept else []):
+                failures = _execute_batched(session, sql, params)
+            session.commit()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+
+    results = {user_id: (BULK_ALREADY_MEMBER if user_id in members else BULK_NO_REQUEST, None)
+               for user_id in user_ids if user_id not in pending}
+    for index, user_id in enumerate(to_resolve):
+        error = failures.get(index)
+        if error is None:
+            results[user_id] = (BULK_ACCEPTED if accept else BULK_DENIED, None)
+        else:
+            results[user_id] = (BULK_FAILED, str(error.orig))
+    return results
+
+
+def _check_moderation(requester_id, requester_role, user_id, role, action):
+    """
+    :return: The status that stops the change, or None when it can be applied.
+    """
+    if role is None:
+        return BULK_NOT_MEMBER
+    if user_id == requester_id or role == COMMUNITY_ROLES['owner']:
+        return BULK_FORBIDDEN
+    if action == 'remove':
+        # Moderators can remove members, only the owner can remove moderators
+        if role == COMMUNITY_ROLES['moderator'] and requester_role != COMMUNITY_ROLES['owner']:
+            return BULK_FORBIDDEN
+        return None
+    if requester_role != COMMUNITY_ROLES['owner']:
+        return BULK_FORBIDDEN
+    if action == 'promote' and role == COMMUNITY_ROLES['moderator']:
+        return BULK_ALREADY_MODERATOR
+    if action == 'demote' and role != COMMUNITY_ROLES['moderator']:
+        return BULK_NOT_MODERATOR
+    return None
+
+
+def _moderate_chunk(requester_id, requester_role, community_id, changes):
+    results = {}
+    with Session() as session:
+        try:
+            roles = _get_member_roles(session, community_id, [user_id for user_id, _ in changes])
+            allowed = {}
+            for user_id, action in changes:
+                blocked = _check_moderation(requester_id, requester_role, user_id, roles.get(user_id), action)
+                if blocked:
+                    results[user_id] = (blocked, None)
+                else:
+                    allowed.setdefault(action, []).append(user_id)
+
+            with _counting_members(session, community_id, allowed.get('remove', [])):
+                for action, user_ids in allowed.items():
+                    procedure, done_status, params = MODERATION_ACTIONS[action]
+                    failures = _execute_batched(session, text(procedure),
+                                                [params(requester_id, user_id, community_id) for user_id in user_ids])
+                    for index, user_id in enumerate(user_ids):
+                        error = failures.get(index)
+                        results[user_id] = (done_status, None) if error is None else (BULK_FAILED, str(error.orig))
+            session.commit()
+        except exc.SQLAlchemyError as e:
+            session.rollback()
+            # Nothing in the chunk was kept, so every change that was not refused up front failed
+            for user_id, _ in changes:
+                if user_id not in results or results[user_id][0] in (BULK_REMOVED, BULK_PROMOTED, BULK_DEMOTED):
+                    results[user_id] = (BULK_FAILED, str(e))
+    return results
+
+
+def query_bulk_moderate(requester_id, requester_role, community_id, changes):
+    """
+    Removes, promotes and demotes many members, one transaction per MODERATION_CHUNK_SIZE changes.
+    Changes the requester's role does not allow, or that would change nothing, are reported without being run.
+    A chunk that fails to commit is reported as failed and the following chunks still run.
+
+    :param requester_role: Role value of the requester, read once by the caller.
+    :param changes: List of (user ID, action) with action 'remove', 'promote' or 'demote', one per user.
+    :return: Dictionary of user ID to (status, error message or None).
+    """
+    results = {}
+    for start in range(0, len(changes), MODERATION_CHUNK_SIZE):
+        results.update(_moderate_chunk(requester_id, requester_role, community_id,
+                                       changes[start:start + MODERATION_CHUNK_SIZE]))
+    return results
@@ -0,0 +1,57 @@
+import base64
+import binascii
+import json
+
+DEFAULT_PAGE_LIMIT = 20
+MAX_PAGE_LIMIT = 100
+
+
+def clamp_page_limit(limit):
+    """
+    Normalises a client supplied page size into the range the queries allow.
+
+    :param limit: The requested page size, or None to use the default.
+    :return: An int between 1 and MAX_PAGE_LIMIT.
+    """
+    if limit is None:
+        return DEFAULT_PAGE_LIMIT
+    return max(1, min(int(limit), MAX_PAGE_LIMIT))
+
+
+def encode_cursor(values):
+    """
+    Encodes the keyset position of the last row on a page into an opaque cursor string.
+
+    :param values: Dictionary with the sort key values of the last row returned.
+    :return: A url safe cursor string, or None if there is no position to encode.
+    """
+    if not values:
+        return None
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    """
+    Decodes a cursor produced by encode_cursor back into its keyset values.
+
+    :param cursor: The opaque cursor string sent by the client.
+    :param fields: Dictionary of the keys the cursor must hold to the type of their value, e.g. {'postId': int}.
+    :return: Dictionary with the keyset values, or None if no cursor was given.
+    :raises ValueError: If the cursor is malformed or a key is missing or of the wrong type.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, ValueError, UnicodeError):
+        raise ValueError("Invalid pagination cursor")
+    if not isinstance(values, dict):
+        raise ValueError("Invalid pagination cursor")
+    for name, value_type in fields.items():
+        value = values.get(name)
+        # bool is an int subclass, but true is not a valid position
+        if not isinstance(value, value_type) or isinstance(value, bool):
+            raise ValueError("Invalid pagination cursor")
+    return values
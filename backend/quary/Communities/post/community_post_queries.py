@@ -1,14 +1,98 @@
 import json
-from sqlalchemy import exc, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import exc, text, bindparam
 
 from scripts.constants.queries_text import GET_ALL_COMMUNITY_POSTS, GET_ALL_COMMUNITY_USER_POSTS, \
-    GET_COMMUNITY_POST_BY_ID, CREATE_COMMUNITY_POST, UPDATE_COMMUNITY_POST, DELETE_COMMUNITY_POST, HIDE_COMMUNITY_POST, \
+    CREATE_COMMUNITY_POST, UPDATE_COMMUNITY_POST, DELETE_COMMUNITY_POST, HIDE_COMMUNITY_POST, \
     SHOW_COMMUNITY_POST
 from scripts.handler.error_handler import SQLAlchemyError, UnexpectedError
-from scripts.setup.db_setup import engine
+from scripts.modules.mysql.Communities.community_cache import community_post_cache
+from scripts.modules.mysql.Communities.community_counter_queries import adjust_community_counters
+from scripts.modules.mysql.Communities.community_updates import VersionConflict, version_matches
+from scripts.modules.mysql.Communities.pagination import clamp_page_limit, encode_cursor, decode_cursor
+from scripts.modules.mysql.db_session import Session
 
-Session = sessionmaker(bind=engine)
+# Keyset page of a community feed, newest first. Seeks on the post id instead of using OFFSET so every page
+# costs the same index range scan regardless of how many posts the community already has.
+GET_COMMUNITY_POSTS_PAGE = """
+    SELECT JSON_OBJECT(
+        'postId', cp.communityPost_postId,
+        'communityId', cp.communityPost_communityId,
+        'description', cp.communityPost_description,
+        'imagePath', cp.communityPost_imagePath,
+        'imageVariants', cp.communityPost_imageVariants,
+        'date', cp.communityPost_date,
+        'user', JSON_OBJECT(
+            'userId', u.user_userId,
+            'username', u.user_username,
+            'profilePicturePath', u.user_profilePicturePath
+        )
+    ), cp.communityPost_postId
+    FROM communityPost cp
+    JOIN user u ON u.user_userId = cp.communityPost_userId
+    WHERE cp.communityPost_communityId = :p_community_id
+      AND cp.communityPost_isHidden = 0
+      AND (:p_after_id IS NULL OR cp.communityPost_postId < :p_after_id)
+    ORDER BY cp.communityPost_postId DESC
+    LIMIT :p_limit
+"""
+
+# Builds the post document. Single and batch lookups both build it here so they can share the post cache.
+# imageVariants holds a {variant: URL} object.
+COMMUNITY_POST_DOCUMENT = """
+    SELECT cp.communityPost_postId, JSON_OBJECT(
+        'postId', cp.communityPost_postId,
+        'communityId', cp.communityPost_communityId,
+        'description', cp.communityPost_description,
+        'imagePath', cp.communityPost_imagePath,
+        'imageVariants', cp.communityPost_imageVariants,
+        'date', cp.communityPost_date,
+        'version', cp.communityPost_version,
+        'user', JSON_OBJECT(
+            'userId', u.user_userId,
+            'username', u.user_username,
+            'profilePicturePath', u.user_profilePicturePath
+        )
+    )
+    FROM communityPost cp
+    JOIN user u ON u.user_userId = cp.communityPost_userId
+"""
+
+# Resolves many posts in one statement
+GET_COMMUNITY_POSTS_BY_IDS = text(COMMUNITY_POST_DOCUMENT + " WHERE cp.communityPost_postId IN :p_ids") \
+    .bindparams(bindparam('p_ids', expanding=True))
+
+# Reads a post and locks its row, but not its author's, until the transaction ends
+GET_COMMUNITY_POST_FOR_UPDATE = text(COMMUNITY_POST_DOCUMENT
+                                     + " WHERE cp.communityPost_postId = :p_postId FOR UPDATE OF cp")
+
+
+# Locks a post while a change to it is applied, so its community's post count moves once per change
+GET_POST_VISIBILITY_FOR_UPDATE = text("""
+    SELECT communityPost_communityId, communityPost_isHidden
+    FROM communityPost
+    WHERE communityPost_postId = :p_post_id
+    FOR UPDATE
+""")
+
+
+def _post_visibility(session, post_id):
+    """
+    :return: Tuple of (community ID or None when the post does not exist, whether the post is visible).
+    """
+    row = session.execute(GET_POST_VISIBILITY_FOR_UPDATE, {'p_post_id': post_id}).fetchone()
+    return (row[0], not row[1]) if row is not None else (None, False)
+
+
+def _execute_counting_posts(session, post_id, sql, params):
+    """
+    Runs a statement that creates, deletes, hides or shows a post and moves its community's post count by
+    whether the post became visible or stopped being visible.
+    """
+    community_id, visible_before = _post_visibility(session, post_id)
+    session.execute(sql, params)
+    after_community_id, visible_after = _post_visibility(session, post_id)
+    if visible_after != visible_before:
+        adjust_community_counters(session, community_id or after_community_id, posts=1 if visible_after else -1)
 
 
 def query_get_all_community_user_posts(user_id):
@@ -33,30 +117,53 @@ def query_get_all_community_user_posts(user_id):
         session.close()
 
 
-def query_get_community_post_by_id(post_id):
+def query_get_community_post_by_id(post_id, fresh=False):
+    """
+    Returns a single post, served from the read-through post cache when possible.
+
+    :param fresh: Read the row from the database and refresh the cache with it.
+    """
+    key = str(post_id)
+    if fresh:
+        post = _query_load_community_posts_by_ids([key]).get(key)
+        if post is not None:
+            community_post_cache.set(key, post)
+        return post
+    return community_post_cache.get_or_load(key, lambda: _query_load_community_posts_by_ids([key]).get(key))
+
+
+def query_get_community_posts_by_ids(post_ids):
+    """
+    Resolves many posts at once. Cached posts are served from the post cache and all misses are loaded
+    with a single query.
+
+    :param post_ids: List of post IDs.
+    :return: Tuple of (posts in request order, IDs that do not exist).
+    """
+    keys = list(dict.fromkeys(str(post_id) for post_id in post_ids))
+    found = community_post_cache.get_many_or_load(keys, _query_load_community_posts_by_ids)
+
+    posts = [found[key] for key in keys if key in found]
+    missing = [post_id for post_id in post_ids if str(post_id) not in found]
+    return posts, missing
+
+
+def query_invalidate_community_post(post_id):
+    community_post_cache.invalidate(str(post_id))
+
+
+def _query_load_community_posts_by_ids(keys):
     with Session() as session:
         try:
-            # Execute the stored procedure with the provided post_id
-            sql = text(GET_COMMUNITY_POST_BY_ID)
-            result = session.execute(sql, {'p_postId': post_id})
-
-            # Attempt to fetch the first row of the result
-            first_result = result.fetchone()
-
-            # Ensure all additional result sets are consumed
-            while True:
-                if not result.cursor.nextset():
-                    break
-
-            # If data is found, return it as a JSON object, otherwise return None
-            return json.loads(first_result[0]) if first_result else None
-        except SQLAlchemyError as e:
-            # Rollback the session in the event of an error to avoid any database inconsistencies
+            result = session.execute(GET_COMMUNITY_POSTS_BY_IDS, {'p_ids': [int(key) for key in keys]}).fetchall()
+            return {str(row[0]): _post_document(row[1]) for row in result}
+        except exc.SQLAlchemyError as e:
             session.rollback()
             raise SQLAlchemyError(f"Database error occurred: {str(e)}")
-        except Exception as e:
-            # General exception handling to catch any other unexpected errors
-            raise Exception(f"An unexpected error occurred: {str(e)}")
+
+
+def _post_document(value):
+    return json.loads(value)
 
 
 def query_get_all_community_posts(community_id):
@@ -84,6 +191,51 @@ def query_get_all_community_posts(community_id):
         session.close()
 
 
+def query_get_community_posts_page(community_id, limit=None, after=None):
+    """
+    Fetches one keyset page of posts for a community, newest first.
+
+    :param community_id: ID of the community whose feed is requested.
+    :param limit: Maximum number of posts to return.
+    :param after: Opaque cursor returned with the previous page, or None for the first page.
+    :return: Tuple of (list of posts, cursor for the next page or None when this was the last page).
+    """
+    params, limit = build_community_posts_page_params(community_id, limit, after)
+
+    session = Session()
+    try:
+        result = session.execute(text(GET_COMMUNITY_POSTS_PAGE), params).fetchall()
+        return read_community_posts_page(result, limit)
+    except exc.SQLAlchemyError as e:
+        session.rollback()
+        raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+    finally:
+        session.close()
+
+
+def build_community_posts_page_params(community_id, limit, after):
+    """
+    Validates the feed page arguments and turns them into GET_COMMUNITY_POSTS_PAGE parameters.
+    :return: Tuple of (query parameters, clamped page size).
+    """
+    limit = clamp_page_limit(limit)
+    position = decode_cursor(after, {'postId': int})
+    after_id = position['postId'] if position else None
+
+    # Ask for one row more than the page size to know whether another page exists
+    return {'p_community_id': community_id, 'p_after_id': after_id, 'p_limit': limit + 1}, limit
+
+
+def read_community_posts_page(result, limit):
+    """
+    Decodes the rows of GET_COMMUNITY_POSTS_PAGE into a page of posts and the next cursor.
+    """
+    rows = result[:limit]
+    posts = [json.loads(row[0]) for row in rows]
+    next_cursor = encode_cursor({'postId': rows[-1][1]}) if len(result) > limit else None
+    return posts, next_cursor
+
+
 def query_create_community_post(session, user_id, community_id, description):
     try:
         session.execute(text(CREATE_COMMUNITY_POST),
@@ -95,6 +247,8 @@ def query_create_community_post(session, user_id, community_id, description):
                         )
 
         post_id = session.execute(text("SELECT @p_post_id")).scalar()
+        if _post_visibility(session, post_id)[1]:
+            adjust_community_counters(session, community_id, posts=1)
         return post_id
 
     except exc.SQLAlchemyError as e:
@@ -104,15 +258,35 @@ def query_create_community_post(session, user_id, community_id, description):
         raise UnexpectedError(f"An unexpected error occurred: {str(e)}")
 
 
-def query_update_community_post(post_id, updates):
+def query_update_community_post(post_id, updates, expected_version=None):
+    """
+    Writes changed post fields and increments the row version.
+
+    :param expected_version: Version the client edited. The row is locked and the update refused with
+        VersionConflict when its current version differs.
+    :return: The new version of the post.
+    """
     updates_json = json.dumps(updates)
     try:
         with Session() as session:
+            if expected_version is not None:
+                row = session.execute(GET_COMMUNITY_POST_FOR_UPDATE, {'p_postId': post_id}).fetchone()
+                current = _post_document(row[1]) if row is not None else None
+                if not version_matches(current, expected_version):
+                    session.rollback()
+                    raise VersionConflict(current)
             sql = text(UPDATE_COMMUNITY_POST)
             session.execute(
                 sql, {'p_postId': post_id, 'p_updates': updates_json}
             )
+            session.execute(text("UPDATE communityPost SET communityPost_version = communityPost_version + 1 "
+                                 "WHERE communityPost_postId = :p_postId"), {'p_postId': post_id})
+            version = session.execute(text("SELECT communityPost_version FROM communityPost "
+                                           "WHERE communityPost_postId = :p_postId"), {'p_postId': post_id}).scalar()
             session.commit()
+            return version
+    except VersionConflict:
+        raise
     except exc.SQLAlchemyError as e:
         session.rollback()
         raise SQLAlchemyError(f"Database error occurred: {str(e)}")
@@ -124,9 +298,7 @@ def query_delete_community_post(post_id):
     try:
         with Session() as session:
             sql = text(DELETE_COMMUNITY_POST)
-            session.execute(
-                sql, {'p_post_id': post_id}
-            )
+            _execute_counting_posts(session, post_id, sql, {'p_post_id': post_id})
             session.commit()
     except exc.SQLAlchemyError as e:
         session.rollback()
@@ -139,7 +311,7 @@ def query_hide_community_post(post_id):
     try:
         with Session() as session:
             sql = text(HIDE_COMMUNITY_POST)
-            session.execute(sql, {'p_post_id': post_id})
+            _execute_counting_posts(session, post_id, sql, {'p_post_id': post_id})
             session.commit()
     except exc.SQLAlchemyError as e:
         session.rollback()
@@ -152,7 +324,7 @@ def query_show_community_post(post_id):
     try:
         with Session() as session:
             sql = text(SHOW_COMMUNITY_POST)
-            session.execute(sql, {'p_post_id': post_id})
+            _execute_counting_posts(session, post_id, sql, {'p_post_id': post_id})
             session.commit()
     except exc.SQLAlchemyError as e:
         session.rollback()
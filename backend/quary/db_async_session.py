@@ -0,0 +1,124 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import os
+import threading
+
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from scripts.modules.mysql.db_session import engine as sync_engine, PoolMetrics, instrument_pool, \
+    pool_stats_providers, DB_ASYNC_POOL_SIZE, DB_ASYNC_MAX_OVERFLOW, DB_POOL_RECYCLE_SECONDS, \
+    DB_POOL_TIMEOUT_SECONDS, DB_POOL_PRE_PING
+
+# Driver used for the async engine, e.g. aiomysql or asyncmy
+DB_ASYNC_DRIVER = os.getenv('DB_ASYNC_DRIVER', 'mysql+aiomysql')
+# Longest time a request thread waits for an async view before giving up
+DB_ASYNC_QUERY_TIMEOUT_SECONDS = float(os.getenv('DB_ASYNC_QUERY_TIMEOUT_SECONDS', 30))
+
+if DB_ASYNC_POOL_SIZE < 1:
+    raise ValueError("The async resources need DB_ASYNC_POOL_SIZE of at least 1")
+
+# Sized out of the DB_POOL_SIZE and DB_MAX_OVERFLOW budget of db_session, see DB_ASYNC_POOL_SIZE there
+async_engine = create_async_engine(
+    sync_engine.url.set(drivername=DB_ASYNC_DRIVER),
+    pool_size=DB_ASYNC_POOL_SIZE,
+    max_overflow=DB_ASYNC_MAX_OVERFLOW,
+    pool_recycle=DB_POOL_RECYCLE_SECONDS,
+    pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+
+AsyncSessionLocal = sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+
+async_pool_metrics = PoolMetrics()
+instrument_pool(async_engine.sync_engine, async_pool_metrics)
+
+
+def get_async_pool_stats():
+    """
+    Returns live usage and counters of the async pool, reported by get_pool_stats under 'async'.
+    """
+    pool = async_engine.sync_engine.pool
+    stats = {
+        "poolSize": pool.size(),
+        "maxOverflow": DB_ASYNC_MAX_OVERFLOW,
+        "checkedOut": pool.checkedout(),
+        "checkedIn": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+    }
+    stats.update(async_pool_metrics.snapshot())
+    return stats
+
+
+pool_stats_providers['async'] = get_async_pool_stats
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """
+    Returns the event loop that owns every async database connection, starting it on first use.
+    Async connections are bound to the loop that opened them, so all async views of the process run on this
+    one loop in a background thread instead of on a fresh loop per request.
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='db-async-loop', daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def _copy_outcome(task, future):
+    if task.cancelled():
+        future.set_exception(concurrent.futures.CancelledError())
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
+
+
+def run_async(coroutine, timeout=DB_ASYNC_QUERY_TIMEOUT_SECONDS):
+    """
+    Runs a coroutine on the database event loop and waits for its result in the calling thread.
+    The task is created in a copy of the caller's context, so the coroutine sees the Flask request of the
+    calling thread.
+    """
+    loop = get_event_loop()
+    context = contextvars.copy_context()
+    future = concurrent.futures.Future()
+    tasks = []
+
+    def start():
+        if not future.set_running_or_notify_cancel():
+            coroutine.close()
+            return
+        # A task copies the context current when it is created
+        task = context.run(loop.create_task, coroutine)
+        tasks.append(task)
+        task.add_done_callback(functools.partial(_copy_outcome, future=future))
+
+    loop.call_soon_threadsafe(start)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        if not future.cancel():
+            loop.call_soon_threadsafe(lambda: [task.cancel() for task in tasks])
+        raise
+
+
+def async_view(view):
+    """
+    Turns an async def resource method into one Flask-RESTful can dispatch: the coroutine runs on the database
+    event loop and its queries share the loop and the async pool with those of every other async view.
+    Has to be applied below the sync decorators (authentication, error handlers), which then wrap it as usual.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        return run_async(view(*args, **kwargs))
+    return wrapper
@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+
+from sqlalchemy import exc, text
+
+from scripts.handler.error_handler import SQLAlchemyError
+from scripts.modules.mysql.db_session import engine
+
+# Schema changes shipped with the code, applied in file name order. Each file is prefixed with the number of the
+# change request that needs it, e.g. 013_image_variants.sql, and later changes to the same tables get their own
+# file with the same prefix, e.g. 012_asset_jobs_leases.sql after 012_asset_jobs.sql.
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+# Processes starting together wait this long for the one applying the migrations
+MIGRATION_LOCK_TIMEOUT_SECONDS = int(os.getenv('MIGRATION_LOCK_TIMEOUT_SECONDS', 300))
+# Deployments that apply the migrations as a separate step turn this off
+APPLY_MIGRATIONS_ON_START = os.getenv('APPLY_MIGRATIONS_ON_START', 'true').lower() in ('1', 'true', 'yes')
+
+CREATE_MIGRATION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schemaMigration (
+        migration_name VARCHAR(255) PRIMARY KEY,
+        migration_appliedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# MySQL errors meaning a statement's change is already in place: table exists, duplicate column, duplicate key.
+# Databases where the tables and columns were created at runtime by earlier versions migrate without failing.
+ALREADY_APPLIED_ERRORS = {1050, 1060, 1061}
+
+
+_initialised = False
+_init_lock = threading.Lock()
+
+
+def _statements(sql):
+    """
+    Splits a migration file into statements. Statements end with a semicolon at the end of a line and lines
+    starting with -- are comments.
+    """
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    statements = []
+    current = []
+    for line in lines:
+        current.append(line)
+        if line.rstrip().endswith(';'):
+            statements.append('\n'.join(current).rstrip()[:-1].strip())
+            current = []
+    if ''.join(current).strip():
+        statements.append('\n'.join(current).strip())
+    return [statement for statement in statements if statement]
+
+
+def _error_code(error):
+    args = getattr(error.orig, 'args', None)
+    return args[0] if args else None
+
+
+def apply_migrations():
+    """
+    Applies every migration in MIGRATIONS_DIR that this database has not seen yet. A named lock makes processes
+    started together apply them once.
+    Runs before the application serves requests, so no schema change waits on a request's transaction.
+
+    :return: Names of the migrations applied.
+    """
+    names = sorted(name for name in os.listdir(MIGRATIONS_DIR) if name.endswith('.sql'))
+    applied_now = []
+    # One connection throughout, since the named lock belongs to the connection that took it
+    with engine.connect() as connection:
+        locked = connection.execute(text("SELECT GET_LOCK('schema_migration', :p_timeout)"),
+                                    {'p_timeout': MIGRATION_LOCK_TIMEOUT_SECONDS}).scalar()
+        if not locked:
+            raise SQLAlchemyError("Timed out waiting for another process to apply the migrations")
+        try:
+            connection.execute(text(CREATE_MIGRATION_TABLE))
+            applied = {row[0] for row in connection.execute(text("SELECT migration_name FROM schemaMigration"))}
+            for name in names:
+                if name in applied:
+                    continue
+                with open(os.path.join(MIGRATIONS_DIR, name), encoding='utf-8') as migration:
+                    statements = _statements(migration.read())
+                for statement in statements:
+                    try:
+                        connection.execute(text(statement))
+                    except exc.DBAPIError as e:
+                        if _error_code(e) not in ALREADY_APPLIED_ERRORS:
+                            raise
+                        connection.rollback()
+                        logging.info(f"Migration {name}: change already in place, {e.orig}")
+                connection.execute(text("INSERT INTO schemaMigration (migration_name) VALUES (:p_name)"),
+                                   {'p_name': name})
+                connection.commit()
+                applied_now.append(name)
+                logging.info(f"Applied migration {name}")
+        except exc.SQLAlchemyError as e:
+            connection.rollback()
+            raise SQLAlchemyError(f"Database error occurred: {str(e)}")
+        finally:
+            connection.execute(text("SELECT RELEASE_LOCK('schema_migration')"))
+            connection.commit()
+    return applied_now
+
+
+def init_database():
+    """
+    Start-up hook: brings the schema up to date once per process. Importing the community resources calls it, so
+    the schema is current by the time the application registers them and starts serving requests.
+    Set APPLY_MIGRATIONS_ON_START=false to run the deploy step below instead.
+    """
+    global _initialised
+    with _init_lock:
+        if _initialised:
+            return
+        if APPLY_MIGRATIONS_ON_START:
+            apply_migrations()
+        _initialised = True
+
+
+if __name__ == '__main__':
+    # Deploy step: python -m scripts.modules.mysql.db_migrations
+    logging.basicConfig(level=logging.INFO)
+    print(apply_migrations())
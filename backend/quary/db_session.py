@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from scripts.setup.db_setup import engine as base_engine
+
+# Pool settings, overridable per deployment so workers can be sized against MySQL max_connections
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv('DB_POOL_RECYCLE_SECONDS', 1800))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv('DB_POOL_TIMEOUT_SECONDS', 10))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+# Part of DB_POOL_SIZE and DB_MAX_OVERFLOW given to the async read pool of db_async_session. The sync pool gets the
+# rest, so the two together never open more than DB_POOL_SIZE + DB_MAX_OVERFLOW connections per process.
+DB_ASYNC_POOL_SIZE = int(os.getenv('DB_ASYNC_POOL_SIZE', DB_POOL_SIZE // 2))
+DB_ASYNC_MAX_OVERFLOW = int(os.getenv('DB_ASYNC_MAX_OVERFLOW', DB_MAX_OVERFLOW // 2))
+if not 0 <= DB_ASYNC_POOL_SIZE < DB_POOL_SIZE or not 0 <= DB_ASYNC_MAX_OVERFLOW <= DB_MAX_OVERFLOW:
+    raise ValueError("DB_ASYNC_POOL_SIZE and DB_ASYNC_MAX_OVERFLOW must leave part of the pool to the sync engine")
+DB_SYNC_POOL_SIZE = DB_POOL_SIZE - DB_ASYNC_POOL_SIZE
+DB_SYNC_MAX_OVERFLOW = DB_MAX_OVERFLOW - DB_ASYNC_MAX_OVERFLOW
+
+
+class PoolMetrics:
+    """
+    Thread safe counters describing how the connection pool is used.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            self.total_wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def increment(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "totalWaitSeconds": round(self.total_wait_seconds, 6),
+                "averageWaitSeconds": round(self.total_wait_seconds / self.checkouts, 6) if self.checkouts else 0.0,
+                "maxWaitSeconds": round(self.max_wait_seconds, 6),
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long callers wait in connect() for a connection and how often the wait times out.
+    Everything else is counted by the pool events below.
+    """
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_metrics.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+
+# The engine of scripts.setup.db_setup is the one engine of the process; other modules keep using it directly, so
+# instead of opening a second pool next to it, its pool is replaced by one sized for this deployment. The new pool
+# gets the same connect function (with the engine's connect_args), dialect and event listeners, as
+# Pool.recreate() would pass them.
+engine = base_engine
+_base_pool = engine.pool
+engine.pool = InstrumentedQueuePool(
+    _base_pool._creator,
+    pool_size=DB_SYNC_POOL_SIZE,
+    max_overflow=DB_SYNC_MAX_OVERFLOW,
+    recycle=DB_POOL_RECYCLE_SECONDS,
+    timeout=DB_POOL_TIMEOUT_SECONDS,
+    pre_ping=DB_POOL_PRE_PING,
+    dialect=engine.dialect,
+    _dispatch=_base_pool.dispatch,
+)
+_base_pool.dispose()
+
+
+def instrument_pool(target, metrics):
+    """
+    Counts connects, checkouts, checkins and invalidations of the pool of an engine in metrics.
+    """
+    @event.listens_for(target, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        metrics.increment('connects')
+
+    @event.listens_for(target, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.increment('checkouts')
+
+    @event.listens_for(target, 'checkin')
+    def _on_checkin(dbapi_connection, connection_record):
+        metrics.increment('checkins')
+
+    @event.listens_for(target, 'invalidate')
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.increment('invalidations')
+
+
+instrument_pool(engine, pool_metrics)
+
+# Live stats of the other pools counted in DB_POOL_SIZE, registered by the modules that create them
+pool_stats_providers = {}
+
+
+# The one session factory every query module uses, so all of them share the pool above with the rest of the app
+Session = sessionmaker(bind=engine)
+
+
+def get_pool_stats():
+    """
+    Returns live pool usage together with the cumulative counters, and those of the registered other pools.
+    """
+    pool = engine.pool
+    stats = {
+        "poolSize": pool.size(),
+        "maxOverflow": DB_SYNC_MAX_OVERFLOW,
+        "checkedOut": pool.checkedout(),
+        "checkedIn": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "timeoutSeconds": DB_POOL_TIMEOUT_SECONDS,
+        "recycleSeconds": DB_POOL_RECYCLE_SECONDS,
+        "prePing": DB_POOL_PRE_PING,
+    }
+    stats.update(pool_metrics.snapshot())
+    for name, provider in pool_stats_providers.items():
+        stats[name] = provider()
+    return stats
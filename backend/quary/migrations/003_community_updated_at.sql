@@ -0,0 +1,4 @@
+-- When each community row last changed. Every process reads the rows changed since its last look into its
+-- in-memory search and nearby indexes, so writes handled by other processes reach them.
+ALTER TABLE community ADD COLUMN community_updatedAt DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3);
+ALTER TABLE community ADD INDEX idx_community_updatedAt (community_updatedAt);
@@ -0,0 +1,18 @@
+-- Persisted state of every background asset upload, so retries and failures survive a worker restart
+CREATE TABLE IF NOT EXISTS communityAssetJob (
+    assetJob_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    assetJob_entityType VARCHAR(16) NOT NULL,
+    assetJob_entityId BIGINT NOT NULL,
+    assetJob_communityId BIGINT NOT NULL,
+    assetJob_assetName VARCHAR(16) NOT NULL,
+    assetJob_bucketFilename VARCHAR(255) NOT NULL,
+    assetJob_stagingPath VARCHAR(512) NOT NULL,
+    assetJob_status VARCHAR(16) NOT NULL DEFAULT 'pending',
+    assetJob_attempts INT NOT NULL DEFAULT 0,
+    assetJob_lastError TEXT NULL,
+    assetJob_url VARCHAR(1024) NULL,
+    assetJob_createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    assetJob_updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_assetJob_entity (assetJob_entityType, assetJob_entityId),
+    INDEX idx_assetJob_status (assetJob_status)
+);
@@ -0,0 +1,5 @@
+-- Worker holding a running asset job and when its lease runs out. A job whose lease expired, e.g. because the
+-- worker process died, can be claimed by any other worker.
+ALTER TABLE communityAssetJob ADD COLUMN assetJob_owner VARCHAR(128) NULL;
+ALTER TABLE communityAssetJob ADD COLUMN assetJob_leaseExpiresAt DATETIME NULL;
+ALTER TABLE communityAssetJob ADD INDEX idx_assetJob_lease (assetJob_status, assetJob_leaseExpiresAt);
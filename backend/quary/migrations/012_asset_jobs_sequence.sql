@@ -0,0 +1,3 @@
+-- Jobs of one asset are ordered by their ID, which is assigned when the upload is made; the lookup of the later
+-- jobs of an asset, made before a job assigns its image, reads this index
+ALTER TABLE communityAssetJob ADD INDEX idx_assetJob_asset (assetJob_entityType, assetJob_entityId, assetJob_assetName, assetJob_id);
@@ -0,0 +1,4 @@
+-- Image variant URLs ({variant: URL}) next to each stored image
+ALTER TABLE community ADD COLUMN community_imageVariants JSON NULL;
+ALTER TABLE community ADD COLUMN community_bannerVariants JSON NULL;
+ALTER TABLE communityPost ADD COLUMN communityPost_imageVariants JSON NULL;
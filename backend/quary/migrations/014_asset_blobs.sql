@@ -0,0 +1,23 @@
+-- Every distinct image is stored once, keyed by the SHA-256 of the uploaded bytes.
+-- refCount is the number of assetRef rows pointing at the blob; blobs at zero are left for garbage collection.
+CREATE TABLE IF NOT EXISTS assetBlob (
+    assetBlob_hash CHAR(64) PRIMARY KEY,
+    assetBlob_url VARCHAR(1024) NOT NULL,
+    assetBlob_variants JSON NOT NULL,
+    assetBlob_refCount INT NOT NULL DEFAULT 0,
+    assetBlob_createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    assetBlob_updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_assetBlob_refCount (assetBlob_refCount)
+);
+
+-- Which blob each community logo, banner and post image currently uses
+CREATE TABLE IF NOT EXISTS assetRef (
+    assetRef_entityType VARCHAR(16) NOT NULL,
+    assetRef_entityId BIGINT NOT NULL,
+    assetRef_assetName VARCHAR(16) NOT NULL,
+    assetRef_communityId BIGINT NOT NULL,
+    assetRef_hash CHAR(64) NOT NULL,
+    PRIMARY KEY (assetRef_entityType, assetRef_entityId, assetRef_assetName),
+    INDEX idx_assetRef_community (assetRef_communityId),
+    INDEX idx_assetRef_hash (assetRef_hash)
+);
@@ -0,0 +1,19 @@
+-- Resumable upload sessions. receivedBytes is the offset the client continues from after a dropped connection.
+CREATE TABLE IF NOT EXISTS assetUpload (
+    assetUpload_id CHAR(32) PRIMARY KEY,
+    assetUpload_userId VARCHAR(128) NOT NULL,
+    assetUpload_entityType VARCHAR(16) NOT NULL,
+    assetUpload_entityId BIGINT NOT NULL,
+    assetUpload_communityId BIGINT NOT NULL,
+    assetUpload_assetName VARCHAR(16) NOT NULL,
+    assetUpload_filename VARCHAR(255) NULL,
+    assetUpload_contentType VARCHAR(128) NULL,
+    assetUpload_stagingPath VARCHAR(512) NOT NULL,
+    assetUpload_totalBytes BIGINT NOT NULL,
+    assetUpload_receivedBytes BIGINT NOT NULL DEFAULT 0,
+    assetUpload_status VARCHAR(16) NOT NULL DEFAULT 'receiving',
+    assetUpload_jobId BIGINT NULL,
+    assetUpload_createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    assetUpload_updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_assetUpload_status (assetUpload_status, assetUpload_updatedAt)
+);
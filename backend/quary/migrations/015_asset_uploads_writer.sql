@@ -0,0 +1,4 @@
+-- Request currently writing a chunk of the upload and when its claim runs out. The staged file is only written
+-- by the request holding the claim, so two requests sending the same chunk never write it at once.
+ALTER TABLE assetUpload ADD COLUMN assetUpload_writer CHAR(32) NULL;
+ALTER TABLE assetUpload ADD COLUMN assetUpload_writeLeaseExpiresAt DATETIME NULL;
@@ -0,0 +1,17 @@
+-- Storage cleanup left behind by a deleted community. The keys are recorded up front, because the posts they
+-- are derived from are gone once the community row has been deleted; processedKeys lets a restart resume.
+CREATE TABLE IF NOT EXISTS assetCleanupJob (
+    cleanupJob_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    cleanupJob_communityId BIGINT NOT NULL,
+    cleanupJob_status VARCHAR(16) NOT NULL DEFAULT 'pending',
+    cleanupJob_keys JSON NOT NULL,
+    cleanupJob_totalKeys INT NOT NULL,
+    cleanupJob_processedKeys INT NOT NULL DEFAULT 0,
+    cleanupJob_deletedObjects INT NOT NULL DEFAULT 0,
+    cleanupJob_failedObjects INT NOT NULL DEFAULT 0,
+    cleanupJob_lastError TEXT NULL,
+    cleanupJob_createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    cleanupJob_updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_cleanupJob_community (cleanupJob_communityId),
+    INDEX idx_cleanupJob_status (cleanupJob_status)
+);
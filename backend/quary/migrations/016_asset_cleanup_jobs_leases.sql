@@ -0,0 +1,5 @@
+-- Process running a cleanup job and when its lease runs out. A job is only run by the process holding it; one
+-- whose lease expired, e.g. because the process died, can be claimed by any other process.
+ALTER TABLE assetCleanupJob ADD COLUMN cleanupJob_owner VARCHAR(128) NULL;
+ALTER TABLE assetCleanupJob ADD COLUMN cleanupJob_leaseExpiresAt DATETIME NULL;
+ALTER TABLE assetCleanupJob ADD INDEX idx_cleanupJob_lease (cleanupJob_status, cleanupJob_leaseExpiresAt);
@@ -0,0 +1,17 @@
+-- Copies of stored objects still owed to a secondary storage backend. The bytes wait in a spool file, so
+-- replication does not depend on reading the object back from the primary.
+CREATE TABLE IF NOT EXISTS assetReplication (
+    replication_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    replication_target VARCHAR(32) NOT NULL,
+    replication_source VARCHAR(32) NOT NULL,
+    replication_key VARCHAR(512) NOT NULL,
+    replication_spoolPath VARCHAR(512) NULL,
+    replication_contentType VARCHAR(128) NULL,
+    replication_status VARCHAR(16) NOT NULL DEFAULT 'pending',
+    replication_attempts INT NOT NULL DEFAULT 0,
+    replication_lastError TEXT NULL,
+    replication_createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    replication_updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_replication_status (replication_status, replication_updatedAt),
+    INDEX idx_replication_key (replication_key(191))
+);
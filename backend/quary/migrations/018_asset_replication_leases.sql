@@ -0,0 +1,5 @@
+-- Worker copying a replication and when its lease runs out. A replication whose lease expired, e.g. because the
+-- worker process died, can be claimed by any other worker.
+ALTER TABLE assetReplication ADD COLUMN replication_owner VARCHAR(128) NULL;
+ALTER TABLE assetReplication ADD COLUMN replication_leaseExpiresAt DATETIME NULL;
+ALTER TABLE assetReplication ADD INDEX idx_replication_lease (replication_status, replication_leaseExpiresAt);
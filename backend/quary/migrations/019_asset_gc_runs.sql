@@ -0,0 +1,10 @@
+-- Runs of the orphaned asset garbage collector, with the report of what they found and reclaimed
+CREATE TABLE IF NOT EXISTS assetGcRun (
+    gcRun_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    gcRun_dryRun BOOLEAN NOT NULL,
+    gcRun_status VARCHAR(16) NOT NULL DEFAULT 'running',
+    gcRun_report JSON NULL,
+    gcRun_lastError TEXT NULL,
+    gcRun_createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    gcRun_updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
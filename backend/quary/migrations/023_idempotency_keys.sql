@@ -0,0 +1,12 @@
+-- Responses of requests sent with an Idempotency-Key, so a retried request is answered without running again.
+-- Rows expire after a day and are purged in small batches.
+CREATE TABLE IF NOT EXISTS idempotencyKey (
+    idempotency_key CHAR(64) PRIMARY KEY,
+    idempotency_fingerprint CHAR(64) NOT NULL,
+    idempotency_status VARCHAR(16) NOT NULL DEFAULT 'processing',
+    idempotency_responseStatus INT NULL,
+    idempotency_responseBody MEDIUMTEXT NULL,
+    idempotency_createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    idempotency_expiresAt DATETIME NOT NULL,
+    INDEX idx_idempotency_expiresAt (idempotency_expiresAt)
+);
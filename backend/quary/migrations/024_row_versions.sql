@@ -0,0 +1,5 @@
+-- Row versions for optimistic concurrency. Every write to a community or post increments its version, so a
+-- client sending back the version it edited is refused once anyone else has written the row, even if the values
+-- were changed back since.
+ALTER TABLE community ADD COLUMN community_version INT UNSIGNED NOT NULL DEFAULT 1;
+ALTER TABLE communityPost ADD COLUMN communityPost_version INT UNSIGNED NOT NULL DEFAULT 1;
@@ -0,0 +1,29 @@
+-- Runs of the community counter reconcile pass, with the report of what they checked and corrected
+CREATE TABLE IF NOT EXISTS counterReconcileRun (
+    counterRun_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    counterRun_status VARCHAR(16) NOT NULL DEFAULT 'running',
+    counterRun_report JSON NULL,
+    counterRun_lastError TEXT NULL,
+    counterRun_createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    counterRun_updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Member and visible post counts kept on the community row, so reads do not aggregate them
+ALTER TABLE community ADD COLUMN community_memberCount INT UNSIGNED NOT NULL DEFAULT 0;
+ALTER TABLE community ADD COLUMN community_postCount INT UNSIGNED NOT NULL DEFAULT 0;
+
+-- Fills the counters in once; writes keep them current from here on
+UPDATE community c
+LEFT JOIN (
+    SELECT communityUser_communityId AS community_id, COUNT(*) AS members
+    FROM communityUser
+    GROUP BY communityUser_communityId
+) m ON m.community_id = c.community_id
+LEFT JOIN (
+    SELECT communityPost_communityId AS community_id, COUNT(*) AS posts
+    FROM communityPost
+    WHERE communityPost_isHidden = 0
+    GROUP BY communityPost_communityId
+) p ON p.community_id = c.community_id
+SET c.community_memberCount = COALESCE(m.members, 0),
+    c.community_postCount = COALESCE(p.posts, 0);
@@ -0,0 +1,9 @@
+-- The first fill counted pending join requests and invites as members; counts only owners, moderators and members
+UPDATE community c
+LEFT JOIN (
+    SELECT communityUser_communityId AS community_id, COUNT(*) AS members
+    FROM communityUser
+    WHERE communityUser_role IN (1, 2, 3)
+    GROUP BY communityUser_communityId
+) m ON m.community_id = c.community_id
+SET c.community_memberCount = COALESCE(m.members, 0);
@@ -0,0 +1,6 @@
+from scripts.modules.mysql.db_migrations import init_database
+
+# The community resources, their queries and their background workers expect the schema in quary/migrations.
+# The application imports this package to register the resources, so the schema is brought up to date before
+# the first request is served.
+init_database()
@@ -0,0 +1,90 @@
+from flask import request
+from flask_restful import Resource, reqparse
+
+from scripts.handler.error_handler import catch_unexpected_error, catch_sql_errors, authenticate_firebase_id_token
+from scripts.management.Community.community_async_managenment import async_community_manage_get_community_by_id, \
+    async_community_manage_get_all_communities, async_community_manage_get_community_users, \
+    async_manage_get_community_posts, async_manage_get_community_invitations, async_manage_get_community_requests, \
+    async_community_manage_get_community_page
+from scripts.modules.mysql.db_async_session import async_view
+
+
+def parse_page_args(*extra):
+    parser = reqparse.RequestParser()
+    parser.add_argument('limit', type=int, location='args', required=False)
+    parser.add_argument('after', type=str, location='args', required=False)
+    for name, options in extra:
+        parser.add_argument(name, location='args', required=False, **options)
+    return parser.parse_args()
+
+
+class AsyncCommunity(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    @async_view
+    async def get(self, community_id=None):
+        if community_id:
+            return await async_community_manage_get_community_by_id(community_id)
+        return await async_community_manage_get_all_communities(request.current_user)
+
+
+class AsyncCommunityUsers(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    @async_view
+    async def get(self, community_id):
+        if not community_id:
+            return {"message": "Community ID is required."}, 400
+
+        args = parse_page_args(('role', {'type': str, 'action': 'append',
+                                         'choices': ('owner', 'moderator', 'member')}),
+                               ('q', {'type': str}))
+        paginate = args['limit'] is not None or bool(args['after'] or args['role'] or args['q'])
+        return await async_community_manage_get_community_users(community_id, args['limit'], args['after'],
+                                                                args['role'], args['q'], paginate)
+
+
+class AsyncCommunityPosts(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    @async_view
+    async def get(self, community_id):
+        args = parse_page_args()
+        paginate = args['limit'] is not None or bool(args['after'])
+        return await async_manage_get_community_posts(community_id, args['limit'], args['after'], paginate)
+
+
+class AsyncCommunityInvites(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    @async_view
+    async def get(self, user_id=None):
+        return await async_manage_get_community_invitations(user_id or request.current_user)
+
+
+class AsyncCommunityRequests(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    @async_view
+    async def get(self, community_id):
+        return await async_manage_get_community_requests(community_id)
+
+
+class AsyncCommunityPage(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    @async_view
+    async def get(self, community_id):
+        parser = reqparse.RequestParser()
+        parser.add_argument('posts_limit', type=int, location='args', required=False)
+        parser.add_argument('members_limit', type=int, location='args', required=False)
+        args = parser.parse_args()
+
+        return await async_community_manage_get_community_page(community_id, args['posts_limit'],
+                                                               args['members_limit'])
@@ -2,13 +2,35 @@ import logging
 
 import werkzeug
 from flask import request, jsonify
-from flask_restful import Resource, reqparse
+from flask_restful import Resource, reqparse, inputs
 from scripts.handler.error_handler import catch_unexpected_error, catch_sql_errors, authenticate_firebase_id_token, \
     cache_decorator
 from scripts.management.Community.community_managenment import community_manage_get_all_communities, \
     community_manage_create_community, community_manage_get_community_by_id, community_manage_update_community, \
     community_manage_delete_community, community_manage_add_banner, community_manage_update_banner, \
-    community_manage_get_communities_by_user_id, community_manage_get_all_community_users
+    community_manage_get_communities_by_user_id, community_manage_get_all_community_users, \
+    community_manage_stream_all_communities, community_manage_stream_all_community_users, \
+    community_manage_search_communities, community_manage_get_nearby_communities, community_manage_get_cache_stats, \
+    community_manage_get_community_page, community_manage_get_communities_by_ids, \
+    community_manage_get_community_users_page, community_manage_get_pool_stats
+from scripts.management.Community.community_asset_cleanup import manage_get_cleanup_status
+from scripts.management.Community.community_asset_gc import manage_start_asset_gc, manage_get_asset_gc_runs
+from scripts.management.Community.community_asset_jobs import manage_get_asset_status
+from scripts.management.Community.community_counters import manage_get_counter_runs, manage_reconcile_counters
+from scripts.management.Community.community_admin import require_admin
+from scripts.management.Community.community_idempotency import idempotent
+from scripts.management.Community.community_image_urls import manage_resolve_image_urls
+from scripts.management.Community.community_storage_replication import manage_get_replication_status, \
+    manage_reconcile_replication
+
+
+def parse_stream_flag():
+    """
+    Reads the optional ?stream=true query argument used by the list endpoints.
+    """
+    parser = reqparse.RequestParser()
+    parser.add_argument('stream', type=inputs.boolean, location='args', required=False, default=False)
+    return parser.parse_args()['stream']
 
 
 class CommunityUser(Resource):
@@ -32,12 +54,15 @@ class Community(Resource):
 
         if community_id:
             return community_manage_get_community_by_id(community_id)
+        elif parse_stream_flag():
+            return community_manage_stream_all_communities(request.current_user)
         else:
             return community_manage_get_all_communities(request.current_user)
 
     @catch_unexpected_error
     @catch_sql_errors
     @authenticate_firebase_id_token
+    @idempotent('community.create')
     def post(self):
         parser = reqparse.RequestParser()
         parser.add_argument('name', type=str, location='form', required=True, help='Name cannot be blank')
@@ -82,8 +107,11 @@ class Community(Resource):
         parser.add_argument('latitude', type=float, location='form', required=False)
         parser.add_argument('is_private', type=bool, location='form', required=False)
         parser.add_argument('is_closed', type=bool, location='form', required=False)
+        parser.add_argument('version', type=str, location='form', required=False)
         args = parser.parse_args()
 
+        # The version the client edited, from the form or an If-Match header, enables the conflict check
+        expected_version = args.pop('version') or request.headers.get('If-Match', '').strip('"') or None
         updates = {key: value for key, value in args.items() if value is not None}
         logging.debug(f"Updates to be applied: {updates}")
 
@@ -91,7 +119,7 @@ class Community(Resource):
             logging.error("No updates provided")
             return {"message": "No updates provided"}, 400  # Add this return to stop further processing
 
-        return community_manage_update_community(community_id, updates)
+        return community_manage_update_community(community_id, updates, expected_version)
 
     @catch_unexpected_error
     @catch_sql_errors
@@ -103,6 +131,188 @@ class Community(Resource):
         return community_manage_delete_community(community_id, request.current_user)
 
 
+class CommunityPage(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    def get(self, community_id):
+        if not community_id:
+            return {"message": "Community ID is required."}, 400
+
+        parser = reqparse.RequestParser()
+        parser.add_argument('posts_limit', type=int, location='args', required=False)
+        parser.add_argument('members_limit', type=int, location='args', required=False)
+        args = parser.parse_args()
+
+        return community_manage_get_community_page(community_id, args['posts_limit'], args['members_limit'])
+
+
+class CommunityAssetStatus(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    def get(self, community_id):
+        if not community_id:
+            return {"message": "Community ID is required."}, 400
+
+        return manage_get_asset_status(request.current_user, 'community', community_id, community_id)
+
+
+class CommunityCleanupStatus(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    def get(self, community_id):
+        if not community_id:
+            return {"message": "Community ID is required."}, 400
+
+        return manage_get_cleanup_status(community_id)
+
+
+class CommunityBatch(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    def post(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('ids', type=int, action='append', location='json', required=True,
+                            help='ids must be a list of community IDs')
+        args = parser.parse_args()
+
+        return community_manage_get_communities_by_ids(args['ids'])
+
+
+class CommunityImageUrls(Resource):
+    @catch_unexpected_error
+    @authenticate_firebase_id_token
+    def post(self):
+        """
+        Resolves the storage paths of member avatars and post images to download URLs in one round trip.
+        """
+        parser = reqparse.RequestParser()
+        parser.add_argument('paths', type=str, action='append', location='json', required=True,
+                            help='paths must be a list of storage paths')
+        args = parser.parse_args()
+
+        return manage_resolve_image_urls(request.current_user, args['paths'])
+
+
+class CommunitySearch(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    def get(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('q', type=str, location='args', required=True, help='Search text cannot be blank')
+        parser.add_argument('limit', type=int, location='args', required=False)
+        parser.add_argument('after', type=str, location='args', required=False)
+        args = parser.parse_args()
+
+        return community_manage_search_communities(request.current_user, args['q'], args['limit'], args['after'])
+
+
+class CommunityNearby(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    def get(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('latitude', type=float, location='args', required=True, help='Latitude cannot be blank')
+        parser.add_argument('longitude', type=float, location='args', required=True, help='Longitude cannot be blank')
+        parser.add_argument('radius_km', type=float, location='args', required=False)
+        parser.add_argument('limit', type=int, location='args', required=False)
+        parser.add_argument('after', type=str, location='args', required=False)
+        args = parser.parse_args()
+
+        return community_manage_get_nearby_communities(request.current_user, args['latitude'], args['longitude'],
+                                                       args['radius_km'], args['limit'], args['after'])
+
+
+class CommunityCacheStats(Resource):
+    @catch_unexpected_error
+    @authenticate_firebase_id_token
+    @require_admin
+    def get(self):
+        return community_manage_get_cache_stats()
+
+
+class DatabasePoolStats(Resource):
+    @catch_unexpected_error
+    @authenticate_firebase_id_token
+    @require_admin
+    def get(self):
+        return community_manage_get_pool_stats()
+
+
+class StorageReplication(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    @require_admin
+    def get(self):
+        return manage_get_replication_status()
+
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    @require_admin
+    def post(self):
+        """
+        Runs the replication reconcile pass immediately.
+        """
+        return manage_reconcile_replication()
+
+
+class CommunityCounters(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    @require_admin
+    def get(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('run_id', type=int, location='args', required=False)
+        args = parser.parse_args()
+
+        return manage_get_counter_runs(args['run_id'])
+
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    @require_admin
+    def post(self):
+        """
+        Starts recounting the members and posts of every community and correcting the counters that drifted.
+        """
+        return manage_reconcile_counters()
+
+
+class StorageGarbageCollection(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    @require_admin
+    def get(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('run_id', type=int, location='args', required=False)
+        args = parser.parse_args()
+
+        return manage_get_asset_gc_runs(args['run_id'])
+
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    @require_admin
+    def post(self):
+        """
+        Starts a collection of orphaned stored objects; a dry run, which only reports, unless dry_run is false.
+        """
+        parser = reqparse.RequestParser()
+        parser.add_argument('dry_run', type=inputs.boolean, location='json', required=False, default=True)
+        args = parser.parse_args()
+
+        return manage_start_asset_gc(args['dry_run'])
+
+
 class CommunityUsers(Resource):
     @catch_unexpected_error
     @catch_sql_errors
@@ -111,6 +321,21 @@ class CommunityUsers(Resource):
         if not community_id:
             return jsonify({"message": "Community ID is required."}), 400
 
+        parser = reqparse.RequestParser()
+        parser.add_argument('limit', type=int, location='args', required=False)
+        parser.add_argument('after', type=str, location='args', required=False)
+        parser.add_argument('role', type=str, action='append', location='args', required=False,
+                            choices=('owner', 'moderator', 'member'), help='Role must be owner, moderator or member')
+        parser.add_argument('q', type=str, location='args', required=False)
+        args = parser.parse_args()
+
+        if args['limit'] is not None or args['after'] or args['role'] or args['q']:
+            return community_manage_get_community_users_page(community_id, args['limit'], args['after'],
+                                                             args['role'], args['q'])
+
+        if parse_stream_flag():
+            return community_manage_stream_all_community_users(community_id)
+
         return community_manage_get_all_community_users(community_id)
 
 
@@ -0,0 +1,46 @@
+from flask import request
+from flask_restful import Resource, reqparse
+
+from scripts.handler.error_handler import catch_unexpected_error, catch_sql_errors, authenticate_firebase_id_token
+from scripts.management.Community.community_resumable_uploads import manage_create_upload, manage_get_upload, \
+    manage_append_upload_chunk
+
+
+class CommunityUploads(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    def post(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('entity_type', type=str, location='json', required=True, choices=('community', 'post'),
+                            help='entity_type must be community or post')
+        parser.add_argument('entity_id', type=int, location='json', required=True, help='entity_id cannot be blank')
+        parser.add_argument('asset', type=str, location='json', required=True, choices=('logo', 'banner', 'image'),
+                            help='asset must be logo, banner or image')
+        parser.add_argument('size', type=int, location='json', required=True, help='size cannot be blank')
+        parser.add_argument('filename', type=str, location='json', required=False)
+        parser.add_argument('content_type', type=str, location='json', required=False)
+        args = parser.parse_args()
+
+        return manage_create_upload(request.current_user, args['entity_type'], args['entity_id'], args['asset'],
+                                    args['size'], args['filename'], args['content_type'])
+
+
+class CommunityUpload(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    def get(self, upload_id):
+        return manage_get_upload(request.current_user, upload_id)
+
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    def put(self, upload_id):
+        parser = reqparse.RequestParser()
+        parser.add_argument('offset', type=int, location='args', required=True, help='offset cannot be blank')
+        args = parser.parse_args()
+
+        # The body is the raw chunk; it is read from the stream in blocks and never buffered whole
+        return manage_append_upload_chunk(request.current_user, upload_id, args['offset'], request.stream,
+                                          request.content_length)
@@ -8,7 +8,8 @@ from scripts.management.Community.member.community_member_managenment import man
     manage_deny_community_invite, manage_send_community_invite, \
     manage_get_community_request_by_id, manage_accept_community_invite, manage_add_community_user, \
     manage_remove_user_from_community, manage_leave_community, manage_community_promote_moderator, \
-    manage_community_demote_moderator, manage_community_change_owner, manage_get_community_invitations
+    manage_community_demote_moderator, manage_community_change_owner, manage_get_community_invitations, \
+    manage_send_community_invites, manage_resolve_community_requests, manage_moderate_community_members
 
 
 class CommunityRequests(Resource):
@@ -40,6 +41,25 @@ class CommunityRequests(Resource):
         return manage_deny_community_request(user_id, community_id)
 
 
+class CommunityBulkRequests(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    def post(self, community_id):
+        """
+        Accepts or denies the join requests of every user in the list in one transaction.
+        """
+        parser = reqparse.RequestParser()
+        parser.add_argument('user_ids', type=str, action='append', location='json', required=True,
+                            help='user_ids must be a list of user IDs')
+        parser.add_argument('action', type=str, location='json', required=True, choices=('accept', 'deny'),
+                            help='action must be accept or deny')
+        args = parser.parse_args()
+
+        return manage_resolve_community_requests(request.current_user, community_id, args['user_ids'],
+                                                 args['action'] == 'accept')
+
+
 class CommunityInvites(Resource):
     @catch_unexpected_error
     @catch_sql_errors
@@ -69,6 +89,22 @@ class CommunityInvites(Resource):
         return manage_deny_community_invite(request.current_user, community_id)
 
 
+class CommunityBulkInvites(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    def post(self, community_id):
+        """
+        Invites every user in the list in one transaction and reports the outcome per user.
+        """
+        parser = reqparse.RequestParser()
+        parser.add_argument('user_ids', type=str, action='append', location='json', required=True,
+                            help='user_ids must be a list of user IDs')
+        args = parser.parse_args()
+
+        return manage_send_community_invites(request.current_user, community_id, args['user_ids'])
+
+
 class CommunityMembershipResource(Resource):
     @catch_unexpected_error
     @catch_sql_errors
@@ -91,6 +127,20 @@ class CommunityMembershipResource(Resource):
     def delete(self, community_id, user_id=None):
         return manage_remove_user_from_community(request.current_user, user_id, community_id)
 
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    def patch(self, community_id):
+        """
+        Applies a list of {"user_id", "action"} changes, where action is remove, promote or demote.
+        """
+        parser = reqparse.RequestParser()
+        parser.add_argument('changes', type=dict, action='append', location='json', required=True,
+                            help='changes must be a list of user_id and action pairs')
+        args = parser.parse_args()
+
+        return manage_moderate_community_members(request.current_user, community_id, args['changes'])
+
 
 class CommunityMembershipRole(Resource):
     @catch_unexpected_error
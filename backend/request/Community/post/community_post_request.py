@@ -7,7 +7,10 @@ from flask_restful import Resource, reqparse
 from scripts.handler.error_handler import catch_unexpected_error, catch_sql_errors, authenticate_firebase_id_token
 from scripts.management.Community.post.community_post_managenment import manage_get_community_post_by_id, \
     manage_get_all_community_user_posts, manage_get_all_community_posts, manage_create_community_post, \
-    manage_update_community_post, manage_delete_community_post, manage_hide_community_post, manage_show_community_post
+    manage_update_community_post, manage_delete_community_post, manage_hide_community_post, manage_show_community_post, \
+    manage_get_community_posts_page, manage_get_community_posts_by_ids
+from scripts.management.Community.community_asset_jobs import manage_get_post_asset_status
+from scripts.management.Community.community_idempotency import idempotent
 
 
 class CommunityPostsResource(Resource):
@@ -18,9 +21,18 @@ class CommunityPostsResource(Resource):
         if user_id:
             # Fetch all posts for a user across communities
             return manage_get_all_community_user_posts(user_id)
-        else:
-            # Fetch all posts within a community
-            return manage_get_all_community_posts(community_id)
+
+        parser = reqparse.RequestParser()
+        parser.add_argument('limit', type=int, location='args', required=False)
+        parser.add_argument('after', type=str, location='args', required=False)
+        args = parser.parse_args()
+
+        if args['limit'] is not None or args['after']:
+            # Fetch one keyset page of posts within a community
+            return manage_get_community_posts_page(community_id, args['limit'], args['after'])
+
+        # Fetch all posts within a community
+        return manage_get_all_community_posts(community_id)
 
     @catch_unexpected_error
     @catch_sql_errors
@@ -34,6 +46,27 @@ class CommunityPostsResource(Resource):
             return {"message": "Invalid action"}, 400
 
 
+class CommunityPostBatchResource(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    def post(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('ids', type=int, action='append', location='json', required=True,
+                            help='ids must be a list of post IDs')
+        args = parser.parse_args()
+
+        return manage_get_community_posts_by_ids(args['ids'])
+
+
+class CommunityPostAssetStatusResource(Resource):
+    @catch_unexpected_error
+    @catch_sql_errors
+    @authenticate_firebase_id_token
+    def get(self, post_id):
+        return manage_get_post_asset_status(request.current_user, post_id)
+
+
 class CommunityPostResource(Resource):
     @catch_unexpected_error
     @catch_sql_errors
@@ -45,6 +78,7 @@ class CommunityPostResource(Resource):
     @catch_unexpected_error
     @catch_sql_errors
     @authenticate_firebase_id_token
+    @idempotent('community_post.create')
     def post(self, community_id=None):
         parser = reqparse.RequestParser()
         parser.add_argument('description', type=str, location='form', required=True, help='Description cannot be blank')
@@ -61,9 +95,11 @@ class CommunityPostResource(Resource):
         parser = reqparse.RequestParser()
         parser.add_argument('description', help='Description of the post.')
         parser.add_argument('image_path', help='New image path for the post.')
+        parser.add_argument('version', help='Version of the post the update was made against.')
         args = parser.parse_args()
+        expected_version = args.pop('version') or request.headers.get('If-Match', '').strip('"') or None
         updates = {key: value for key, value in args.items() if value is not None}
-        return manage_update_community_post(community_id, post_id, updates)
+        return manage_update_community_post(community_id, post_id, updates, expected_version)
 
     @catch_unexpected_error
     @catch_sql_errors